@@ -1,6 +1,6 @@
 from paatr.factory import create_app
 from fastapi import WebSocket
-from paatr import logger, BUILD_LOGS_TABLE
+from paatr import logger
 
 app = create_app()
 
@@ -23,8 +23,3 @@ app = create_app()
 #             break
 
 #     logger.info("Closing websocket connection for app %s", app_id)
-
-
-@app.on_event("shutdown")
-def shutdown_event():
-    BUILD_LOGS_TABLE.close()
\ No newline at end of file
@@ -1,9 +1,8 @@
 import logging
 import os
+import re
 
-import docker
 from dotenv import dotenv_values
-from sqlitedict import SqliteDict
 from supabase import create_client
 
 from .config import Config
@@ -11,7 +10,7 @@ from .config import Config
 # Supabase setup
 supabase = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
 
-for dir in [Config.APP_FILES_DIR, Config.LOGS_DIR]:
+for dir in [Config.APP_FILES_DIR, Config.LOGS_DIR, Config.STATE_DIR, Config.LOCKS_DIR]:
     if not os.path.exists(dir):
         os.makedirs(dir)
 
@@ -19,11 +18,24 @@ for dir in [Config.APP_FILES_DIR, Config.LOGS_DIR]:
 logging.config.fileConfig(Config.LOG_CONFIG_FILE, disable_existing_loggers=False)
 logger = logging.getLogger(__name__)  
 
-BUILD_LOGS_TABLE = SqliteDict(Config.APPS_LOGS, tablename="build_logs", autocommit=True)
-NEW_DB_CONN = lambda: SqliteDict(Config.APPS_LOGS, tablename="build_logs", autocommit=True)
-
-# Docker setup
-DOCKER_CLIENT = docker.from_env()
+# Shared state tables (see `paatr.coordination`)
+BUILD_LOGS_TABLE = "build_logs"
+BUILD_QUEUE_TABLE = "build_queue"
+BUILD_ARCHIVE_TABLE = "build_archive"
+HIBERNATION_TABLE = "hibernation"
+SCALE_TABLE = "scale"
+PLACEMENTS_TABLE = "placements"
+SUPERVISOR_TABLE = "supervisor"
+EXPECTED_STOPS_TABLE = "expected_stops"
+WARMUP_TABLE = "warmup"
+GC_TABLE = "gc"
+VERSIONS_TABLE = "versions"
+BULK_JOBS_TABLE = "bulk_jobs"
+STATS_TABLE = "stats"
+HEALTH_TABLE = "health"
+BUILD_CANCELS_TABLE = "build_cancels"
+JOBS_TABLE = "jobs"
+PORTS_TABLE = "ports"
 
 APP_CONFIG_FILE = "paatr.yaml"
 INSTALLATION_FILE = "requirements.txt"
@@ -32,16 +44,10 @@ DEFAULT_PORT = 80
 # Add python versions
 PYTHON_VERSION_DOCKER_MAPS = {}
 
-CONFIG_KEYS_X = ["runtime", "web"]
-CONFIG_KEYS = CONFIG_KEYS_X + ["env"]
+# The keys of `paatr.yaml` are described in `paatr.schema`
 
-CONFIG_VALUE_VALIDATOR = {
-    "runtime": lambda x: type(x) == str,
-    "run": lambda x: type(x) == str or type(x) == list,
-    "port": lambda x: type(x) == int,
-    "web": lambda x: type(x) == str,
-    "env": lambda x: type(x) == dict
-}
+# e.g 512m, 1g, 1.5G or a number of bytes
+MEMORY_REGEX = re.compile(r"^(\d+(?:\.\d+)?)\s*([kmg]?)b?$", re.IGNORECASE)
 
 PYTHON_RUNTIMES = {
     "python3.7": "python:3.7-alpine3.15",
@@ -50,11 +56,15 @@ PYTHON_RUNTIMES = {
     "python3.10": "python:3.10-alpine3.15"
 }
 
+# Resource limits of each container when `paatr.yaml` doesn't set them
+DEFAULT_RESOURCES = {"cpu": 0.5, "memory": "256m", "pids": 256}
+
 DOCKER_TEMPLATE = """
 FROM {runtime}
 WORKDIR /app
 COPY ./{app_name} .
 {run}
+{env}
 EXPOSE {port}
 CMD {web} > /paatr/logs.txt 2>&1
 """
\ No newline at end of file
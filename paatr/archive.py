@@ -0,0 +1,209 @@
+import gzip
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from . import BUILD_ARCHIVE_TABLE, BUILD_LOGS_TABLE, Config
+from .coordination import locked_table, open_table, read_table
+from .helpers import bump_version
+
+# Records of builds and runs that may still change
+ACTIVE_STATES = ("queued", "building", "setting-up")
+
+# Number of decompressed segments kept in memory
+SEGMENT_CACHE_SIZE = 32
+
+# Fields of an archived record kept in the index, the logs stay in the segment
+INDEX_FIELDS = ("build_id", "created_at", "status", "type")
+
+
+def _app_archive_dir(app_id):
+    return os.path.join(Config.BUILD_ARCHIVE_DIR, app_id)
+
+def write_segment(app_id, records):
+    """
+    Writes build records to a new compressed segment, zstd if available
+    else gzip
+
+    Args:
+        app_id (str): ID of the app
+        records (dict): Records keyed by build ID
+
+    Returns:
+        (str, int): Tuple of (segment name, compressed size)
+    """
+    data = json.dumps(records).encode()
+    if zstandard:
+        segment, data = f"{int(time.time())}-{uuid.uuid4().hex[:8]}.json.zst", zstandard.compress(data)
+    else:
+        segment, data = f"{int(time.time())}-{uuid.uuid4().hex[:8]}.json.gz", gzip.compress(data)
+
+    app_dir = _app_archive_dir(app_id)
+    os.makedirs(app_dir, exist_ok=True)
+
+    # Readers never see a partial segment
+    tmp_path = os.path.join(app_dir, f".{segment}.tmp")
+    with open(tmp_path, "wb") as fp:
+        fp.write(data)
+    os.replace(tmp_path, os.path.join(app_dir, segment))
+
+    return segment, len(data)
+
+@lru_cache(maxsize=SEGMENT_CACHE_SIZE)
+def read_segment(app_id, segment):
+    """
+    Decompresses a segment, segments never change so they are cached
+
+    Args:
+        app_id (str): ID of the app
+        segment (str): Name of the segment
+
+    Returns:
+        dict: Records keyed by build ID
+    """
+    with open(os.path.join(_app_archive_dir(app_id), segment), "rb") as fp:
+        data = fp.read()
+
+    if segment.endswith(".zst"):
+        if not zstandard:
+            raise RuntimeError(f"Install zstandard to read the build archive segment {segment}")
+        data = zstandard.decompress(data)
+    else:
+        data = gzip.decompress(data)
+
+    return json.loads(data)
+
+def _should_archive(record, index, archive_before):
+    if record.get("status") in ACTIVE_STATES:
+        return False
+
+    return index >= Config.GC_KEEP_BUILD_LOGS or record.get("created_at", "") < archive_before
+
+def archive_build_logs():
+    """
+    Moves build and run records out of the build logs table into
+    compressed segments, one per app and run. Records beyond the last
+    `Config.GC_KEEP_BUILD_LOGS` of an app, or older than
+    `Config.BUILD_LOGS_TTL_DAYS` days, are archived.
+
+    Returns:
+        (int, int): Tuple of (records archived, compressed bytes written)
+    """
+    archive_before = ""
+    if Config.BUILD_LOGS_TTL_DAYS > 0:
+        archive_before = (datetime.utcnow() - timedelta(days=Config.BUILD_LOGS_TTL_DAYS)).isoformat()
+
+    with open_table(BUILD_LOGS_TABLE) as db:
+        app_ids = list(db.keys())
+
+    archived, written = 0, 0
+    for app_id in app_ids:
+        with locked_table(BUILD_LOGS_TABLE, app_id) as db:
+            records = db.get(app_id, {})
+            ordered = sorted(records.values(), key=lambda r: r.get("created_at", ""), reverse=True)
+            old = {r["build_id"]: r for i, r in enumerate(ordered)
+                    if _should_archive(r, i, archive_before)}
+
+            if not old:
+                continue
+
+            segment, size = write_segment(app_id, old)
+
+            with locked_table(BUILD_ARCHIVE_TABLE, app_id) as index:
+                index[app_id] = {
+                    **index.get(app_id, {}),
+                    **{build_id: {**{k: r.get(k) for k in INDEX_FIELDS}, "segment": segment}
+                        for build_id, r in old.items()}
+                }
+
+            db[app_id] = {build_id: r for build_id, r in records.items() if build_id not in old}
+
+        # Status pollers see the records move to the archive
+        bump_version(f"build:{app_id}")
+        archived += len(old)
+        written += size
+
+    return archived, written
+
+def expire_archives():
+    """
+    Deletes archive segments older than `Config.BUILD_ARCHIVE_TTL_DAYS`
+    days, with their index entries
+
+    Returns:
+        (int, int): Tuple of (segments removed, bytes reclaimed)
+    """
+    if Config.BUILD_ARCHIVE_TTL_DAYS <= 0 or not os.path.isdir(Config.BUILD_ARCHIVE_DIR):
+        return 0, 0
+
+    expire_before = time.time() - Config.BUILD_ARCHIVE_TTL_DAYS * 24 * 60 * 60
+
+    removed, reclaimed = 0, 0
+    for app_id in os.listdir(Config.BUILD_ARCHIVE_DIR):
+        app_dir = _app_archive_dir(app_id)
+        # Segment names start with their creation time
+        expired = {segment for segment in os.listdir(app_dir)
+                    if not segment.startswith(".") and int(segment.split("-")[0]) < expire_before}
+
+        if not expired:
+            continue
+
+        with locked_table(BUILD_ARCHIVE_TABLE, app_id) as index:
+            index[app_id] = {build_id: entry for build_id, entry in index.get(app_id, {}).items()
+                                if entry["segment"] not in expired}
+
+        for segment in expired:
+            path = os.path.join(app_dir, segment)
+            reclaimed += os.path.getsize(path)
+            os.remove(path)
+            removed += 1
+
+    return removed, reclaimed
+
+def list_builds(app_id):
+    """
+    Get the builds and runs of an app, archived ones included. Archived
+    records come without their logs, see `get_build_record`.
+
+    Args:
+        app_id (str): ID of the app
+
+    Returns:
+        dict: Records keyed by build/run ID
+    """
+    archived = {build_id: {**entry, "archived": True}
+                for build_id, entry in read_table(BUILD_ARCHIVE_TABLE, app_id, {}).items()}
+
+    return {**archived, **read_table(BUILD_LOGS_TABLE, app_id, {})}
+
+def get_build_record(app_id, build_id):
+    """
+    Get a build or run record with its logs, decompressing its archive
+    segment if it was archived
+
+    Args:
+        app_id (str): ID of the app
+        build_id (str): ID of the build or run
+
+    Returns:
+        dict: The record, None if there is no such build
+    """
+    if record := read_table(BUILD_LOGS_TABLE, app_id, {}).get(build_id):
+        return record
+
+    if entry := read_table(BUILD_ARCHIVE_TABLE, app_id, {}).get(build_id):
+        try:
+            return {**read_segment(app_id, entry["segment"])[build_id], "archived": True}
+        except FileNotFoundError:
+            # Expired while we were reading the index
+            return None
+
+    return None
@@ -0,0 +1,115 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from . import BULK_JOBS_TABLE, Config
+from .coordination import expire_keys, read_table, update_table
+from .jobs import run_job, submit_job
+from .journal import get_job
+
+# Bulk jobs are forgotten after this long
+BULK_JOBS_TTL = timedelta(days=1)
+
+# Actions of `paatr.jobs.RUNNERS` that can be run in bulk
+ACTIONS = ("stop", "restart", "run")
+
+
+def forget_old_bulk_jobs():
+    """
+    Forgets the bulk jobs created more than `BULK_JOBS_TTL` ago, run by
+    the garbage collector (see `paatr.cleanup`)
+
+    Returns:
+        int: Number of bulk jobs forgotten
+    """
+    forget_before = (datetime.utcnow() - BULK_JOBS_TTL).isoformat()
+    return expire_keys(BULK_JOBS_TABLE, lambda job: job["created_at"] < forget_before)
+
+def create_bulk_job(action, apps, missing=()):
+    """
+    Records a new bulk job, journaling one job per app so the apps left
+    are still run if the api restarts halfway (see `paatr.jobs.recover_jobs`)
+
+    Args:
+        action (str): One of `ACTIONS`
+        apps (list): App objects
+        missing (list, optional): IDs of the requested apps that don't exist
+
+    Returns:
+        dict: The job, `jobs` maps app IDs to their name and the ID of their journaled job
+    """
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "action": action,
+        "created_at": datetime.utcnow().isoformat(),
+        "total": len(apps) + len(missing),
+        "jobs": {str(app_data.app_id): {"name": app_data.name, "run_id": submit_job(action, app_data.app_id)}
+                    for app_data in apps},
+        "missing": list(missing)
+    }
+    update_table(BULK_JOBS_TABLE, job["job_id"], lambda _: job)
+    return job
+
+def run_bulk_job(job_id, apps):
+    """
+    Runs the jobs of a bulk job, `Config.BULK_PARALLELISM` at a time
+
+    Args:
+        job_id (str): ID of the bulk job
+        apps (list): App objects
+    """
+    jobs = read_table(BULK_JOBS_TABLE, job_id)["jobs"]
+
+    with ThreadPoolExecutor(max_workers=Config.BULK_PARALLELISM) as pool:
+        for app_data in apps:
+            pool.submit(run_job, jobs[str(app_data.app_id)]["run_id"], app_data)
+
+def _duration(job):
+    if not job.get("started_at") or not job.get("finished_at"):
+        return None
+
+    started, finished = datetime.fromisoformat(job["started_at"]), datetime.fromisoformat(job["finished_at"])
+    return round((finished - started).total_seconds(), 3)
+
+def _result(job):
+    if not job:
+        return {"ok": False, "message": "Job was forgotten", "status": "failed"}
+
+    finished = job["status"] in ("finished", "failed")
+    return {
+        "ok": job["status"] == "finished",
+        "message": job.get("message") or ("Done" if finished else job["status"].capitalize()),
+        "status": job["status"],
+        "run_id": job["job_id"],
+        "duration": _duration(job)
+    }
+
+def get_bulk_job(job_id):
+    """
+    Get a bulk job with the results so far, read from the journal
+
+    Args:
+        job_id (str): ID of the bulk job
+
+    Returns:
+        dict: The job, None if there is no such job
+    """
+    if not (bulk := read_table(BULK_JOBS_TABLE, job_id)):
+        return None
+
+    results = {app_id: {"ok": False, "message": "App not found", "status": "failed"}
+                for app_id in bulk.get("missing", [])}
+    journaled = {app_id: get_job(entry["run_id"]) for app_id, entry in bulk.get("jobs", {}).items()}
+    results.update({app_id: {"name": bulk["jobs"][app_id]["name"], **_result(job)}
+                    for app_id, job in journaled.items()})
+
+    done = all(result["status"] in ("finished", "failed") for result in results.values())
+    finished_at = [job["finished_at"] for job in journaled.values() if job and job.get("finished_at")]
+
+    return {
+        **bulk,
+        "status": "done" if done else "running",
+        "finished_at": max(finished_at) if done and finished_at else None,
+        "failed": len([r for r in results.values() if not r["ok"]]),
+        "results": results
+    }
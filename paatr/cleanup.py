@@ -0,0 +1,353 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from docker.errors import APIError, NotFound
+
+from . import BUILD_LOGS_TABLE, GC_TABLE, Config, logger
+from .archive import archive_build_logs, expire_archives
+from .bulk import forget_old_bulk_jobs
+from .coordination import app_lock, open_table, update_table, vacuum
+from .helpers import _add_build_log, clear_hibernation, docker_timestamp, expect_stop, touch_app
+from .journal import forget_old_jobs
+from .nodes import NODE_ERRORS, NODES, healthy_nodes
+
+# Number of collections kept in the report
+GC_HISTORY = 20
+
+
+def _layers_size(node):
+    return node.client.df().get("LayersSize") or 0
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+                for root, _, names in os.walk(path) for name in names
+                if not os.path.islink(os.path.join(root, name)))
+
+def _remove_tags(image):
+    """Untags an image, docker deletes it with its last tag"""
+    for tag in image.tags:
+        image.client.images.remove(tag)
+
+def prune_app_images(node):
+    """
+    Removes all but the last `Config.GC_KEEP_IMAGES` builds of every app on
+    a node. The current image of an app and images used by a container are
+    always kept.
+
+    Returns:
+        int: Number of images removed
+    """
+    builds = {}
+    for image in node.client.images.list(filters={"label": "paatr.app"}):
+        builds.setdefault(image.labels["paatr.app"], []).append(image)
+
+    removed = 0
+    for app_name, images in builds.items():
+        images.sort(key=lambda image: image.attrs["Created"], reverse=True)
+
+        with app_lock(f"{app_name}.container"):
+            for image in images[Config.GC_KEEP_IMAGES:]:
+                if f"{app_name}:latest" in image.tags:
+                    continue
+
+                try:
+                    _remove_tags(image)
+                    removed += 1
+                except APIError as e:
+                    # Still used by a container
+                    logger.debug("Keeping image %s of app %s: %s", image.short_id, app_name, e)
+
+    return removed
+
+def last_used(containers, images):
+    """
+    Get the last time an app ran: now if it's running, else when its
+    containers last stopped, or when it was built if it never ran
+
+    Returns:
+        float: Unix timestamp
+    """
+    if any(c.status == "running" for c in containers):
+        return time.time()
+
+    return max([docker_timestamp(c.attrs["State"]["FinishedAt"]) for c in containers]
+                + [docker_timestamp(c.attrs["State"]["StartedAt"]) for c in containers]
+                + [docker_timestamp(image.attrs["Created"]) for image in images] + [0])
+
+def _app_resources():
+    """
+    Get the containers and images of every app, on all the nodes
+
+    Returns:
+        dict: Tuples of (containers, images) keyed by app name. None if a
+            node can't be reached, as its apps would be missing.
+    """
+    if len(healthy_nodes()) < len(NODES):
+        return None
+
+    apps = {}
+    for node in NODES.values():
+        try:
+            images = node.client.images.list(filters={"label": "paatr.app"})
+            containers = node.client.containers.list(all=True, filters={"label": "paatr.app"})
+        except NODE_ERRORS as e:
+            node.mark_unhealthy(e)
+            return None
+
+        for image in images:
+            apps.setdefault(image.labels["paatr.app"], ([], []))[1].append(image)
+        for cont in containers:
+            apps.setdefault(cont.labels["paatr.app"], ([], []))[0].append(cont)
+
+    return apps
+
+def evict_unused_apps():
+    """
+    Removes the containers and images of apps that haven't run for
+    `Config.GC_UNUSED_DAYS` days, least recently used first. The apps have
+    to be built again before they can run.
+
+    Returns:
+        list: Names of the evicted apps
+    """
+    if Config.GC_UNUSED_DAYS <= 0:
+        return []
+
+    if (apps := _app_resources()) is None:
+        logger.warning("Not evicting unused apps, a node is unreachable")
+        return []
+
+    unused_since = time.time() - Config.GC_UNUSED_DAYS * 24 * 60 * 60
+    unused = sorted((last_used(*resources), app_name) for app_name, resources in apps.items())
+
+    evicted = []
+    for used_at, app_name in unused:
+        if used_at >= unused_since:
+            break
+
+        containers, images = apps[app_name]
+
+        with app_lock(f"{app_name}.container"):
+            try:
+                for cont in containers:
+                    cont.reload()
+
+                # Started while we were looking
+                if any(cont.status == "running" for cont in containers):
+                    continue
+
+                for cont in containers:
+                    expect_stop(cont)
+                    cont.remove(force=True)
+                for image in images:
+                    _remove_tags(image)
+            except (APIError, NotFound) as e:
+                logger.warning("Failed to evict app %s: %s", app_name, e)
+                continue
+
+            clear_hibernation(app_name)
+
+        logger.info("Evicted app %s, unused for %s days", app_name, Config.GC_UNUSED_DAYS)
+        evicted.append(app_name)
+
+        app_ids = {r.labels.get("paatr.app_id") for r in containers + images} - {None, ""}
+        for app_id in app_ids:
+            _add_build_log(str(uuid.uuid4()), app_id,
+                            f"Removed the app image after {Config.GC_UNUSED_DAYS} days without running, "
+                            "build it again to run it", "evicted", log_type="run")
+
+    return evicted
+
+def remove_failed_containers(node):
+    """
+    Removes paatr containers that never started or are dead, e.g left
+    behind by a failed run
+
+    Returns:
+        int: Number of containers removed
+    """
+    removed = 0
+    containers = node.client.containers.list(all=True, filters={"label": "paatr.app",
+                                                                "status": ["created", "dead"]})
+
+    for cont in containers:
+        with app_lock(f"{cont.labels['paatr.app']}.container"):
+            try:
+                cont.reload()
+                if cont.status in ("created", "dead"):
+                    cont.remove(force=True)
+                    touch_app(cont.labels["paatr.app"])
+                    removed += 1
+            except NotFound:
+                pass
+
+    return removed
+
+def prune_build_cache(node):
+    """
+    Trims the build cache of a node down to `Config.GC_BUILD_CACHE_BUDGET`
+    bytes, least recently used entries first
+
+    Returns:
+        int: Bytes reclaimed
+    """
+    cache = node.client.df().get("BuildCache") or []
+    if sum(entry.get("Size", 0) for entry in cache) <= Config.GC_BUILD_CACHE_BUDGET:
+        return 0
+
+    # `prune_builds` doesn't take the `keep-storage` option of the engine api
+    api = node.client.api
+    result = api._result(api._post(api._url("/build/prune"),
+                            params={"keep-storage": Config.GC_BUILD_CACHE_BUDGET}), True)
+    return result.get("SpaceReclaimed") or 0
+
+def _app_exists(app_name):
+    for node in NODES.values():
+        for collection in (node.client.images, node.client.containers):
+            try:
+                collection.get(app_name)
+                return True
+            except NotFound:
+                pass
+            except NODE_ERRORS as e:
+                # Can't tell, keep it
+                node.mark_unhealthy(e)
+                return True
+
+    return False
+
+def remove_orphan_app_dirs():
+    """
+    Removes the directories of `Config.APP_FILES_DIR` whose app has neither
+    an image nor a container left on any node
+
+    Returns:
+        (int, int): Tuple of (directories removed, bytes reclaimed)
+    """
+    if not os.path.isdir(Config.APP_FILES_DIR):
+        return 0, 0
+
+    if (apps := _app_resources()) is None:
+        logger.warning("Not removing orphan app directories, a node is unreachable")
+        return 0, 0
+
+    known = set(apps)
+
+    removed, reclaimed = 0, 0
+    for app_name in os.listdir(Config.APP_FILES_DIR):
+        path = os.path.join(Config.APP_FILES_DIR, app_name)
+        if app_name in known or not os.path.isdir(path):
+            continue
+
+        with app_lock(f"{app_name}.container"):
+            # Images and containers from before labels, or created since we looked
+            if _app_exists(app_name):
+                continue
+
+            size = _dir_size(path)
+            shutil.rmtree(path, ignore_errors=True)
+
+        removed += 1
+        reclaimed += size
+
+    return removed, reclaimed
+
+def collect_garbage():
+    """
+    Runs every garbage collection policy once
+
+    Returns:
+        dict: What was removed, the bytes reclaimed and how long it took
+    """
+    started = time.monotonic()
+    started_at = datetime.utcnow().isoformat()
+    removed = {"images": 0, "apps": [], "containers": 0, "app_dirs": 0, "archives": 0, "jobs": 0}
+    reclaimed = {"images": 0, "build_cache": 0, "app_dirs": 0, "archives": 0, "database": 0}
+
+    nodes, layers_before = healthy_nodes(), {}
+
+    for node in nodes:
+        try:
+            layers_before[node.name] = _layers_size(node)
+            removed["containers"] += remove_failed_containers(node)
+            removed["images"] += prune_app_images(node)
+        except NODE_ERRORS as e:
+            node.mark_unhealthy(e)
+
+    removed["apps"] = evict_unused_apps()
+
+    for node in nodes:
+        if not node.healthy:
+            continue
+
+        try:
+            # Layers of the removed builds are left dangling
+            node.client.images.prune(filters={"dangling": True})
+            reclaimed["images"] += max(layers_before[node.name] - _layers_size(node), 0)
+            reclaimed["build_cache"] += prune_build_cache(node)
+        except NODE_ERRORS as e:
+            node.mark_unhealthy(e)
+
+    removed["app_dirs"], reclaimed["app_dirs"] = remove_orphan_app_dirs()
+    archived, archived_bytes = archive_build_logs()
+    removed["archives"], reclaimed["archives"] = expire_archives()
+    removed["jobs"] = forget_old_jobs() + forget_old_bulk_jobs()
+    if archived or removed["archives"] or removed["jobs"]:
+        reclaimed["database"] = vacuum(BUILD_LOGS_TABLE)
+
+    report = {
+        "started_at": started_at,
+        "duration": round(time.monotonic() - started, 3),
+        "removed": removed,
+        "reclaimed": reclaimed,
+        "archived": {"build_logs": archived, "bytes": archived_bytes},
+        "reclaimed_total": sum(reclaimed.values())
+    }
+
+    update_table(GC_TABLE, "history", lambda history: (history + [report])[-GC_HISTORY:], default=[])
+    logger.info("Garbage collection reclaimed %s bytes in %ss",
+                report["reclaimed_total"], report["duration"])
+    return report
+
+def gc_report():
+    """
+    Get the last garbage collections
+
+    Returns:
+        dict: `last` collection and the `history` of collections
+    """
+    with open_table(GC_TABLE) as db:
+        history = db.get("history", [])
+
+    return {"last": history[-1] if history else None, "history": history}
+
+def run_gc():
+    """
+    Collects garbage unless another worker is doing so
+
+    Returns:
+        dict: The report, None if another worker holds the gc lock
+    """
+    with app_lock("gc", blocking=False) as acquired:
+        if acquired:
+            return collect_garbage()
+
+def _gc():
+    while True:
+        time.sleep(Config.GC_INTERVAL)
+
+        try:
+            run_gc()
+        except Exception:
+            logger.exception("Garbage collection failed")
+
+def start_gc():
+    """Collects garbage every `Config.GC_INTERVAL` seconds in the background"""
+    if Config.GC_INTERVAL <= 0:
+        return
+
+    threading.Thread(target=_gc, name="gc", daemon=True).start()
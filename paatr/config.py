@@ -14,8 +14,11 @@ class Config:
     LOGS_DIR = os.path.join(BASE_DIR, "__logs__")
     LOGS_FILE = os.path.join(LOGS_DIR, "paatr.log")
 
-    # App Logs
-    APPS_LOGS = os.path.join(LOGS_DIR, "paatr-apps.log")
+    # Shared state (build logs, queues and locks). Every worker/replica
+    # of the API must point at the same directory.
+    STATE_DIR = ENV.get("STATE_DIR", LOGS_DIR)
+    APPS_LOGS = os.path.join(STATE_DIR, "paatr-apps.log")
+    LOCKS_DIR = os.path.join(STATE_DIR, "locks")
 
     # Supabase
     SUPABASE_URL = ENV["SUPABASE_URL"]
@@ -27,4 +30,104 @@ class Config:
         NGINX_ENABLED_PAATR_APPS = ENV.get("NGINX_ENABLED_PAATR_APPS_PROD")
     
     DOMAIN = ENV.get("DOMAIN")
-    CERTIFICATE = ENV.get("CERTIFICATE")
\ No newline at end of file
+    CERTIFICATE = ENV.get("CERTIFICATE")
+    NGINX_ACCESS_LOGS_DIR = ENV.get("NGINX_ACCESS_LOGS_DIR", "/var/log/nginx/paatr")
+
+    # Most replicas an app may run. Each replica is published on its own
+    # host port, picked between HOST_PORT_MIN and HOST_PORT_MAX (kept below
+    # the kernel ephemeral range by default)
+    MAX_REPLICAS = int(ENV.get("MAX_REPLICAS", 8))
+    HOST_PORT_MIN = int(ENV.get("HOST_PORT_MIN", 10000))
+    HOST_PORT_MAX = int(ENV.get("HOST_PORT_MAX", 32767))
+
+    # Resources: the most cpus an app may ask for, and how much of the
+    # node memory can be handed out as container limits
+    MAX_CPU = float(ENV.get("MAX_CPU", 2))
+    MEMORY_OVERCOMMIT = float(ENV.get("MEMORY_OVERCOMMIT", 1.0))
+    CPU_OVERCOMMIT = float(ENV.get("CPU_OVERCOMMIT", 4.0))
+
+    # Docker daemons apps are scheduled on, `name=base_url` comma separated.
+    # Defaults to the local daemon only. A node that can't be reached is
+    # skipped for NODE_RETRY_INTERVAL seconds
+    DOCKER_NODES = ENV.get("DOCKER_NODES")
+    NODE_RETRY_INTERVAL = int(ENV.get("NODE_RETRY_INTERVAL", 60))
+
+    # Supervisor: crashed containers are restarted after
+    # min(RESTART_BACKOFF * 2^restarts, RESTART_BACKOFF_MAX) seconds, and
+    # given up on after CRASH_LOOP_RESTARTS restarts in CRASH_LOOP_WINDOW seconds
+    RESTART_BACKOFF = float(ENV.get("RESTART_BACKOFF", 1))
+    RESTART_BACKOFF_MAX = float(ENV.get("RESTART_BACKOFF_MAX", 60))
+    CRASH_LOOP_RESTARTS = int(ENV.get("CRASH_LOOP_RESTARTS", 5))
+    CRASH_LOOP_WINDOW = int(ENV.get("CRASH_LOOP_WINDOW", 600))
+
+    # Warmup: runtime images are pulled at startup and every WARMUP_INTERVAL
+    # seconds (0 disables it). Baked base images add build tooling and a pip
+    # cache warmed with BAKE_PIP_PACKAGES (comma separated)
+    WARMUP_INTERVAL = int(ENV.get("WARMUP_INTERVAL", 6 * 60 * 60))
+    BAKE_BASE_IMAGES = ENV.get("BAKE_BASE_IMAGES", "false").lower() == "true"
+    BAKE_PIP_PACKAGES = ENV.get("BAKE_PIP_PACKAGES", "")
+
+    # Garbage collection, every GC_INTERVAL seconds (0 disables it): keep the
+    # last GC_KEEP_IMAGES images per app, evict apps not run for
+    # GC_UNUSED_DAYS days (0 never), trim the build cache down to
+    # GC_BUILD_CACHE_BUDGET bytes and keep GC_KEEP_BUILD_LOGS records per app
+    # in the build logs table (see BUILD_LOGS_TTL_DAYS)
+    GC_INTERVAL = int(ENV.get("GC_INTERVAL", 60 * 60))
+    GC_KEEP_IMAGES = int(ENV.get("GC_KEEP_IMAGES", 3))
+    GC_UNUSED_DAYS = int(ENV.get("GC_UNUSED_DAYS", 30))
+    GC_BUILD_CACHE_BUDGET = int(ENV.get("GC_BUILD_CACHE_BUDGET", 5 * 1024 ** 3))
+    GC_KEEP_BUILD_LOGS = int(ENV.get("GC_KEEP_BUILD_LOGS", 20))
+
+    # Build logs older than BUILD_LOGS_TTL_DAYS days (0 disables it), or beyond
+    # the last GC_KEEP_BUILD_LOGS, move to compressed archive segments which
+    # are deleted after BUILD_ARCHIVE_TTL_DAYS days (0 keeps them)
+    BUILD_LOGS_TTL_DAYS = int(ENV.get("BUILD_LOGS_TTL_DAYS", 7))
+    BUILD_ARCHIVE_DIR = ENV.get("BUILD_ARCHIVE_DIR", os.path.join(STATE_DIR, "archive"))
+    BUILD_ARCHIVE_TTL_DAYS = int(ENV.get("BUILD_ARCHIVE_TTL_DAYS", 90))
+
+    # Status long-polling: the longest a `wait` may block (seconds), and how
+    # often the app version is checked meanwhile
+    STATUS_MAX_WAIT = float(ENV.get("STATUS_MAX_WAIT", 60))
+    STATUS_POLL_INTERVAL = float(ENV.get("STATUS_POLL_INTERVAL", 0.5))
+
+    # Bulk operations: how many apps are stopped/restarted/run at once
+    BULK_PARALLELISM = int(ENV.get("BULK_PARALLELISM", 8))
+
+    # Sample the cpu, memory and network usage of running apps
+    STATS_ENABLED = ENV.get("STATS_ENABLED", "true").lower() == "true"
+    # Series are kept in memory and written to the state database every
+    # STATS_FLUSH_INTERVAL seconds
+    STATS_FLUSH_INTERVAL = int(ENV.get("STATS_FLUSH_INTERVAL", 60))
+
+    # Builds are cancelled after BUILD_TIMEOUT seconds, or BUILD_IDLE_TIMEOUT
+    # seconds without output from the clone or docker (0 disables either)
+    BUILD_TIMEOUT = int(ENV.get("BUILD_TIMEOUT", 30 * 60))
+    BUILD_IDLE_TIMEOUT = int(ENV.get("BUILD_IDLE_TIMEOUT", 10 * 60))
+    # Docker output of a build is written to its record in batches, at
+    # most every BUILD_LOG_FLUSH_INTERVAL seconds
+    BUILD_LOG_FLUSH_INTERVAL = float(ENV.get("BUILD_LOG_FLUSH_INTERVAL", 1))
+
+    # Job journal: running builds and runs record a heartbeat every
+    # JOB_HEARTBEAT_INTERVAL seconds, a job of another host without one for
+    # JOB_STALE_AFTER seconds is orphaned. Orphans are run again at most
+    # JOB_MAX_ATTEMPTS times in all
+    JOB_HEARTBEAT_INTERVAL = int(ENV.get("JOB_HEARTBEAT_INTERVAL", 10))
+    JOB_STALE_AFTER = int(ENV.get("JOB_STALE_AFTER", 60))
+    JOB_MAX_ATTEMPTS = int(ENV.get("JOB_MAX_ATTEMPTS", 3))
+
+    # Health checks: defaults of the `health` keys of paatr.yaml (seconds).
+    # Replicas get `start_period` seconds to pass a probe before nginx routes to them
+    HEALTH_TIMEOUT = float(ENV.get("HEALTH_TIMEOUT", 2))
+    HEALTH_INTERVAL = float(ENV.get("HEALTH_INTERVAL", 1))
+    HEALTH_START_PERIOD = float(ENV.get("HEALTH_START_PERIOD", 60))
+
+    # Where nginx reaches this api (used to wake hibernated apps)
+    API_URL = ENV.get("API_URL", "http://localhost:80")
+
+    # Hibernation: stop apps idle for IDLE_TIMEOUT seconds (0 disables it).
+    # Requests held while another one wakes the app check every
+    # WAKE_POLL_INTERVAL seconds, for at most WAKE_TIMEOUT seconds
+    IDLE_TIMEOUT = int(ENV.get("IDLE_TIMEOUT", 0))
+    IDLE_CHECK_INTERVAL = int(ENV.get("IDLE_CHECK_INTERVAL", 60))
+    WAKE_TIMEOUT = int(ENV.get("WAKE_TIMEOUT", 30))
+    WAKE_POLL_INTERVAL = float(ENV.get("WAKE_POLL_INTERVAL", 0.5))
\ No newline at end of file
@@ -0,0 +1,298 @@
+import fcntl
+import os
+import pickle
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from . import logger
+from .config import Config
+
+###################################################################
+# Cross-process locks                                             #
+###################################################################
+
+@contextmanager
+def app_lock(name, blocking=True):
+    """
+    Holds an exclusive lock shared by every worker using the same
+    `Config.STATE_DIR`
+
+    Args:
+        name (str): Name of the lock e.g `<app_id>.build`
+        blocking (bool, optional): Wait for the lock. Defaults to True.
+
+    Yields:
+        bool: Whether the lock was acquired
+    """
+    # Names may come from table keys e.g image names
+    path = os.path.join(Config.LOCKS_DIR, f"{name.replace(os.sep, '%')}.lock")
+
+    with open(path, "a") as fp:
+        try:
+            fcntl.flock(fp, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+###################################################################
+# Shared tables                                                   #
+###################################################################
+
+# Connections to the state database, one per thread of each process
+_connections = threading.local()
+
+def _connect(path):
+    """
+    Returns the connection of this thread to the state database at `path`,
+    opening it the first time. A forked worker opens its own.
+    """
+    if getattr(_connections, "pid", None) != os.getpid():
+        _connections.pid = os.getpid()
+        _connections.by_path = {}
+
+    if (conn := _connections.by_path.get(path)) is None:
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        _connections.by_path[path] = conn
+
+    return conn
+
+class Table:
+    """
+    A table of the shared state database, read and written like a dict.
+    Keys are strings and values are pickled, in the layout `sqlitedict`
+    used so existing databases stay readable.
+    """
+
+    def __init__(self, conn, tablename):
+        self.conn = conn
+        self.tablename = tablename
+        self._name = '"%s"' % tablename.replace('"', '""')
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {self._name} (key TEXT PRIMARY KEY, value BLOB)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, key):
+        return self.conn.execute(f"SELECT 1 FROM {self._name} WHERE key = ?", (key,)).fetchone() is not None
+
+    def __getitem__(self, key):
+        row = self.conn.execute(f"SELECT value FROM {self._name} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(bytes(row[0]))
+
+    def __setitem__(self, key, value):
+        self.conn.execute(f"REPLACE INTO {self._name} (key, value) VALUES (?, ?)",
+                            (key, sqlite3.Binary(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))))
+
+    def __delitem__(self, key):
+        if self.conn.execute(f"DELETE FROM {self._name} WHERE key = ?", (key,)).rowcount == 0:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [key for key, in self.conn.execute(f"SELECT key FROM {self._name} ORDER BY rowid")]
+
+    def values(self):
+        return [value for _, value in self.items()]
+
+    def items(self):
+        return [(key, pickle.loads(bytes(value)))
+                for key, value in self.conn.execute(f"SELECT key, value FROM {self._name} ORDER BY rowid")]
+
+    def update(self, items):
+        for key, value in dict(items).items():
+            self[key] = value
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        """Drops the writes that weren't committed, the connection stays open"""
+        self.conn.rollback()
+
+def open_table(tablename):
+    """
+    Opens a table in the shared state database, on the connection of the
+    calling thread. Writes are only visible to other workers after
+    `commit()`, and are dropped when the table is closed without it, so
+    callers should not keep the handle around.
+
+    Args:
+        tablename (str): Name of the table
+
+    Returns:
+        Table: The table
+    """
+    return Table(_connect(Config.APPS_LOGS), tablename)
+
+def read_table(tablename, key, default=None):
+    """
+    Reads the committed value of `key` from a shared table
+
+    Args:
+        tablename (str): Name of the table
+        key (str): Key to read
+        default (any, optional): Returned if the key is missing. Defaults to None.
+
+    Returns:
+        any: The stored value
+    """
+    with open_table(tablename) as db:
+        return db.get(key, default)
+
+@contextmanager
+def locked_table(tablename, key):
+    """
+    Opens a shared table while holding the lock for `key`, so a
+    read-modify-write of that key can't interleave with another worker.
+    The table is committed (blocking) when the block exits cleanly.
+
+    Args:
+        tablename (str): Name of the table
+        key (str): Key that will be modified
+
+    Yields:
+        Table: The table
+    """
+    with app_lock(f"{tablename}.{key}"):
+        db = open_table(tablename)
+        try:
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
+def update_table(tablename, key, fn, default=None):
+    """
+    Atomically replaces the value of `key` with `fn(value)`
+
+    Args:
+        tablename (str): Name of the table
+        key (str): Key to update
+        fn (callable): Receives the current value, returns the new one
+        default (any, optional): Current value if the key is missing. Defaults to None.
+
+    Returns:
+        any: The new value
+    """
+    with locked_table(tablename, key) as db:
+        value = fn(db.get(key, default))
+        db[key] = value
+
+    return value
+
+def expire_keys(tablename, expired):
+    """
+    Deletes the keys of a shared table whose value has expired. Each key
+    is deleted under its lock, so a concurrent update of it isn't lost.
+
+    Args:
+        tablename (str): Name of the table
+        expired (callable): Receives a value, tells if its key should go
+
+    Returns:
+        int: Number of keys deleted
+    """
+    with open_table(tablename) as db:
+        candidates = [key for key, value in db.items() if expired(value)]
+
+    deleted = 0
+    for key in candidates:
+        with locked_table(tablename, key) as db:
+            # Updated since we looked
+            if key in db and expired(db[key]):
+                del db[key]
+                deleted += 1
+
+    return deleted
+
+def vacuum(tablename):
+    """
+    Rebuilds the shared state database without its free pages and folds
+    the write-ahead log back into it, so the hot database stays small
+
+    Args:
+        tablename (str): Any table of the database, vacuuming covers all of them
+
+    Returns:
+        int: Bytes reclaimed
+    """
+    def size():
+        return sum(os.path.getsize(path) for path in (Config.APPS_LOGS, f"{Config.APPS_LOGS}-wal")
+                    if os.path.exists(path))
+
+    before = size()
+
+    with open_table(tablename) as db:
+        db.conn.execute("VACUUM")
+        db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        db.commit()
+
+    return max(before - size(), 0)
+
+###################################################################
+# Shared build queue                                              #
+###################################################################
+
+def enqueue_build(tablename, app_id, job):
+    """
+    Adds a build job to the shared queue of an app
+
+    Args:
+        tablename (str): Name of the queue table
+        app_id (str): ID of the app
+        job (dict): Keyword arguments for the build runner
+    """
+    update_table(tablename, app_id, lambda queue: queue + [job], default=[])
+
+def _pop_build(tablename, app_id):
+    with locked_table(tablename, app_id) as db:
+        queue = db.get(app_id, [])
+        if not queue:
+            return None
+
+        db[app_id] = queue[1:]
+        return queue[0]
+
+def drain_builds(tablename, app_id, runner):
+    """
+    Runs the queued builds of an app one at a time. Any worker may call
+    this, only the one holding the app build lock does the work; the
+    others return straight away and leave their jobs to it.
+
+    Args:
+        tablename (str): Name of the queue table
+        app_id (str): ID of the app
+        runner (callable): Called with each job's keyword arguments
+    """
+    while True:
+        with app_lock(f"{app_id}.build", blocking=False) as acquired:
+            if not acquired:
+                return
+
+            while (job := _pop_build(tablename, app_id)) is not None:
+                try:
+                    runner(**job)
+                except Exception:
+                    logger.exception("Build %s of app %s failed", job.get("build_id"), app_id)
+
+        # A job may have been queued after our last pop but before the
+        # lock was released, in which case its worker already gave up.
+        if not read_table(tablename, app_id, []):
+            return
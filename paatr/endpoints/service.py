@@ -1,21 +1,38 @@
+import asyncio
 from datetime import datetime
+import hashlib
 import os
+import time
 import uuid
-from typing import Union
+from typing import List, Union
 
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from fastapi.responses import HTMLResponse
+import httpx
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, Response
 from pydantic import BaseModel
 
 from ..models import App
-from ..helpers import (get_app_status, build_app, run_docker_image, 
-                        get_image, stop_container, container_logs, _add_subdomain,
-                        restart_docker_image)
-from .. import logger, BUILD_LOGS_TABLE, NEW_DB_CONN
+from ..helpers import (get_app_status, queue_build, run_build_queue, 
+                        get_image, container_logs, _add_subdomain,
+                        get_build_logs, get_status_version, known_app_name, remember_app_name,
+                        get_apps_status, get_resources, cancel_build)
+from ..hibernation import wake_app
+from ..warmup import warmup_report
+from ..cleanup import gc_report, run_gc
+from ..archive import get_build_record, list_builds
+from ..bulk import ACTIONS, create_bulk_job, get_bulk_job, run_bulk_job
+from ..stats import get_stats
+from ..jobs import run_job, submit_job
+from .. import logger, Config
 
 
 service_router = APIRouter()
 
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "te", "upgrade", 
+                        "content-length", "proxy-authorization", "proxy-authenticate", 
+                        "x-original-uri"}
+
 class AppItem(BaseModel):
     name: str
     user_id: str
@@ -25,14 +42,19 @@ class BuildItem(BaseModel):
     username: str
     gh_token: str
 
+class ScaleItem(BaseModel):
+    replicas: int
+
+class BulkItem(BaseModel):
+    app_ids: List[str] = []
+    user_id: Union[str, None] = None
+
 @service_router.get("/")
 async def hello():
     logger.info("Paatr World!")
     return {"deploy your python wed apps on...": "...paatr!"}
 
-@service_router.get("/unknown", response_class=HTMLResponse)
-async def unknown():
-    content = """
+UNKNOWN_APP_PAGE = """
 <html>
     <head>
         <title>Paatr | unknown app</title>
@@ -61,7 +83,53 @@ async def unknown():
     </body>
 </html>
 """
-    return content
+
+@service_router.get("/unknown", response_class=HTMLResponse)
+async def unknown():
+    return UNKNOWN_APP_PAGE
+
+@service_router.api_route("/wake/{app_name}", 
+                            methods=["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"])
+async def wake(app_name: str, request: Request):
+    """
+    Wakes up a hibernated app. Nginx routes requests here when the app 
+    refuses connections, the request is held until the app is ready and
+    then forwarded to it. Only the request that woke the app is forwarded,
+    others may not be safe to send again to an app that was running.
+
+    Args:
+        app_name (str): Name of the application
+    """
+    logger.info("Waking app %s", app_name)
+
+    # Another request may be waking the app, wait for it without holding a thread
+    deadline = time.monotonic() + Config.WAKE_TIMEOUT
+    while (woken := await run_in_threadpool(wake_app, app_name, False)) is None:
+        if time.monotonic() >= deadline:
+            logger.info("Timed out waiting for app %s to wake up", app_name)
+            return HTMLResponse(UNKNOWN_APP_PAGE, status_code=504)
+        await asyncio.sleep(Config.WAKE_POLL_INTERVAL)
+
+    address, message = woken
+    if not address:
+        logger.info("Could not wake app %s: %s", app_name, message)
+        return HTMLResponse(UNKNOWN_APP_PAGE, status_code=502)
+
+    uri = request.headers.get("x-original-uri", "/")
+    headers = {k: v for k, v in request.headers.items() if k not in HOP_BY_HOP_HEADERS}
+
+    try:
+        async with httpx.AsyncClient(timeout=Config.WAKE_TIMEOUT) as client:
+            resp = await client.request(request.method, f"http://{address}{uri}", 
+                                        headers=headers, content=await request.body())
+    except httpx.HTTPError as e:
+        logger.info("Woken app %s failed the held request: %s", app_name, e)
+        return HTMLResponse(UNKNOWN_APP_PAGE, status_code=502)
+
+    # httpx already decoded the body
+    headers = {k: v for k, v in resp.headers.items() 
+                if k not in HOP_BY_HOP_HEADERS | {"content-encoding"}}
+    return Response(resp.content, status_code=resp.status_code, headers=headers)
 
 
 # @service_router.post("/services/apps/{app_id}/register")
@@ -132,10 +200,67 @@ async def build_app_(app_id: str, build_data: BuildItem, background_tasks: Backg
         github_url = repo["git_url"].replace("git://", f"https://")
     
     build_id = str(uuid.uuid4())
-    background_tasks.add_task(build_app, build_id, github_url, app_data.name, app_data.app_id, repo["git_url"])
+    queue_build(build_id, github_url, app_data.name, app_data.app_id, repo["git_url"])
+    background_tasks.add_task(run_build_queue, app_data.app_id)
     return {"build_id": build_id}
 
 
+@service_router.get("/services/apps/{app_id}/builds")
+async def get_builds(app_id: str):
+    """
+    List the builds and runs of an application, archived ones included
+    (without their logs)
+
+    Args:
+        app_id (str): The ID of the application
+
+    Returns:
+        dict: Records keyed by build/run ID
+    """
+    return await run_in_threadpool(list_builds, app_id)
+
+@service_router.get("/services/apps/{app_id}/builds/{build_id}")
+async def get_build(app_id: str, build_id: str):
+    """
+    Retrieve a build or run with its logs, from the archive if needed
+
+    Args:
+        app_id (str): The ID of the application
+        build_id (str): The ID of the build or run
+
+    Returns:
+        dict: The build record
+    """
+    record = await run_in_threadpool(get_build_record, app_id, build_id)
+
+    if not record:
+        raise HTTPException(status_code=404, detail="Build not found")
+
+    return record
+
+@service_router.post("/services/apps/{app_id}/builds/{build_id}/cancel")
+async def cancel_build_(app_id: str, build_id: str):
+    """
+    Cancel a queued or running build. Running builds stop within a second
+    or so, the build record ends up `cancelled`.
+
+    Args:
+        app_id (str): The ID of the application
+        build_id (str): The ID of the build
+
+    Returns:
+        dict: `cancelled` if the build was queued, else `cancelling`
+    """
+    status = await run_in_threadpool(cancel_build, app_id, build_id)
+
+    if not status:
+        raise HTTPException(status_code=404, detail="Build not found")
+    elif status not in ("cancelled", "cancelling"):
+        raise HTTPException(status_code=409, detail=f"Build already finished ({status})")
+
+    return {"build_id": build_id, "status": status}
+
+
 @service_router.post("/services/apps/{app_id}/run")
 async def run_app(app_id: str, background_tasks: BackgroundTasks):
     """
@@ -159,7 +284,8 @@ async def run_app(app_id: str, background_tasks: BackgroundTasks):
     
     run_id = str(uuid.uuid4())
 
-    background_tasks.add_task(run_docker_image, app_data, run_id)
+    submit_job("run", app_data.app_id, run_id)
+    background_tasks.add_task(run_job, run_id, app_data)
 
     return get_app_status(app_data.name)
 
@@ -183,11 +309,45 @@ async def restart_app(app_id: str, background_tasks: BackgroundTasks):
     
     run_id = str(uuid.uuid4())
 
-    background_tasks.add_task(restart_docker_image, app_data, run_id)
+    submit_job("restart", app_data.app_id, run_id)
+    background_tasks.add_task(run_job, run_id, app_data)
 
     return get_app_status(app_data.name)
 
 
+@service_router.post("/services/apps/{app_id}/scale")
+async def scale_app_(app_id: str, scale_data: ScaleItem, background_tasks: BackgroundTasks):
+    """
+    Scale an application up or down
+
+    Args:
+        app_id (str): The ID of the application
+        scale_data (ScaleItem): The number of replicas to run
+
+    Returns:
+        dict: The application status
+    """
+    logger.info("Scaling app %s to %s replicas", app_id, scale_data.replicas)
+
+    if not 1 <= scale_data.replicas <= Config.MAX_REPLICAS:
+        raise HTTPException(status_code=400, 
+                            detail=f"Replicas must be between 1 and {Config.MAX_REPLICAS}")
+
+    app_data = App.get(app_id)
+    
+    if not app_data:
+        return HTTPException(status_code=404, detail="App not found")
+
+    if not get_image(app_data.name):
+        return {"message": "App has not been built"}
+    
+    run_id = str(uuid.uuid4())
+
+    submit_job("scale", app_data.app_id, run_id, replicas=scale_data.replicas)
+    background_tasks.add_task(run_job, run_id, app_data)
+
+    return {**get_app_status(app_data.name), "run_id": run_id}
+
 @service_router.post("/services/apps/{app_id}/stop")
 async def stop_app(app_id: str, background_tasks: BackgroundTasks):
     """
@@ -209,27 +369,82 @@ async def stop_app(app_id: str, background_tasks: BackgroundTasks):
     if not get_image(app_data.name):
         return {"message": "App has not been built"}
     
-    background_tasks.add_task(stop_container, app_data.name)
+    job_id = submit_job("stop", app_data.app_id)
+    background_tasks.add_task(run_job, job_id, app_data)
 
     return get_app_status(app_data.name)
 
+def _status_etag(app_name, app_id, run):
+    """
+    ETag of a status response, made of the app versions. Container logs
+    aren't versioned, so their content is hashed in when they are included.
+    """
+    etag = ".".join(map(str, get_status_version(app_name, app_id)))
+
+    if run:
+        logs = container_logs(app_name) or []
+        etag += "." + hashlib.sha1("".join(logs).encode()).hexdigest()[:12]
+
+    return f'W/"{etag}"'
+
 @service_router.get("/services/apps/{app_id}/status")
-async def app_status(app_id: str, build_id: str = "", all: str = "false", run: str = "false"):
-    app_data = App.get(app_id)
-    
+async def app_status(app_id: str, request: Request, response: Response, build_id: str = "", 
+                        all: str = "false", run: str = "false", wait: float = 0):
+    """
+    Get the status of an application. Answers `If-None-Match` with a 304
+    when nothing changed, and with `wait` blocks up to that many seconds
+    until something does.
+
+    Args:
+        app_id (str): The ID of the application
+        build_id (str, optional): Include this build record
+        all (str, optional): "true" to include the last builds
+        run (str, optional): "true" to include the container logs
+        wait (float, optional): Seconds to wait for a change of the `If-None-Match` version
+
+    Returns:
+        dict: The application status
+    """
+    known = {tag.strip() for tag in request.headers.get("if-none-match", "").split(",")}
+
+    # Unchanged statuses of known apps are answered without asking Supabase
+    app_data = None
+    app_name = await run_in_threadpool(known_app_name, app_id)
+    if not app_name:
+        app_data = await run_in_threadpool(App.get, app_id)
+        if not app_data:
+            return HTTPException(status_code=404, detail="App not found")
+
+        app_name = app_data.name
+        await run_in_threadpool(remember_app_name, app_id, app_name)
+
+    etag = await run_in_threadpool(_status_etag, app_name, app_id, run == "true")
+
+    deadline = time.monotonic() + min(wait, Config.STATUS_MAX_WAIT)
+    while etag in known and time.monotonic() < deadline:
+        await asyncio.sleep(Config.STATUS_POLL_INTERVAL)
+        etag = await run_in_threadpool(_status_etag, app_name, app_id, run == "true")
+
+    if etag in known:
+        return Response(status_code=304, headers={"ETag": etag})
+
     if not app_data:
-        return HTTPException(status_code=404, detail="App not found")
+        app_data = await run_in_threadpool(App.get, app_id)
+        if not app_data:
+            return HTTPException(status_code=404, detail="App not found")
 
-    data = get_app_status(app_data.name)
+    response.headers["ETag"] = etag
+
+    data = await run_in_threadpool(get_app_status, app_data.name)
 
     if run == "true":
-        logs = container_logs(app_data.name)
+        logs = await run_in_threadpool(container_logs, app_data.name)
         if logs is None:
             return HTTPException(status_code=404, detail="App not running")
         
         data["logs"] = logs
         
-    app_data = NEW_DB_CONN().get(app_id, {})
+    app_data = await run_in_threadpool(get_build_logs, app_id)
 
     if all == "true":
         builds = list(app_data.values())
@@ -239,3 +454,136 @@ async def app_status(app_id: str, build_id: str = "", all: str = "false", run: s
         data["build"] = app_data.get(build_id, {})
     
     return data
+
+@service_router.get("/services/apps/{app_id}/stats")
+async def app_stats(app_id: str):
+    """
+    Get the cpu, memory and network usage of an application, at 10s, 1m
+    and 1h resolutions, with its limits
+
+    Args:
+        app_id (str): The ID of the application
+
+    Returns:
+        dict: `fields` of the points, the `series` of each resolution and the `limits`
+    """
+    app_data = App.get(app_id)
+
+    if not app_data:
+        raise HTTPException(status_code=404, detail="App not found")
+
+    stats = await run_in_threadpool(get_stats, app_data.name)
+    return {**stats, "limits": await run_in_threadpool(get_resources, app_data.name)}
+
+
+@service_router.get("/services/warmup")
+async def warmup():
+    """
+    Get the state of the runtime images on every node: pull progress,
+    image ids and how old they are
+
+    Returns:
+        dict: Records keyed by `<node>/<image>`
+    """
+    return await run_in_threadpool(warmup_report)
+
+
+@service_router.get("/services/gc")
+async def gc():
+    """
+    Get the last garbage collections: what was removed, the bytes
+    reclaimed and how long they took
+
+    Returns:
+        dict: `last` collection and the `history` of collections
+    """
+    return await run_in_threadpool(gc_report)
+
+@service_router.post("/services/gc")
+async def collect_garbage(background_tasks: BackgroundTasks):
+    """
+    Collects garbage now, in the background
+
+    Returns:
+        dict: The last garbage collections
+    """
+    background_tasks.add_task(run_gc)
+    return await run_in_threadpool(gc_report)
+
+
+def _bulk_apps(bulk_data):
+    """
+    Fetches the apps of a bulk request in one query
+
+    Returns:
+        (list, list): Tuple of (apps, IDs of the requested apps that don't exist)
+    """
+    if bulk_data.user_id:
+        return App.get_all_by("user_id", bulk_data.user_id), []
+
+    if not bulk_data.app_ids:
+        raise HTTPException(status_code=400, detail="Either app_ids or user_id is required")
+
+    apps = App.get_many(bulk_data.app_ids)
+    found = {str(app_data.app_id) for app_data in apps}
+    return apps, [app_id for app_id in bulk_data.app_ids if app_id not in found]
+
+@service_router.post("/services/bulk/status")
+async def bulk_status(bulk_data: BulkItem):
+    """
+    Get the status of many applications at once
+
+    Args:
+        bulk_data (BulkItem): The IDs of the applications, or their user ID
+
+    Returns:
+        dict: Status of each application, keyed by app ID
+    """
+    apps, missing = _bulk_apps(bulk_data)
+    statuses = await run_in_threadpool(get_apps_status, [app_data.name for app_data in apps])
+
+    return {
+        **{app_id: {"message": "App not found", "status": "not-found"} for app_id in missing},
+        **{str(app_data.app_id): {"name": app_data.name, **statuses[app_data.name]} 
+            for app_data in apps}
+    }
+
+@service_router.post("/services/bulk/{action}")
+async def bulk_action(action: str, bulk_data: BulkItem, background_tasks: BackgroundTasks):
+    """
+    Stop, restart or run many applications, a few at a time
+
+    Args:
+        action (str): `stop`, `restart` or `run`
+        bulk_data (BulkItem): The IDs of the applications, or their user ID
+
+    Returns:
+        dict: The bulk job, poll `/services/bulk/jobs/{job_id}` for the results
+    """
+    if action not in ACTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown action `{action}`")
+
+    apps, missing = _bulk_apps(bulk_data)
+    logger.info("Bulk %s of %s apps", action, len(apps))
+
+    job = await run_in_threadpool(create_bulk_job, action, apps, missing)
+    background_tasks.add_task(run_bulk_job, job["job_id"], apps)
+    return job
+
+@service_router.get("/services/bulk/jobs/{job_id}")
+async def bulk_job(job_id: str):
+    """
+    Get a bulk job with the result of each application so far
+
+    Args:
+        job_id (str): The ID of the bulk job
+
+    Returns:
+        dict: The bulk job
+    """
+    job = await run_in_threadpool(get_bulk_job, job_id)
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job
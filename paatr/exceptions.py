@@ -7,6 +7,10 @@ __all__ = [
     "MethodNotAllowed",
     "InternalError",
     "UnexpectedError",
+    "InsufficientResources",
+    "PortsExhausted",
+    "ConfigError",
+    "BuildCancelled",
 ]
 
 class FactoryAppException(Exception):
@@ -19,6 +23,42 @@ class UnexpectedError(Exception):
         super().__init__("Unexpected Error")
 
 
+class InsufficientResources(Exception):
+    """Node doesn't have enough resources to start a container."""
+
+    def __init__(self, requested: int, available: int):
+        super().__init__(
+            f"Not enough memory on node: requested {requested} bytes,"
+            f" but only {available} bytes are available."
+        )
+
+
+class PortsExhausted(Exception):
+    """No host port is left to publish a replica of an app on."""
+
+    def __init__(self, first: int, last: int):
+        super().__init__(
+            f"No host port left to publish the app on: ports {first} to {last} are all taken,"
+            f" raise HOST_PORT_MAX or stop some apps."
+        )
+
+
+class ConfigError(Exception):
+    """Invalid app config file, with the location of the problem."""
+
+    def __init__(self, message: str, line: Optional[int] = None, column: Optional[int] = None,
+                    filename: str = "paatr.yaml"):
+        self.message = message
+        self.line = line
+        self.column = column
+        location = f":{line}:{column}" if line else ""
+        super().__init__(f"{filename}{location}: {message}")
+
+
+class BuildCancelled(Exception):
+    """Build was cancelled by the user, or ran past one of its timeouts."""
+
+
 class RequestError(Exception):
     """Request Error - basic class."""
 
@@ -1,6 +1,12 @@
 from fastapi import FastAPI
 from .endpoints import service_router
 from .helpers import handle_errors
+from .hibernation import start_idle_detector
+from .supervisor import start_supervisor
+from .warmup import start_warmup
+from .cleanup import start_gc
+from .stats import start_stats_sampler
+from .jobs import start_job_recovery
 from fastapi.middleware.cors import CORSMiddleware
 
 
@@ -19,4 +25,10 @@ def create_app():
     # Register the routers
     app.include_router(service_router)
     app.exception_handler(Exception)(handle_errors)
+    app.add_event_handler("startup", start_idle_detector)
+    app.add_event_handler("startup", start_supervisor)
+    app.add_event_handler("startup", start_warmup)
+    app.add_event_handler("startup", start_gc)
+    app.add_event_handler("startup", start_stats_sampler)
+    app.add_event_handler("startup", start_job_recovery)
     return app
\ No newline at end of file
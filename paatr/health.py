@@ -0,0 +1,109 @@
+import asyncio
+import json
+import time
+
+import httpx
+
+from . import Config
+
+# Kinds of health checks an app can declare in its `paatr.yaml`
+HEALTH_CHECK_TYPES = ("tcp", "http")
+
+# How long a tcp probe waits for the connection to be dropped, see `probe_tcp`
+TCP_SETTLE_TIME = 0.2
+
+
+def health_check(labels):
+    """
+    Get the health check of an app from its image labels, apps built
+    without one (e.g from a dockerfile) get a tcp check
+
+    Args:
+        labels (dict): Labels of the app image
+
+    Returns:
+        dict: `type`, `path`, `timeout`, `interval` and `start_period` of the check
+    """
+    return {
+        "type": "tcp",
+        "path": "/",
+        "timeout": Config.HEALTH_TIMEOUT,
+        "interval": Config.HEALTH_INTERVAL,
+        "start_period": Config.HEALTH_START_PERIOD,
+        **json.loads(labels.get("paatr.health") or "{}")
+    }
+
+async def probe_tcp(host, port, timeout):
+    """
+    Checks that a replica accepts connections. Docker accepts connections on
+    published ports before the app listens and drops them right away, so a
+    connection dropped without a reply doesn't count.
+
+    Returns:
+        (bool, str): Tuple of (passed, message)
+    """
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+
+    try:
+        if await asyncio.wait_for(reader.read(1), TCP_SETTLE_TIME) == b"":
+            return False, "Connection closed by the app"
+    except asyncio.TimeoutError:
+        # Still connected, the app waits for us to speak first
+        pass
+    finally:
+        writer.close()
+
+    return True, "Accepting connections"
+
+async def probe_http(client, host, port, path, timeout):
+    """
+    Checks that a replica answers `GET path` with a 2xx or 3xx status
+
+    Returns:
+        (bool, str): Tuple of (passed, message)
+    """
+    response = await client.get(f"http://{host}:{port}{path}", timeout=timeout)
+    return response.status_code < 400, f"GET {path} returned {response.status_code}"
+
+async def _wait_for_replica(client, host, port, check, deadline):
+    message = "Not probed"
+
+    while True:
+        try:
+            if check["type"] == "http":
+                passed, message = await probe_http(client, host, port, check["path"], check["timeout"])
+            else:
+                passed, message = await probe_tcp(host, port, check["timeout"])
+        except (OSError, asyncio.TimeoutError, httpx.HTTPError) as e:
+            passed, message = False, f"{type(e).__name__}: {e}".rstrip(": ")
+
+        if passed or time.monotonic() + check["interval"] > deadline:
+            return passed, message
+
+        await asyncio.sleep(check["interval"])
+
+async def _wait_until_ready(targets, check):
+    deadline = time.monotonic() + check["start_period"]
+
+    async with httpx.AsyncClient() as client:
+        results = await asyncio.gather(*(_wait_for_replica(client, host, port, check, deadline)
+                                            for host, port in targets.values()))
+
+    return dict(zip(targets, results))
+
+def wait_until_ready(targets, check):
+    """
+    Probes replicas concurrently until each passes the health check once,
+    or `start_period` seconds went by
+
+    Args:
+        targets (dict): `(host, port)` of the replicas, keyed by replica index
+        check (dict): The health check, see `health_check`
+
+    Returns:
+        dict: `(passed, message)` of the last probe of each replica
+    """
+    if not targets:
+        return {}
+
+    return asyncio.run(_wait_until_ready(targets, check))
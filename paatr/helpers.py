@@ -1,20 +1,36 @@
+import json
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 import re
+import subprocess
 import tempfile
-import yaml
+import time
+from functools import partial
+from urllib.parse import urlsplit
 
 from docker.errors import ImageNotFound, NotFound, BuildError
 from fastapi import Request
 from fastapi.responses import JSONResponse
 from git import Repo
 from nginxparser_eb import dumps as nginx_dumps
-from nginxparser_eb import load as nginx_load
+from nginxparser_eb import loads as nginx_loads
 from nginxparser_eb import UnspacedList
 
-from . import (APP_CONFIG_FILE, CONFIG_KEYS_X, CONFIG_KEYS, 
-                CONFIG_VALUE_VALIDATOR, DOCKER_TEMPLATE, DOCKER_CLIENT, 
-                BUILD_LOGS_TABLE, INSTALLATION_FILE, DEFAULT_PORT, PYTHON_RUNTIMES, Config)
+from . import (APP_CONFIG_FILE, DOCKER_TEMPLATE, 
+                BUILD_LOGS_TABLE, BUILD_QUEUE_TABLE, HIBERNATION_TABLE, SCALE_TABLE, 
+                SUPERVISOR_TABLE, EXPECTED_STOPS_TABLE, VERSIONS_TABLE, PLACEMENTS_TABLE, HEALTH_TABLE,
+                INSTALLATION_FILE, DEFAULT_PORT, PYTHON_RUNTIMES, DEFAULT_RESOURCES,
+                Config, logger)
+from .exceptions import BuildCancelled, ConfigError, InsufficientResources, PortsExhausted
+from .health import health_check, wait_until_ready
+from .journal import finish_job, record_job, running_job
+from .watchdog import BuildWatchdog, clear_cancel, docker_build, follow, request_cancel
+from .schema import build_fingerprint, load_config, parse_memory
+from .warmup import base_image, base_image_id, ensure_base_image
+from .nodes import (NODE_ERRORS, NODES, allocate_port, app_node, app_nodes, default_node, get_node, get_port,
+                    healthy_nodes, place_replica, record_port, replica_node, unplace_replica)
+from .coordination import (app_lock, locked_table, open_table, read_table, update_table, 
+                            enqueue_build, drain_builds)
 
 APP_NAME_REGEX = re.compile(r"^[a-zA-Z]([a-zA-Z0-9_-]{3,20})$")
 
@@ -44,56 +60,40 @@ def get_app_config(config_path):
         config_path (str): Path to the app `paatr.yaml` config file
     
     Returns:
-        (bool, dict): Tuple of (success, config)
+        (bool, dict): Tuple of (success, config), the error message with
+            its line and column on failure
     """
-
-    with open(config_path, "r") as fp:
-        config = yaml.safe_load(fp)
-    
-    if not config:
-        return False, f"Invalid `{APP_CONFIG_FILE}` file"
-    
-    for key in CONFIG_KEYS_X:
-        if key not in config:
-            return False, f"Missing `{key}` key in {APP_CONFIG_FILE}"
-
-        if not CONFIG_VALUE_VALIDATOR[key](config[key]):
-            return False, f"Invalid value for `{key}` key in {APP_CONFIG_FILE}"
-
-    for k,v in config.items():
-        if k not in CONFIG_KEYS:
-            return False, f"Invalid key `{k}` in {APP_CONFIG_FILE}"
-        
-        if k in CONFIG_KEYS_X:
-            if not v:
-                return False, f"Invalid value for `{k}` in {APP_CONFIG_FILE}"
-
-    if config["runtime"] not in PYTHON_RUNTIMES:
-        return False, f"Unknown runtime `{config['runtime']}`"
+    try:
+        config, _ = load_config(config_path)
+    except ConfigError as e:
+        return False, str(e)
 
     config["runtime"] = PYTHON_RUNTIMES[config["runtime"]]
-    config["port"] = DEFAULT_PORT
     return True, config
 
 def generate_docker_config(config):
-    run = config.pop("run")
-    if type(run) == list:
-        run = " && ".join(run)
+    run = " && ".join(config["run"])
+    env = "\n".join(f"ENV {name}={json.dumps(str(value))}" for name, value in config["env"].items())
 
-    return DOCKER_TEMPLATE.format(**config, run=f"RUN {run}", app_name=config["name"])
+    return DOCKER_TEMPLATE.format(runtime=config["runtime"], app_name=config["name"], 
+                                    run=f"RUN {run}" if run else "", env=env, 
+                                    port=config["port"], web=config["web"])
 
 
 def _add_build_log(build_id, app_id, log, state="building", log_type="build"):
-    with BUILD_LOGS_TABLE as logs_db:
+    _add_build_logs(build_id, app_id, [log], state, log_type)
+
+def _add_build_logs(build_id, app_id, logs, state="building", log_type="build"):
+    """Appends several lines to a build record, in one write"""
+    with locked_table(BUILD_LOGS_TABLE, app_id) as logs_db:
         app_data = logs_db.get(app_id, dict())
         build_data = app_data.get(build_id, dict())
-        app_logs = build_data.get("logs", [])
-        app_logs.append(log)
+        app_logs = build_data.get("logs", []) + logs
 
         if "created_at" not in build_data:
             build_data["created_at"] = datetime.utcnow().isoformat()
             
-        BUILD_LOGS_TABLE[app_id] = {
+        logs_db[app_id] = {
             **app_data,
             build_id: {
                 **build_data,
@@ -104,6 +104,193 @@ def _add_build_log(build_id, app_id, log, state="building", log_type="build"):
             }
         }
 
+    bump_version(f"build:{app_id}")
+
+def bump_version(key):
+    """
+    Increments the version of a piece of state, which tells status
+    pollers (see `get_status_version`) something changed
+
+    Args:
+        key (str): `build:<app_id>` for build records, `app:<app_name>` for containers
+    """
+    update_table(VERSIONS_TABLE, key, lambda version: version + 1, default=0)
+
+def touch_app(app_name):
+    """Bumps the version of an app once its containers (or image) changed"""
+    bump_version(f"app:{app_name}")
+
+def get_status_version(app_name, app_id):
+    """
+    Get the version of everything the status of an app is made of
+
+    Args:
+        app_name (str): Name of the app
+        app_id (str): ID of the app
+
+    Returns:
+        (int, int): Tuple of (build records version, app version)
+    """
+    with open_table(VERSIONS_TABLE) as db:
+        return db.get(f"build:{app_id}", 0), db.get(f"app:{app_name}", 0)
+
+def remember_app_name(app_id, app_name):
+    """Records the name of an app, so its status version can be read from its ID alone"""
+    if read_table(VERSIONS_TABLE, f"name:{app_id}") != app_name:
+        update_table(VERSIONS_TABLE, f"name:{app_id}", lambda _: app_name)
+
+def known_app_name(app_id):
+    """Get the name recorded by `remember_app_name`, None if there is none"""
+    return read_table(VERSIONS_TABLE, f"name:{app_id}")
+
+def get_build_logs(app_id):
+    """
+    Get the build and run records of an app
+
+    Args:
+        app_id (str): ID of the app
+    
+    Returns:
+        dict: Records keyed by build/run ID
+    """
+    return read_table(BUILD_LOGS_TABLE, app_id, {})
+
+def _credentials_path(build_id):
+    return os.path.join(Config.STATE_DIR, "credentials", build_id)
+
+def _save_credentials(build_id, git_url):
+    """
+    Keeps the credentials of a git url out of the shared tables, in a file
+    only the api user can read, until the build is done
+
+    Returns:
+        str: The url without its credentials
+    """
+    url = urlsplit(git_url)
+    if not (url.username or url.password):
+        return git_url
+
+    os.makedirs(os.path.dirname(_credentials_path(build_id)), mode=0o700, exist_ok=True)
+    fd = os.open(_credentials_path(build_id), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(git_url)
+
+    return url._replace(netloc=url.netloc.rsplit("@", 1)[1]).geturl()
+
+def _load_credentials(build_id, git_url):
+    """The git url of a build with its credentials, `git_url` if it had none"""
+    try:
+        with open(_credentials_path(build_id)) as f:
+            return f.read()
+    except FileNotFoundError:
+        return git_url
+
+def _forget_credentials(build_id):
+    try:
+        os.remove(_credentials_path(build_id))
+    except FileNotFoundError:
+        pass
+
+def queue_build(build_id, git_url, app_name, app_id, repo_url):
+    """
+    Queues a build in the shared build queue. Only one build per app runs
+    at a time, whichever worker holds the app build lock runs the queue.
+    Credentials in `git_url` aren't queued, they are kept aside until the
+    build is done (see `_save_credentials`).
+
+    Args:
+        build_id (str): Unique ID for the build
+        git_url (str): URL of the git repository
+        app_name (str): Name of the app
+        app_id (str): ID of the app
+        repo_url (str): Public URL of the repository (used in logs)
+    """
+    job = {
+        "build_id": build_id,
+        "git_url": _save_credentials(build_id, git_url),
+        "app_name": app_name,
+        "app_id": app_id,
+        "repo_url": repo_url
+    }
+
+    _add_build_log(build_id, app_id, "Queued build", "queued")
+    record_job(build_id, "build", app_id, job)
+    enqueue_build(BUILD_QUEUE_TABLE, app_id, job)
+
+def cancel_build(app_id, build_id):
+    """
+    Cancels a build. Queued builds are dropped from the queue straight
+    away, running ones stop at their next check (see `paatr.watchdog`).
+
+    Args:
+        app_id (str): ID of the app
+        build_id (str): ID of the build
+
+    Returns:
+        str: `cancelled`, `cancelling`, or the state of a finished build. None if there is no such build
+    """
+    record = get_build_logs(app_id).get(build_id)
+    if not record or record.get("type", "build") != "build":
+        return None
+
+    if record["status"] == "queued":
+        with locked_table(BUILD_QUEUE_TABLE, app_id) as db:
+            queue = db.get(app_id, [])
+            remaining = [job for job in queue if job["build_id"] != build_id]
+            db[app_id] = remaining
+
+        if len(remaining) < len(queue):
+            _add_build_log(build_id, app_id, "Build cancelled before it started", "cancelled")
+            finish_job(build_id, "cancelled")
+            _forget_credentials(build_id)
+            return "cancelled"
+    elif record["status"] != "building":
+        return record["status"]
+
+    # Running, or popped off the queue while we looked
+    request_cancel(build_id)
+    return "cancelling"
+
+def run_build_queue(app_id):
+    """Runs the queued builds of an app if no other worker is doing so"""
+    drain_builds(BUILD_QUEUE_TABLE, app_id, _run_journaled_build)
+
+def _run_journaled_build(**job):
+    with running_job(job["build_id"]) as result:
+        result["error"] = build_app(**job)
+
+        # A cancelled build returns why, it didn't fail
+        record = get_build_logs(job["app_id"]).get(job["build_id"], {})
+        if record.get("status") == "cancelled":
+            result["status"] = "cancelled"
+
+def clone_repo(git_url, app_dir, watchdog):
+    """
+    Clones a git repository, killing git if the build is cancelled
+
+    Args:
+        git_url (str): URL of the git repository
+        app_dir (str): Directory to clone into
+        watchdog (BuildWatchdog): Watchdog of the build
+
+    Returns:
+        git.Repo: The cloned repository, None if git failed
+
+    Raises:
+        BuildCancelled: If the build was cancelled meanwhile
+    """
+    # Never wait for credentials on a terminal nobody reads
+    proc = subprocess.Popen(["git", "clone", "--progress", git_url, app_dir], 
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            env={**os.environ, "GIT_TERMINAL_PROMPT": "0"})
+
+    with proc:
+        # Progress counts as output for the idle timeout
+        for _ in follow(iter(partial(proc.stderr.read1, 4096), b""), watchdog, proc.kill):
+            pass
+
+    return Repo(app_dir) if proc.returncode == 0 else None
+
 def build_app(build_id, git_url, app_name, app_id, repo_url):
     """
     Builds an app from a git repository and generates 
@@ -116,65 +303,99 @@ def build_app(build_id, git_url, app_name, app_id, repo_url):
     Returns:
         str: Build message
     """
-    global APP_CONFIG_FILE
+    watchdog = BuildWatchdog(build_id)
 
     try:
+        watchdog.check(force=True)
+
         with tempfile.TemporaryDirectory() as tmp_dir:
             app_dir = os.path.join(tmp_dir, app_name)
             _add_build_log(build_id, app_id, f"Cloning {repo_url} ")
             try:
-                repo = Repo.clone_from(url=git_url, to_path=app_dir)
+                repo = clone_repo(_load_credentials(build_id, git_url), app_dir, watchdog)
+            except BuildCancelled:
+                raise
             except Exception as e:
+                repo = None
+
+            if not repo:
                 _add_build_log(build_id, app_id, f"Error cloning {repo_url}", "failed")
                 return f"Error cloning {repo_url}"
 
-            files = list(map(lambda x:x.lower(), os.listdir(app_dir)))
-            dockerfile = "dockerfile"
+            files = {name.lower(): name for name in os.listdir(app_dir)}
+            commit = repo.head.commit.hexsha
 
-            if APP_CONFIG_FILE not in files:
-                if dockerfile in files:
-                    APP_CONFIG_FILE = dockerfile
-                else:
-                    _add_build_log(build_id, app_id, f"Missing {APP_CONFIG_FILE} file", "failed")
-                    return "Missing paatr.yaml file"
-            
-            if APP_CONFIG_FILE != dockerfile:
-                (is_valid, config) = get_app_config(os.path.join(app_dir, APP_CONFIG_FILE))
-            else:
-                is_valid = True
-                config = {}
+            if APP_CONFIG_FILE in files:
+                (is_valid, config) = get_app_config(os.path.join(app_dir, files[APP_CONFIG_FILE]))
 
-            if not is_valid:
-                _add_build_log(build_id, app_id, config, "failed")
-                return
-            else:
-                _add_build_log(build_id, app_id, "Successfully parsed config file")
+                if not is_valid:
+                    _add_build_log(build_id, app_id, config, "failed")
+                    return config
+                else:
+                    _add_build_log(build_id, app_id, "Successfully parsed config file")
 
-            if INSTALLATION_FILE in files and APP_CONFIG_FILE != dockerfile:
-                _add_build_log(build_id, app_id, f"Adding installation file `{INSTALLATION_FILE}`")
-                config["run"] = [f"pip install -r {INSTALLATION_FILE}"]
-                _add_build_log(build_id, app_id, "Successfully added installation file")
+                if INSTALLATION_FILE in files:
+                    _add_build_log(build_id, app_id, f"Adding installation file `{INSTALLATION_FILE}`")
+                    config["run"] = [f"pip install -r {files[INSTALLATION_FILE]}"] + config["run"]
+                    _add_build_log(build_id, app_id, "Successfully added installation file")
 
-            if APP_CONFIG_FILE != dockerfile:
                 config["name"] = app_name
+                config["runtime"] = base_image(config["runtime"])
                 dockerfile = generate_docker_config(config)
 
                 with open(os.path.join(tmp_dir, "dockerfile"), "w") as fp:
                     fp.write(dockerfile)
 
+                build_dir, dockerfile_name = tmp_dir, "dockerfile"
                 _add_build_log(build_id, app_id, "Installing dependencies...")
-            else:
+            elif "dockerfile" in files:
+                config, dockerfile = {}, None
+                build_dir, dockerfile_name = app_dir, files["dockerfile"]
                 _add_build_log(build_id, app_id, "Using configuration from dockerfile...")
-
-            image, _ = build_docker_image(build_id, tmp_dir, app_name, app_id)
+            else:
+                _add_build_log(build_id, app_id, f"Missing {APP_CONFIG_FILE} file", "failed")
+                return "Missing paatr.yaml file"
+
+            # A base image pulled since the last build invalidates its image
+            base_id = base_image_id(app_node(app_name), config["runtime"]) if "runtime" in config else None
+            resources = {**DEFAULT_RESOURCES, "memory": parse_memory(DEFAULT_RESOURCES["memory"]), **config}
+            labels = {
+                "paatr.app": app_name, 
+                "paatr.app_id": str(app_id),
+                "paatr.replicas": str(config.get("replicas", 1)),
+                "paatr.cpu": str(resources["cpu"]),
+                "paatr.memory": str(resources["memory"]),
+                "paatr.pids": str(resources["pids"]),
+                "paatr.container_port": str(config.get("port", DEFAULT_PORT)),
+                "paatr.fingerprint": build_fingerprint(commit, config, dockerfile, base_id)
+            }
+            if "runtime" in config:
+                labels["paatr.base"] = config["runtime"]
+            if "health" in config:
+                labels["paatr.health"] = json.dumps(config["health"])
+            image, _ = build_docker_image(build_id, build_dir, app_name, app_id, labels, 
+                                            dockerfile=dockerfile_name, 
+                                            cache=config.get("build", {}).get("cache", True),
+                                            watchdog=watchdog)
 
         _add_build_log(build_id, app_id, "Successfully built image", "success")
         return 
 
+    except BuildCancelled as e:
+        # The temporary directory is gone and docker removed the intermediate containers
+        _add_build_log(build_id, app_id, str(e), "cancelled")
+        return str(e)
     except BuildError as e:
-        for line in e.build_log:
-            if 'stream' in line:
-                _add_build_log(build_id, app_id, line['stream'].strip(), "failed")
+        _add_build_log(build_id, app_id, e.msg, "failed")
+    except InsufficientResources as e:
+        _add_build_log(build_id, app_id, str(e), "failed")
+    except Exception:
+        # Anything else (e.g docker failing to pull the base image) must
+        # not leave the build record `building`
+        logger.exception("Build %s of app %s failed", build_id, app_name)
+    finally:
+        clear_cancel(build_id)
+        _forget_credentials(build_id)
 
     _add_build_log(build_id, app_id, "Failed to build image", "failed")
     return "Failed to build app"
@@ -183,31 +404,106 @@ def build_app(build_id, git_url, app_name, app_id, repo_url):
 # Docker related functions                                        #
 ###################################################################
 
-def build_docker_image(build_id, app_dir, app_name, app_id=""):
+def docker_timestamp(value):
+    """
+    Get the Unix timestamp of a date reported by docker
+
+    Args:
+        value (str): e.g `2022-09-01T00:00:00.123456789Z`
+
+    Returns:
+        float: The timestamp, 0 for docker's zero date (or no date)
+    """
+    # Docker reports nanoseconds, which `fromisoformat` doesn't handle
+    if not value or value.startswith("0001-"):
+        return 0
+    return datetime.fromisoformat(value[:19]).replace(tzinfo=timezone.utc).timestamp()
+
+def build_docker_image(build_id, app_dir, app_name, app_id="", labels=None, dockerfile=None, cache=True,
+                        watchdog=None):
     """
-    Build docker image from app directory
+    Build docker image from app directory. If the app image was built from
+    the same sources (see `paatr.schema.build_fingerprint`) it is reused.
 
     Args:
         app_dir (str): Path to app directory
         app_name (str): Name of the app
+        labels (dict, optional): Labels of the image, used to carry the
+            app run settings (e.g `paatr.replicas`). Defaults to None.
+        dockerfile (str, optional): Dockerfile in `app_dir`. Defaults to None.
+        cache (bool, optional): Reuse the image and the build cache. Defaults to True.
+        watchdog (BuildWatchdog, optional): Cancels the build on its timeouts
+            and cancel requests. Defaults to a new one.
     
     Returns:
         (docker.models.images.Image, str): Docker image object and build logs
+
+    Raises:
+        BuildError: If docker failed to build the image
+        BuildCancelled: If the build was cancelled
     """
     
-    stop_container(app_name)
-    remove_container(app_name)
-    remove_image(get_image(app_name))
-    image, logs = DOCKER_CLIENT.images.build(path=app_dir, tag=app_name, rm=True)
-
-    for line in logs:
-        if "stream" in line:
-            line_str = line["stream"].strip()
-            # if line_str.startswith("Step ") or line_str.startswith("--->"):
-            #    continue
-            if line_str.strip():
-                _add_build_log(build_id, app_id, line_str)
-    
+    labels = labels or {}
+    watchdog = watchdog or BuildWatchdog(build_id)
+
+    current = get_image(app_name)
+    fingerprint = labels.get("paatr.fingerprint")
+    if cache and fingerprint and current and current.labels.get("paatr.fingerprint") == fingerprint:
+        _add_build_log(build_id, app_id, "Nothing changed since the last build, reusing its image")
+        current.tag(app_name, tag=f"build-{build_id}")
+        return current, []
+
+    # The image is built where the first replica runs
+    if not (node := replica_node(app_name, 0)):
+        with app_lock("admission"):
+            node = place_replica(app_name, 0, int(labels.get("paatr.memory", 0)), 
+                                    float(labels.get("paatr.cpu", 0)))
+
+    if "paatr.base" in labels:
+        ensure_base_image(node, labels["paatr.base"])
+    watchdog.check(force=True)
+
+    # Built untagged, the app keeps running its current image meanwhile
+    stream, interrupt = docker_build(node.client.api, app_dir, None, dockerfile=dockerfile, 
+                                        labels=labels, nocache=not cache)
+    logs, image_id = [], None
+    # Lines not written to the build record yet
+    pending, flushed_at = [], time.monotonic()
+    try:
+        for line in follow(stream, watchdog, interrupt):
+            logs.append(line)
+            if "error" in line:
+                raise BuildError(line["error"], logs)
+            if "aux" in line and "ID" in line["aux"]:
+                image_id = line["aux"]["ID"]
+            if "stream" in line:
+                line_str = line["stream"].strip()
+                if line_str:
+                    pending.append(line_str)
+                if match := re.search(r"Successfully built ([0-9a-f]+)", line_str):
+                    image_id = image_id or match.group(1)
+
+            if pending and time.monotonic() - flushed_at >= Config.BUILD_LOG_FLUSH_INTERVAL:
+                _add_build_logs(build_id, app_id, pending)
+                pending, flushed_at = [], time.monotonic()
+    finally:
+        if pending:
+            _add_build_logs(build_id, app_id, pending)
+
+    if not image_id:
+        raise BuildError("Unknown problem", logs)
+
+    image = node.client.images.get(image_id)
+
+    with app_lock(f"{app_name}.container"):
+        stop_container(app_name)
+        remove_container(app_name)
+
+        image.tag(app_name, tag="latest")
+        # Previous builds keep their own tag until `paatr.cleanup` prunes them
+        image.tag(app_name, tag=f"build-{build_id}")
+
+    touch_app(app_name)
     return image, logs
 
 def get_app_status(app_name):
@@ -226,43 +522,386 @@ def get_app_status(app_name):
 
     container = get_container(app_name)
     if container:
+        replicas = {
+            "desired": get_replicas(app_name),
+            "running": len([c for c in app_containers(app_name) if c.status == "running"])
+        }
+
         if container.status == "running":
-            status = "running"
-            message = "App is running"
-        else:
-            status = "stopped"
-            message = "App is not running"
-    
-        return {"message": message, "status": status}
+            return _app_status(container.status, replicas, health=get_health(app_name))
+
+        return _app_status(container.status, replicas, get_hibernation(app_name), get_crashes(app_name))
         
     return {"message": "App is not running", "status": "not-running"}
 
-def get_image(app_name):
+def _app_status(status, replicas, hibernation=None, crashes=None, health=None):
+    """Status of a built app whose first replica container is in `status`"""
+    if status == "running":
+        # Apps run before health checks existed have no health record
+        if not health:
+            return {"message": "App is running", "status": "running", "replicas": replicas}
+        elif health["state"] == "starting":
+            return {"message": "App is starting, waiting for its health check", 
+                    "status": "starting", "health": health, "replicas": replicas}
+        elif health["state"] == "unhealthy":
+            return {"message": "App is running but failed its health check, check the logs", 
+                    "status": "unhealthy", "health": health, "replicas": replicas}
+
+        return {"message": "App is running", "status": "running", "health": health, "replicas": replicas}
+    elif hibernation:
+        return {"message": "App is hibernating and will wake on the next request", 
+                "status": "hibernated", "hibernation": hibernation, "replicas": replicas}
+    elif (crashes or {}).get("crash_loop"):
+        return {"message": "App keeps crashing and was not restarted, check the logs", 
+                "status": "crash-loop", "crashes": crashes, "replicas": replicas}
+
+    return {"message": "App is not running", "status": "stopped", "replicas": replicas}
+
+def get_apps_status(app_names):
+    """
+    Get the status of many apps at once, with one image and one container
+    listing per node and one read per state table
+
+    Args:
+        app_names (list): Names of the apps
+    
+    Returns:
+        dict: Status of each app, keyed by app name
+    """
+    wanted = set(app_names)
+    images = {name: {} for name in wanted}
+    containers = {name: [] for name in wanted}
+
+    unreachable = {node.name for node in NODES.values() if not node.healthy}
+    for node in healthy_nodes():
+        try:
+            listed_images, listed_containers = node.client.api.images(), node.client.api.containers(all=True)
+        except NODE_ERRORS as e:
+            node.mark_unhealthy(e)
+            unreachable.add(node.name)
+            continue
+
+        for image in listed_images:
+            for tag in image.get("RepoTags") or []:
+                name, _, version = tag.rpartition(":")
+                if name in wanted and version == "latest":
+                    images[name][node.name] = image.get("Labels") or {}
+
+        for cont in listed_containers:
+            # Containers started before replicas existed aren't labelled
+            name = cont["Names"][0].lstrip("/")
+            app_name = (cont.get("Labels") or {}).get("paatr.app", name)
+            if app_name in wanted:
+                containers[app_name].append({"name": name, "status": cont["State"]})
+
+    tables = {}
+    for table in (PLACEMENTS_TABLE, SCALE_TABLE, HIBERNATION_TABLE, SUPERVISOR_TABLE, HEALTH_TABLE):
+        with open_table(table) as db:
+            tables[table] = {name: db.get(name) for name in wanted}
+
+    statuses = {}
+    for app_name in wanted:
+        build_node = get_node((tables[PLACEMENTS_TABLE][app_name] or {}).get(0)) or default_node()
+        if build_node.name in unreachable:
+            statuses[app_name] = {"message": f"Node {build_node.name} is unreachable", "status": "unknown"}
+            continue
+
+        labels = images[app_name].get(build_node.name)
+        if labels is None:
+            statuses[app_name] = {"message": "App has not been built", "status": "not-built"}
+            continue
+
+        first = next((c for c in containers[app_name] if c["name"] == app_name), None)
+        if not first:
+            statuses[app_name] = {"message": "App is not running", "status": "not-running"}
+            continue
+
+        replicas = {
+            "desired": tables[SCALE_TABLE][app_name] or int(labels.get("paatr.replicas", 1)),
+            "running": len([c for c in containers[app_name] if c["status"] == "running"])
+        }
+
+        hibernation = tables[HIBERNATION_TABLE][app_name] or {}
+        statuses[app_name] = _app_status(first["status"], replicas, 
+                                            hibernation if hibernation.get("hibernated_at") else None,
+                                            tables[SUPERVISOR_TABLE][app_name] or {},
+                                            tables[HEALTH_TABLE][app_name])
+
+    return statuses
+
+def replica_port(app_name, index):
+    """
+    Host port a replica of an app is published on (see `paatr.nodes.allocate_port`)
+
+    Args:
+        app_name (str): Name of the app
+        index (int): Replica index
+
+    Returns:
+        int: The port, None if the replica was never started
+    """
+    if port := get_port(app_name, index):
+        return port
+
+    # Containers started before ports were recorded carry theirs in a label
+    if (cont := get_container(app_name, index)) and "paatr.port" in cont.labels:
+        port = int(cont.labels["paatr.port"])
+        record_port(app_name, index, port)
+        return port
+
+    return None
+
+def replica_name(app_name, index):
+    """Container name of a replica, the first replica keeps the app name"""
+    # App names can't contain dots, so these never clash with another app
+    return app_name if index == 0 else f"{app_name}.{index}"
+
+def get_replicas(app_name):
+    """
+    Get the number of replicas an app should run, set through the scale
+    api or else the `replicas` key of its `paatr.yaml`
+
+    Args:
+        app_name (str): Name of the app
+    
+    Returns:
+        int: Number of replicas
+    """
+    if replicas := read_table(SCALE_TABLE, app_name):
+        return replicas
+
+    if image := get_image(app_name):
+        return int(image.labels.get("paatr.replicas", 1))
+
+    return 1
+
+def get_resources(app_name):
+    """
+    Get the resource limits of an app containers
+
+    Args:
+        app_name (str): Name of the app
+    
+    Returns:
+        dict: `cpu` (cores), `memory` (bytes) and `pids` limits
+    """
+    image = get_image(app_name)
+    labels = image.labels if image else {}
+
+    return {
+        "cpu": float(labels.get("paatr.cpu", DEFAULT_RESOURCES["cpu"])),
+        "memory": int(labels.get("paatr.memory", parse_memory(DEFAULT_RESOURCES["memory"]))),
+        "pids": int(labels.get("paatr.pids", DEFAULT_RESOURCES["pids"]))
+    }
+
+def get_container_port(app_name):
+    """Port the app listens on inside its containers, the `port` of its `paatr.yaml`"""
+    image = get_image(app_name)
+    return int(image.labels.get("paatr.container_port", DEFAULT_PORT)) if image else DEFAULT_PORT
+
+def start_container(cont):
+    """Starts a stopped container once it's admitted on its node"""
+    node = get_node(cont.labels.get("paatr.node")) or default_node()
+
+    with app_lock("admission"):
+        node.check_capacity(int(cont.labels.get("paatr.memory", 0)))
+        cont.start()
+
+    touch_app(cont.labels.get("paatr.app", cont.name))
+
+def get_image(app_name, node=None):
+    """
+    Get the image of an app
+
+    Args:
+        app_name (str): Name of the app
+        node (Node, optional): Node to look on. Defaults to the app build node.
+    """
+    node = node or app_node(app_name)
+
     try:
-        return DOCKER_CLIENT.images.get(app_name)
+        return node.client.images.get(app_name)
     except ImageNotFound:
         return None
 
-def remove_image(image):
-    try:
-        DOCKER_CLIENT.images.remove(image.id)
-    except Exception:
-        pass
+def _ensure_image(node, app_name):
+    """Copies the app image from its build node to `node` if it's missing or outdated"""
+    build_node = app_node(app_name)
+    if node is build_node:
+        return
+
+    image = get_image(app_name, build_node)
+    current = get_image(app_name, node)
+    if current and current.id == image.id:
+        return
+
+    # `named=True` exports the first tag only, docker sorts them so that's a `build-` one
+    node.client.images.load(image.save(named=f"{app_name}:latest"))
+
+def get_container(app_name, index=0):
+    """
+    Get the container of a replica of an app
+
+    Args:
+        app_name (str): Name of the app
+        index (int, optional): Replica index. Defaults to 0.
+    """
+    node = replica_node(app_name, index) or default_node()
 
-def get_container(app_name):
     try:
-        return DOCKER_CLIENT.containers.get(app_name)
+        return node.client.containers.get(replica_name(app_name, index))
     except NotFound:
         return None
 
+def app_containers(app_name):
+    """
+    Get the containers of all replicas of an app, on every node
+
+    Args:
+        app_name (str): Name of the app
+    
+    Returns:
+        list: Containers ordered by replica index
+    """
+    containers = []
+    for node in app_nodes(app_name):
+        containers += node.client.containers.list(all=True, filters={"label": f"paatr.app={app_name}"})
+
+    # Containers started before replicas existed aren't labelled
+    if not containers and (container := get_container(app_name)):
+        containers = [container]
+
+    return sorted(containers, key=lambda c: int(c.labels.get("paatr.replica", 0)))
+
+def expect_stop(cont):
+    """Tells the supervisor a container is stopped on purpose, not crashing"""
+    update_table(EXPECTED_STOPS_TABLE, cont.name, lambda _: time.time())
+
 def stop_container(app_name):
-    if cont := get_container(app_name):
+    for cont in app_containers(app_name):
+        expect_stop(cont)
         cont.stop()
 
+    touch_app(app_name)
+
 def remove_container(app_name):
-    if cont := get_container(app_name):
+    for cont in app_containers(app_name):
+        expect_stop(cont)
         cont.remove(force=True)
 
+    touch_app(app_name)
+
+def stop_docker_image(app_name):
+    """Stops an app on the user's request, it won't be woken up by traffic"""
+    with app_lock(f"{app_name}.container"):
+        clear_hibernation(app_name)
+        clear_crashes(app_name)
+        stop_container(app_name)
+
+def _start_replica(app_data, index):
+    app_name = app_data.name
+    name = replica_name(app_name, index)
+
+    if cont := get_container(app_name, index):
+        # Records the port of containers from before ports were recorded
+        replica_port(app_name, index)
+        if cont.status != "running":
+            start_container(cont)
+        return cont
+
+    # Replicas write their logs to their own directory
+    app_dir = os.path.join(Config.APP_FILES_DIR, app_name)
+    if index > 0:
+        app_dir = os.path.join(app_dir, f"replica-{index}")
+
+    if not os.path.exists(app_dir):
+        os.makedirs(app_dir)
+
+    resources = get_resources(app_name)
+    container_port = get_container_port(app_name)
+
+    with app_lock("admission"):
+        node = (replica_node(app_name, index) 
+                or place_replica(app_name, index, resources["memory"], resources["cpu"]))
+        port = allocate_port(app_name, index)
+
+    _ensure_image(node, app_name)
+
+    with app_lock("admission"):
+        node.check_capacity(resources["memory"])
+        cont = (node.client.containers
+                .run(app_name, ports={f'{container_port}/tcp': port}, 
+                detach=True, name=name, volumes={app_dir: {'bind': '/paatr', 'mode': 'rw'}},
+                nano_cpus=int(resources["cpu"] * 1e9), mem_limit=resources["memory"],
+                pids_limit=resources["pids"],
+                labels={"paatr.app": app_name, "paatr.app_id": str(app_data.app_id), 
+                        "paatr.replica": str(index), "paatr.port": str(port),
+                        "paatr.node": node.name, "paatr.memory": str(resources["memory"]),
+                        "paatr.cpu": str(resources["cpu"])}))
+
+    touch_app(app_name)
+    return cont
+
+def scale_containers(app_data, replicas):
+    """
+    Starts the missing replicas of an app and removes the extra ones.
+    Callers must hold the app container lock.
+
+    Args:
+        app_data (App): App object
+        replicas (int): Number of replicas to run
+    """
+    for index in range(replicas):
+        _start_replica(app_data, index)
+
+    for cont in app_containers(app_data.name):
+        index = int(cont.labels.get("paatr.replica", 0))
+        if index >= replicas:
+            expect_stop(cont)
+            cont.remove(force=True)
+            unplace_replica(app_data.name, index)
+
+    touch_app(app_data.name)
+
+def scale_app(app_data, run_id, replicas):
+    """
+    Sets the number of replicas of an app, applying it straight away if
+    the app is running
+
+    Args:
+        app_data (App): App object
+        run_id (str): Unique ID for the run
+        replicas (int): Number of replicas to run
+    """
+    app_name = app_data.name
+    app_id = app_data.app_id
+
+    update_table(SCALE_TABLE, app_name, lambda _: replicas)
+    touch_app(app_name)
+
+    try:
+        with app_lock(f"{app_name}.container"):
+            cont = get_container(app_name)
+            running = cont and cont.status == "running"
+            if running:
+                _add_build_log(run_id, app_id, f"Scaling to {replicas} replicas", "setting-up", log_type="run")
+                scale_containers(app_data, replicas)
+
+        if running:
+            # Replicas already serving traffic aren't probed again
+            ready = ready_replicas(app_name)
+            _, message = _health_summary(await_ready(app_data, [i for i in range(replicas) if i not in ready]))
+            _add_build_log(run_id, app_id, message, "setting-up", log_type="run")
+
+        _add_subdomain(app_data)
+        _add_build_log(run_id, app_id, f"Successfully scaled to {replicas} replicas", "success", log_type="run")
+    except (InsufficientResources, PortsExhausted) as e:
+        _add_build_log(run_id, app_id, str(e), "failed", log_type="run")
+        return "Failed to scale app"
+    except Exception as e:
+        _add_build_log(run_id, app_id, "Failed to scale app", "failed", log_type="run")
+        return "Failed to scale app"
+
 def restart_docker_image(app_data, run_id):
     
     app_name = app_data.name
@@ -271,19 +910,36 @@ def restart_docker_image(app_data, run_id):
     
 
     try:
-        stop_container(app_name)
+        with app_lock(f"{app_name}.container"):
+            clear_hibernation(app_name)
+            clear_crashes(app_name)
+            stop_container(app_name)
+
+            if containers := app_containers(app_name):
+                _add_build_log(run_id, app_id, "Restarting container", "setting-up", log_type="run")
+                for cont in containers:
+                    start_container(cont)
+
+        if containers:
+            ready, message = _health_summary(await_ready(app_data))
+            _add_subdomain(app_data)
+
+            if not ready:
+                _add_build_log(run_id, app_id, message, "failed", log_type="run")
+                return "App failed its health check"
+            _add_build_log(run_id, app_id, message, "setting-up", log_type="run")
 
-        if cont := get_container(app_name):
-            _add_build_log(run_id, app_id, "Restarting container", "setting-up", log_type="run")
-            cont.start()
         _add_build_log(run_id, app_id, "Successfully restarted container", "success", log_type="run")
+    except (InsufficientResources, PortsExhausted) as e:
+        _add_build_log(run_id, app_id, str(e), "failed", log_type="run")
+        return "Failed to restart app"
     except Exception as e:
         _add_build_log(run_id, app_id, "Failed to restart container", "failed", log_type="run")
         return "Failed to restart app"
 
 def run_docker_image(app_data, run_id):
     """
-    Runs docker image with app_name
+    Runs docker image with app_name, one container per replica
 
     Args:
         app_name (str): Name of the app
@@ -294,32 +950,173 @@ def run_docker_image(app_data, run_id):
     app_id_digit = app_data.id
     app_id = app_data.app_id
 
-    _add_subdomain(app_data)
-
     if not get_image(app_name):
         _add_build_log(run_id, app_id, "App not found", "failed", log_type="run")
         return "App not found"
 
     try:
-        _add_build_log(run_id, app_id, "Building container", "setting-up", log_type="run")
-        app_dir = os.path.join(Config.APP_FILES_DIR, app_name)
-
-        if not os.path.exists(app_dir):
-            os.mkdir(app_dir)
-        _add_build_log(run_id, app_id, "Setting up logs", "setting-up", log_type="run")
-        container = (DOCKER_CLIENT.containers
-                    .run(app_name, ports={f'{DEFAULT_PORT}/tcp': 10000 + app_id_digit}, 
-                    detach=True, name=app_name, volumes={app_dir: {'bind': '/paatr', 'mode': 'rw'}}))
-            
+        replicas = get_replicas(app_name)
+        _add_build_log(run_id, app_id, f"Building {replicas} container(s)", "setting-up", log_type="run")
+        with app_lock(f"{app_name}.container"):
+            clear_hibernation(app_name)
+            clear_crashes(app_name)
+            scale_containers(app_data, replicas)
+
+        # nginx only routes to the app once it passes its health check
+        _add_build_log(run_id, app_id, "Waiting for the health check", "setting-up", log_type="run")
+        ready, message = _health_summary(await_ready(app_data))
+        _add_subdomain(app_data)
+
+        if not ready:
+            _add_build_log(run_id, app_id, message, "failed", log_type="run")
+            return "App failed its health check"
+
+        _add_build_log(run_id, app_id, message, "setting-up", log_type="run")
         _add_build_log(run_id, app_id, "Successfully ran container", "success", log_type="run")
+    except (InsufficientResources, PortsExhausted) as e:
+        _add_build_log(run_id, app_id, str(e), "failed", log_type="run")
+        return "Failed to run app"
     except Exception as e:
         _add_build_log(run_id, app_id, "Failed to run container", "failed", log_type="run")
         return "Failed to run app"
 
+def get_hibernation(app_name):
+    """
+    Get the hibernation record of an app
+
+    Args:
+        app_name (str): Name of the app
+    
+    Returns:
+        dict: The record if the app is hibernating, else None
+    """
+    record = read_table(HIBERNATION_TABLE, app_name, {})
+    return record if record.get("hibernated_at") else None
+
+def clear_hibernation(app_name):
+    """Marks an app as not hibernating, keeping its cold start history"""
+    update_table(HIBERNATION_TABLE, app_name, 
+                    lambda record: {**record, "hibernated_at": None}, default={})
+    touch_app(app_name)
+
+def get_crashes(app_name):
+    """
+    Get the crash record of an app kept by the supervisor
+
+    Args:
+        app_name (str): Name of the app
+    
+    Returns:
+        dict: `restarts` timestamps, `crash_loop` and the `last_exit_code`
+    """
+    return read_table(SUPERVISOR_TABLE, app_name, {})
+
+def clear_crashes(app_name):
+    """Forgets the crashes of an app, e.g once the user runs it again"""
+    update_table(SUPERVISOR_TABLE, app_name, lambda _: {})
+    touch_app(app_name)
+
+def get_health(app_name):
+    """
+    Get the health record of an app
+
+    Args:
+        app_name (str): Name of the app
+    
+    Returns:
+        dict: Overall `state` and the `replicas` health, None if the app was never probed
+    """
+    return read_table(HEALTH_TABLE, app_name)
+
+def record_health(app_name, states, messages=None):
+    """
+    Records the health of replicas of an app, forgetting the replicas it
+    no longer runs. The app is `starting` while any replica is, else
+    `unhealthy` if any replica is, else `ready`.
+
+    Args:
+        app_name (str): Name of the app
+        states (dict): `starting`, `ready` or `unhealthy`, keyed by replica index
+        messages (dict, optional): Result of the last probe, keyed by replica index
+    """
+    replicas = get_replicas(app_name)
+    now = datetime.utcnow().isoformat()
+
+    def update(record):
+        health = {**record.get("replicas", {}), **{
+            str(index): {"state": state, "message": (messages or {}).get(index), "checked_at": now}
+            for index, state in states.items()
+        }}
+        health = {index: h for index, h in health.items() if int(index) < replicas}
+
+        found = {h["state"] for h in health.values()}
+        state = next((s for s in ("starting", "unhealthy") if s in found), "ready")
+        return {"state": state, "replicas": health, "updated_at": now}
+
+    update_table(HEALTH_TABLE, app_name, update, default={})
+    touch_app(app_name)
+
+def ready_replicas(app_name):
+    """Indexes of the replicas of an app nginx may route to"""
+    health = (get_health(app_name) or {}).get("replicas", {})
+
+    # Replicas run before health checks existed were never probed
+    return [i for i in range(get_replicas(app_name))
+            if health.get(str(i), {}).get("state", "ready") == "ready"]
+
+def await_ready(app_data, indexes=None):
+    """
+    Waits for replicas of an app to pass the health check of its
+    `paatr.yaml`, recording their health
+
+    Args:
+        app_data (App): App object
+        indexes (list, optional): Replicas to probe. Defaults to all of them.
+    
+    Returns:
+        dict: `(passed, message)` of each probed replica
+    """
+    app_name = app_data.name
+    if indexes is None:
+        indexes = range(get_replicas(app_name))
+
+    image = get_image(app_name)
+    check = health_check(image.labels if image else {})
+    targets = {i: ((replica_node(app_name, i) or default_node()).host, replica_port(app_name, i))
+                for i in indexes}
+
+    record_health(app_name, {i: "starting" for i in targets})
+    results = wait_until_ready(targets, check)
+    record_health(app_name, {i: "ready" if passed else "unhealthy" for i, (passed, _) in results.items()},
+                    {i: message for i, (_, message) in results.items()})
+
+    return results
+
+def _health_summary(results):
+    """Run log line for the results of `await_ready`, and whether any replica is ready"""
+    failed = {i: message for i, (passed, message) in results.items() if not passed}
+
+    if not failed:
+        return True, "Health check passed"
+    elif len(failed) == len(results):
+        return False, f"Health check failed: {failed[min(failed)]}"
+
+    return True, (f"{len(failed)} of {len(results)} container(s) failed their health check "
+                    f"and get no traffic: {failed[min(failed)]}")
+
 def container_logs(app_name):
     if cont := get_container(app_name):
         if not cont:
             return None
+
+        # Apps on other nodes write their logs there
+        node = get_node(cont.labels.get("paatr.node"))
+        if node and node.host != "localhost":
+            if cont.status != "running":
+                return None
+
+            _, output = cont.exec_run(["tail", "-n", "100", "/paatr/logs.txt"])
+            return output.decode().splitlines(keepends=True)
     
     app_dir = os.path.join(Config.APP_FILES_DIR, app_name)
     app_logs = os.path.join(app_dir, "logs.txt")
@@ -379,47 +1176,62 @@ def tail(f, lines=1, _buffer=4098):
 ###################################################################
 
 
-def _subdomain_exists(subdomain):
-    try:
-        payload = nginx_load(open(Config.NGINX_ENABLED_PAATR_APPS))
-    except Exception as e:
-        # TODO: Log error
-        return False
+def _is_app_block(directive, app_name):
+    """Checks if a parsed nginx directive is the server or upstream block of `app_name`"""
+    directive_name, directive_value = directive
 
-    for directive in payload:
-        directive_name, directive_value = directive
+    if directive_name == ["upstream", f"paatr_{app_name}"]:
+        return True
 
-        if directive_name[0] == "server":
-            for subdirective in directive_value:
-                subdirective_name, subdirective_value = subdirective
+    if directive_name[0] != "server":
+        return False
 
-                if subdirective_name == "server_name":
-                    if type(subdirective_value) == str:
-                        if subdirective_value.strip().startswith(subdomain+"."):
-                            return True
+    for subdirective in directive_value:
+        subdirective_name, subdirective_value = subdirective
 
-    return False
+        if subdirective_name == "server_name" and type(subdirective_value) == str:
+            if subdirective_value.strip().startswith(app_name+"."):
+                return True
 
-def _add_subdomain(app_data):
-    """
-    Add subdomain to app
+    return False
 
-    Args:
-        app_data (App): App object
-    """
+def _app_nginx_config(app_data):
     app_name = app_data.name.lower().strip()
 
-    if not _subdomain_exists(app_name):
-        if not APP_NAME_REGEX.fullmatch(app_name):
-            return "Invalid app name"
+    # Only replicas that passed their health check get traffic
+    ports = {i: port for i in ready_replicas(app_data.name) if (port := replica_port(app_data.name, i))}
+    if not ports:
+        return None
+
+    # Passive health checks: a replica failing 3 times is skipped for 10s
+    members = "".join(
+        f"\n    server {(replica_node(app_data.name, i) or default_node()).host}:"
+        f"{port} max_fails=3 fail_timeout=10s;"
+        for i, port in ports.items()
+    )
+
+    return f"""
+upstream paatr_{app_name} {{{members}
+}}
 
-        config = f"""
 server {{
     server_name {app_name}.paatrapp.live;
+    access_log {os.path.join(Config.NGINX_ACCESS_LOGS_DIR, app_name)}.access.log;
 
     listen 443 ssl; # managed by Certbot
     location / {{
-        proxy_pass http://localhost:{10000 + app_data.id};
+        proxy_pass http://paatr_{app_name};
+        proxy_next_upstream error timeout http_502;
+    }}
+
+    # Hibernated apps refuse connections, wake them up and retry
+    error_page 502 503 504 = @paatr_wake;
+    location @paatr_wake {{
+        rewrite ^ /wake/{app_name} break;
+        proxy_pass {Config.API_URL};
+        proxy_set_header Host $host;
+        proxy_set_header X-Original-URI $request_uri;
+        proxy_read_timeout {Config.WAKE_TIMEOUT + 5}s;
     }}
 
     ssl_certificate {Config.CERTIFICATE}/fullchain.pem; # managed by Certbot
@@ -427,10 +1239,66 @@ server {{
     include /etc/letsencrypt/options-ssl-nginx.conf; # managed by Certbot
     ssl_dhparam /etc/letsencrypt/ssl-dhparams.pem; # managed by Certbot
 }}
-        """
+"""
+
+def _add_subdomain(app_data):
+    """
+    Add subdomain to app, replacing any outdated config of the app. The
+    subdomain is removed while no replica of the app is ready.
+
+    Args:
+        app_data (App): App object
+    """
+    app_name = app_data.name.lower().strip()
+
+    if not APP_NAME_REGEX.fullmatch(app_name):
+        return "Invalid app name"
+
+    config = _app_nginx_config(app_data)
+
+    with app_lock("nginx"):
+        try:
+            with open(Config.NGINX_ENABLED_PAATR_APPS) as f:
+                current_config = f.read()
+        except FileNotFoundError:
+            current_config = ""
+
+        payload = nginx_loads(current_config) if current_config.strip() else UnspacedList([])
+
+        current = [d for d in payload if _is_app_block(d, app_name)]
+        if current == (nginx_loads(config) if config else []):
+            return
+
+        for i in reversed(range(len(payload))):
+            if _is_app_block(payload[i], app_name):
+                del payload[i]
 
-        with open(Config.NGINX_ENABLED_PAATR_APPS, "a") as f:
-            f.write(config)
+        with open(Config.NGINX_ENABLED_PAATR_APPS, "w") as f:
+            f.write(nginx_dumps(payload).rstrip() + "\n" + (config or ""))
         
-        if Config.MODE == "prod":
-            os.system("sudo systemctl restart nginx")
+        if Config.MODE == "prod" and (error := _reload_nginx()):
+            # Keep nginx loadable, the previous routes keep working
+            with open(Config.NGINX_ENABLED_PAATR_APPS, "w") as f:
+                f.write(current_config)
+            return error
+
+def _reload_nginx():
+    """
+    Reloads nginx once its config passes `nginx -t`
+
+    Returns:
+        str: Why nginx wasn't reloaded, None once reloaded
+    """
+    # nginx refuses configs whose access log directory is missing
+    try:
+        os.makedirs(Config.NGINX_ACCESS_LOGS_DIR, exist_ok=True)
+    except OSError as e:
+        logger.warning("Could not create the nginx access logs directory: %s", e)
+
+    for command in (["sudo", "nginx", "-t"], ["sudo", "systemctl", "reload", "nginx"]):
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            logger.error("`%s` failed: %s", " ".join(command), result.stderr.strip())
+            return f"Failed to reload nginx: {result.stderr.strip()}"
+
+    return None
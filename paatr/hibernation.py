@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from . import HIBERNATION_TABLE, Config, logger
+from .coordination import app_lock, update_table
+from .exceptions import InsufficientResources
+from .health import health_check, wait_until_ready
+from .helpers import (_add_build_log, app_containers, docker_timestamp, expect_stop, get_container, 
+                        get_hibernation, get_image, start_container, touch_app)
+from .nodes import NODE_ERRORS, default_node, get_node, healthy_nodes
+
+# Number of cold starts kept per app
+COLD_STARTS_HISTORY = 20
+
+
+def last_activity(container):
+    """
+    Get the last time an app served traffic (or was started)
+
+    Args:
+        container (docker.models.containers.Container): The app container
+
+    Returns:
+        float: Unix timestamp of the last activity
+    """
+    app_name = container.labels["paatr.app"]
+    started_at = docker_timestamp(container.attrs["State"]["StartedAt"])
+
+    access_log = os.path.join(Config.NGINX_ACCESS_LOGS_DIR, f"{app_name}.access.log")
+    try:
+        last_request = os.path.getmtime(access_log)
+    except OSError:
+        last_request = 0
+
+    return max(started_at, last_request)
+
+def hibernate_idle_apps():
+    """
+    Stops running apps that have been idle for longer than `Config.IDLE_TIMEOUT`
+
+    Returns:
+        list: Names of the apps that were hibernated
+    """
+    hibernated = []
+    now = time.time()
+
+    containers = []
+    for node in healthy_nodes():
+        try:
+            containers += node.client.containers.list(filters={"label": "paatr.app"})
+        except NODE_ERRORS as e:
+            node.mark_unhealthy(e)
+
+    for container in containers:
+        app_name = container.labels["paatr.app"]
+        if now - last_activity(container) < Config.IDLE_TIMEOUT:
+            continue
+
+        with app_lock(f"{app_name}.container"):
+            container.reload()
+            if container.status != "running":
+                continue
+
+            logger.info("Hibernating idle app %s", app_name)
+            update_table(HIBERNATION_TABLE, app_name, lambda record: {
+                **record, "hibernated_at": datetime.utcnow().isoformat()
+            }, default={})
+            expect_stop(container)
+            container.stop()
+            touch_app(app_name)
+            hibernated.append(app_name)
+
+    return hibernated
+
+def _wait_until_ready(app_name, host, port, timeout):
+    """Waits for the first replica to pass the app health check, at most `timeout` seconds"""
+    image = get_image(app_name)
+    check = {**health_check(image.labels if image else {}), "start_period": timeout}
+
+    passed, _ = wait_until_ready({0: (host, port)}, check)[0]
+    return passed
+
+def wake_app(app_name, blocking=True):
+    """
+    Starts a hibernated app and waits until it passes its health check
+
+    Args:
+        app_name (str): Name of the app
+        blocking (bool, optional): Wait while another call wakes the app. Defaults to True.
+
+    Returns:
+        (str, str): Tuple of (`host:port` of the replica if this call woke
+            the app, else None, message). None if `blocking` is False and
+            another call is waking the app.
+    """
+    with app_lock(f"{app_name}.container", blocking=blocking) as acquired:
+        if not acquired:
+            return None
+
+        container = get_container(app_name)
+        if not container:
+            return None, "App not found"
+
+        if container.status == "running":
+            # Another request woke it up while we waited for the lock
+            return None, "App is already running"
+
+        if not get_hibernation(app_name):
+            return None, "App is not hibernating"
+
+        host = (get_node(container.labels.get("paatr.node")) or default_node()).host
+        port = int(container.labels["paatr.port"])
+        app_id = container.labels.get("paatr.app_id")
+        run_id = str(uuid.uuid4())
+        started = time.monotonic()
+
+        try:
+            for replica in app_containers(app_name):
+                if replica.status != "running":
+                    start_container(replica)
+        except InsufficientResources as e:
+            _add_build_log(run_id, app_id, str(e), "failed", log_type="run")
+            return None, "Not enough resources to wake the app"
+
+        ready = _wait_until_ready(app_name, host, port, Config.WAKE_TIMEOUT)
+        cold_start = round(time.monotonic() - started, 3)
+
+        if not ready:
+            _add_build_log(run_id, app_id, f"App did not wake up within {Config.WAKE_TIMEOUT}s",
+                            "failed", log_type="run")
+            return None, "App did not wake up in time"
+
+        update_table(HIBERNATION_TABLE, app_name, lambda record: {
+            **record,
+            "hibernated_at": None,
+            "woken_at": datetime.utcnow().isoformat(),
+            "cold_start": cold_start,
+            "cold_starts": (record.get("cold_starts", []) + [cold_start])[-COLD_STARTS_HISTORY:]
+        }, default={})
+        touch_app(app_name)
+
+    logger.info("Woke app %s in %ss", app_name, cold_start)
+    _add_build_log(run_id, app_id, f"Woke app from hibernation in {cold_start}s",
+                    "success", log_type="run")
+    return f"{host}:{port}", "App is running"
+
+def _idle_detector():
+    while True:
+        time.sleep(Config.IDLE_CHECK_INTERVAL)
+
+        # One worker checks at a time
+        with app_lock("idle-detector", blocking=False) as acquired:
+            if not acquired:
+                continue
+
+            try:
+                hibernate_idle_apps()
+            except Exception:
+                logger.exception("Idle detection failed")
+
+def start_idle_detector():
+    """Starts the idle detector in the background, if hibernation is enabled"""
+    if Config.IDLE_TIMEOUT <= 0:
+        return
+
+    threading.Thread(target=_idle_detector, name="idle-detector", daemon=True).start()
@@ -0,0 +1,137 @@
+import threading
+import time
+import uuid
+
+from . import BUILD_QUEUE_TABLE, Config, logger
+from .coordination import app_lock, enqueue_build, read_table
+from .helpers import (_add_build_log, _forget_credentials, restart_docker_image, run_build_queue,
+                        run_docker_image, scale_app, stop_docker_image)
+from .journal import (finish_job, get_job, record_job, requeue_job, running_job, unfinished_jobs,
+                        worker_alive)
+from .models import App
+
+# Jobs besides builds (which have their own queue), each returns an error
+# message or None once done
+RUNNERS = {
+    "run": lambda app_data, job: run_docker_image(app_data, job["job_id"]),
+    "restart": lambda app_data, job: restart_docker_image(app_data, job["job_id"]),
+    "scale": lambda app_data, job: scale_app(app_data, job["job_id"], job["args"]["replicas"]),
+    "stop": lambda app_data, job: stop_docker_image(app_data.name)
+}
+
+
+def submit_job(kind, app_id, job_id=None, **args):
+    """
+    Journals a job to run with `run_job`
+
+    Args:
+        kind (str): One of `RUNNERS`
+        app_id (str): ID of the app
+        job_id (str, optional): ID of the job, the run ID. Defaults to a new one.
+        **args: Arguments of the runner e.g `replicas`
+
+    Returns:
+        str: The job ID
+    """
+    return record_job(job_id or str(uuid.uuid4()), kind, str(app_id), args)
+
+def run_job(job_id, app_data=None):
+    """
+    Runs a journaled job
+
+    Args:
+        job_id (str): ID of the job
+        app_data (App, optional): App of the job. Defaults to looking it up.
+
+    Returns:
+        str: Error message, None once done
+    """
+    if not (job := get_job(job_id)):
+        return "Job not found"
+
+    if not (app_data := app_data or App.get(job["app_id"])):
+        finish_job(job_id, "failed", "App not found")
+        return "App not found"
+
+    with running_job(job_id) as result:
+        result["error"] = RUNNERS[job["kind"]](app_data, job)
+
+    return result["error"]
+
+def _in_build_queue(job):
+    return any(queued["build_id"] == job["job_id"] for queued in read_table(BUILD_QUEUE_TABLE, job["app_id"], []))
+
+def _recover(job):
+    """Queues an orphaned job again, or fails it. Returns whether it was queued again."""
+    job_id, app_id, log_type = job["job_id"], job["app_id"], "build" if job["kind"] == "build" else "run"
+
+    # Never started, still waiting for a worker to drain the build queue
+    if job["kind"] == "build" and _in_build_queue(job):
+        requeue_job(job_id)
+        return True
+
+    if job["attempts"] >= Config.JOB_MAX_ATTEMPTS:
+        message = f"Interrupted {job['attempts']} times by restarts of paatr, giving up"
+        finish_job(job_id, "failed", message)
+        _forget_credentials(job_id)
+        if job["kind"] != "stop":
+            _add_build_log(job_id, app_id, message, "failed", log_type=log_type)
+        return False
+
+    requeue_job(job_id)
+    if job["kind"] == "build":
+        _add_build_log(job_id, app_id, "Interrupted by a restart of paatr, queued again", "queued")
+        enqueue_build(BUILD_QUEUE_TABLE, app_id, job["args"])
+    elif job["kind"] != "stop":
+        _add_build_log(job_id, app_id, "Interrupted by a restart of paatr, running again",
+                        "setting-up", log_type="run")
+    return True
+
+def recover_jobs():
+    """
+    Takes over the unfinished jobs of workers that went away (see
+    `paatr.journal.worker_alive`), running them again unless they were
+    already tried `Config.JOB_MAX_ATTEMPTS` times
+
+    Returns:
+        dict: IDs of the jobs `requeued` and `failed`
+    """
+    recovered = {"requeued": [], "failed": []}
+    builds, runs = set(), []
+
+    # Workers starting together don't take over the same jobs
+    with app_lock("jobs"):
+        for job in unfinished_jobs():
+            if worker_alive(job["worker"], job["heartbeat_at"]):
+                continue
+
+            if _recover(job):
+                recovered["requeued"].append(job["job_id"])
+                if job["kind"] == "build":
+                    builds.add(job["app_id"])
+                else:
+                    runs.append(job["job_id"])
+            else:
+                recovered["failed"].append(job["job_id"])
+
+    for app_id in builds:
+        threading.Thread(target=run_build_queue, args=(app_id,), name=f"build-{app_id}", daemon=True).start()
+    for job_id in runs:
+        threading.Thread(target=run_job, args=(job_id,), name=f"job-{job_id[:8]}", daemon=True).start()
+
+    if recovered["requeued"] or recovered["failed"]:
+        logger.info("Recovered orphaned jobs: %s", recovered)
+    return recovered
+
+def _recover_jobs():
+    while True:
+        try:
+            recover_jobs()
+        except Exception:
+            logger.exception("Failed to recover orphaned jobs")
+
+        time.sleep(Config.JOB_STALE_AFTER)
+
+def start_job_recovery():
+    """Recovers orphaned jobs on startup, then every `Config.JOB_STALE_AFTER` seconds"""
+    threading.Thread(target=_recover_jobs, name="job-recovery", daemon=True).start()
@@ -0,0 +1,194 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from . import JOBS_TABLE, Config, logger
+from .coordination import expire_keys, locked_table, open_table, read_table, update_table
+
+# Finished jobs are forgotten after this long
+JOBS_TTL = timedelta(days=1)
+
+# Jobs this process is running, kept alive by the heartbeat thread
+_running = set()
+_running_lock = threading.Lock()
+_heartbeat = None
+_worker = None
+
+
+def current_worker():
+    """
+    Identifies this process in the journal. `id` tells it apart from a
+    previous process that had the same pid (e.g pid 1 in a container).
+    """
+    global _worker
+
+    # Forked workers get their own
+    if _worker is None or _worker["pid"] != os.getpid():
+        _worker = {"host": socket.gethostname(), "pid": os.getpid(), "id": uuid.uuid4().hex}
+
+    return _worker
+
+def forget_old_jobs():
+    """
+    Forgets the jobs finished more than `JOBS_TTL` ago, run by the
+    garbage collector (see `paatr.cleanup`)
+
+    Returns:
+        int: Number of jobs forgotten
+    """
+    forget_before = (datetime.utcnow() - JOBS_TTL).isoformat()
+    return expire_keys(JOBS_TABLE, lambda job: bool(job.get("finished_at")) and job["finished_at"] < forget_before)
+
+def record_job(job_id, kind, app_id, args=None):
+    """
+    Journals a queued job, so it can be recovered if its worker goes away
+    before it finishes
+
+    Args:
+        job_id (str): ID of the job, the build or run ID
+        kind (str): `build`, or one of `paatr.jobs.RUNNERS`
+        app_id (str): ID of the app
+        args (dict, optional): What the job needs to run again. Defaults to None.
+
+    Returns:
+        str: The job ID
+    """
+    now = time.time()
+    update_table(JOBS_TABLE, job_id, lambda _: {
+        "job_id": job_id,
+        "kind": kind,
+        "app_id": app_id,
+        "args": args or {},
+        "status": "queued",
+        "attempts": 0,
+        "worker": current_worker(),
+        "created_at": datetime.utcnow().isoformat(),
+        "heartbeat_at": now
+    })
+    return job_id
+
+def _update_job(job_id, fn):
+    with locked_table(JOBS_TABLE, job_id) as db:
+        # Jobs from before the journal, or already forgotten
+        if job_id in db:
+            db[job_id] = fn(db[job_id])
+
+def get_job(job_id):
+    """Get a journaled job, None if there is no such job"""
+    return read_table(JOBS_TABLE, job_id)
+
+def finish_job(job_id, status="finished", message=None):
+    """
+    Marks a job as done. Its arguments are dropped, they may hold
+    credentials (e.g the git url of a private repository).
+
+    Args:
+        job_id (str): ID of the job
+        status (str, optional): `finished`, `failed` or `cancelled`. Defaults to "finished".
+        message (str, optional): Why it failed. Defaults to None.
+    """
+    _update_job(job_id, lambda job: {
+        **job, "status": status, "message": message, "args": {},
+        "finished_at": datetime.utcnow().isoformat()
+    })
+
+def requeue_job(job_id):
+    """Takes over an orphaned job, queued again under this worker"""
+    _update_job(job_id, lambda job: {
+        **job, "status": "queued", "worker": current_worker(), "heartbeat_at": time.time()
+    })
+
+def _beat():
+    while True:
+        time.sleep(Config.JOB_HEARTBEAT_INTERVAL)
+
+        with _running_lock:
+            running = list(_running)
+
+        for job_id in running:
+            try:
+                _update_job(job_id, lambda job: {**job, "heartbeat_at": time.time()})
+            except Exception:
+                logger.exception("Failed to record the heartbeat of job %s", job_id)
+
+@contextmanager
+def running_job(job_id):
+    """
+    Marks a job as running in this process, with heartbeats every
+    `Config.JOB_HEARTBEAT_INTERVAL` seconds, and as finished once the block
+    exits. The job failed if the block raises or sets an `error`, unless
+    the block sets another `status` (e.g `cancelled`).
+
+    Args:
+        job_id (str): ID of the job
+
+    Yields:
+        dict: Where the block may set the `error` message and `status` of the job
+    """
+    global _heartbeat
+
+    with _running_lock:
+        _running.add(job_id)
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_beat, name="job-heartbeat", daemon=True)
+            _heartbeat.start()
+
+    _update_job(job_id, lambda job: {
+        **job, "status": "running", "worker": current_worker(), "attempts": job.get("attempts", 0) + 1,
+        "started_at": datetime.utcnow().isoformat(), "heartbeat_at": time.time()
+    })
+
+    result = {}
+    try:
+        yield result
+    except Exception as e:
+        finish_job(job_id, "failed", str(e))
+        raise
+    else:
+        status = result.get("status") or ("failed" if result.get("error") else "finished")
+        finish_job(job_id, status, result.get("error"))
+    finally:
+        with _running_lock:
+            _running.discard(job_id)
+
+def worker_alive(worker, heartbeat_at):
+    """
+    Tells if the worker that last ran (or queued) a job is still around.
+    Workers on this host are looked up by pid, others are trusted while
+    their heartbeats are recent.
+
+    Args:
+        worker (dict): `current_worker()` of the worker
+        heartbeat_at (float): Unix timestamp of the job's last heartbeat
+
+    Returns:
+        bool: False once the job is orphaned
+    """
+    current = current_worker()
+    if worker["id"] == current["id"]:
+        return True
+
+    if worker["host"] == current["host"]:
+        # Our own pid is a previous process of ours
+        if worker["pid"] == current["pid"]:
+            return False
+        try:
+            os.kill(worker["pid"], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    return time.time() - heartbeat_at < Config.JOB_STALE_AFTER
+
+def unfinished_jobs():
+    """Get the journaled jobs that are queued or running, oldest first"""
+    with open_table(JOBS_TABLE) as db:
+        jobs = [job for job in db.values() if job["status"] in ("queued", "running")]
+
+    return sorted(jobs, key=lambda job: job["created_at"])
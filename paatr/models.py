@@ -74,6 +74,35 @@ class App:
 
         return cls.from_dict(**data.data[0])
     
+    @classmethod
+    def get_many(cls, app_ids):
+        """
+        Retrieves several apps by their IDs, in one query.
+        
+        Args:
+            app_ids (list): The apps' IDs.
+        
+        Returns:
+            list: The app objects found.
+        """
+        data = supabase.table(cls.table).select("*").in_("app_id", list(app_ids)).execute()
+        return [cls.from_dict(**app) for app in data.data]
+
+    @classmethod
+    def get_all_by(cls, key, value):
+        """
+        Retrieves all apps matching a key and value.
+        
+        Args:
+            key (str): The key to search by.
+            value (str): The value to search by.
+        
+        Returns:
+            list: The app objects.
+        """
+        data = supabase.table(cls.table).select("*").eq(key, value).execute()
+        return [cls.from_dict(**app) for app in data.data]
+
     @classmethod
     def get_by(cls, key, value):
         """
@@ -0,0 +1,273 @@
+import time
+from urllib.parse import urlparse
+
+import docker
+from docker.errors import DockerException
+from requests import RequestException
+
+from . import PLACEMENTS_TABLE, PORTS_TABLE, Config, logger
+from .coordination import open_table, read_table, update_table
+from .exceptions import InsufficientResources, PortsExhausted
+
+# Raised when a node daemon can't be reached (docker-py lets the
+# connection errors of requests through)
+NODE_ERRORS = (DockerException, RequestException)
+
+
+class Node:
+    def __init__(self, name, client=None, host="localhost", base_url=None):
+        """
+        A docker daemon apps can be scheduled on.
+
+        Args:
+            name (str): Name of the node, used in placements
+            client (docker.DockerClient, optional): Client of the node daemon,
+                connected to `base_url` on first use if None
+            host (str): Address nginx and the api reach the node apps on
+            base_url (str, optional): URL of the daemon, the environment's
+                (e.g `DOCKER_HOST`) if None
+        """
+        self.name = name
+        self.host = host
+        self.base_url = base_url
+        self._client = client
+        self._unhealthy_until = 0
+
+    @property
+    def client(self):
+        """
+        Client of the node daemon
+
+        Raises:
+            DockerException: If the daemon can't be reached
+        """
+        if self._client is None:
+            self._client = docker.DockerClient(base_url=self.base_url) if self.base_url else docker.from_env()
+        return self._client
+
+    @property
+    def healthy(self):
+        """Whether the node wasn't found unreachable in the last `Config.NODE_RETRY_INTERVAL` seconds"""
+        return time.monotonic() >= self._unhealthy_until
+
+    def mark_unhealthy(self, error):
+        """Skips the node until `Config.NODE_RETRY_INTERVAL` seconds from now"""
+        logger.warning("Node %s is unreachable, skipping it for %ss: %s", self.name, 
+                        Config.NODE_RETRY_INTERVAL, error)
+        self._unhealthy_until = time.monotonic() + Config.NODE_RETRY_INTERVAL
+
+    def capacity(self):
+        """Memory (bytes) and cpus containers of the node may be given"""
+        info = self.client.info()
+        return {
+            "memory": info["MemTotal"] * Config.MEMORY_OVERCOMMIT,
+            "cpu": info["NCPU"] * Config.CPU_OVERCOMMIT
+        }
+
+    def usage(self):
+        """Memory (bytes) and cpus reserved by the running paatr containers"""
+        running = self.client.api.containers(filters={"label": "paatr.app", "status": "running"})
+        labels = [c.get("Labels") or {} for c in running]
+        return {
+            "memory": sum(int(l.get("paatr.memory", 0)) for l in labels),
+            "cpu": sum(float(l.get("paatr.cpu", 0)) for l in labels)
+        }
+
+    def check_capacity(self, memory):
+        """
+        Refuses a container that would oversubscribe the node memory.
+        Callers must hold the `admission` lock until the container is started.
+
+        Args:
+            memory (int): Memory limit of the container, in bytes
+
+        Raises:
+            InsufficientResources: If the node doesn't have enough memory left
+        """
+        free = self.capacity()["memory"] - self.usage()["memory"]
+
+        if memory > free:
+            raise InsufficientResources(memory, max(int(free), 0))
+
+    def __repr__(self):
+        return f"Node({self.name!r}, host={self.host!r})"
+
+
+NODES = {}
+
+def register_node(name, client=None, host="localhost", base_url=None):
+    """
+    Adds a docker daemon to the node registry
+
+    Args:
+        name (str): Name of the node
+        client (docker.DockerClient, optional): Client of the node daemon. Defaults to None.
+        host (str, optional): Address the node apps are reached on. Defaults to "localhost".
+        base_url (str, optional): URL of the daemon, when `client` is None. Defaults to None.
+
+    Returns:
+        Node: The registered node
+    """
+    NODES[name] = Node(name, client, host, base_url)
+    return NODES[name]
+
+def healthy_nodes():
+    """Registered nodes, without those found unreachable lately"""
+    return [node for node in NODES.values() if node.healthy]
+
+def load_nodes():
+    """
+    Registers the nodes of `Config.DOCKER_NODES` e.g
+    `local=unix:///var/run/docker.sock,worker-1=tcp://10.0.0.2:2376`,
+    or only the local daemon if none are configured. Daemons are only
+    connected to when first used.
+    """
+    NODES.clear()
+
+    if not Config.DOCKER_NODES:
+        register_node("local")
+        return
+
+    for entry in Config.DOCKER_NODES.split(","):
+        name, base_url = entry.strip().split("=", 1)
+        url = urlparse(base_url)
+        host = url.hostname if url.scheme in ("tcp", "http", "https", "ssh") else "localhost"
+        register_node(name, host=host, base_url=base_url)
+
+def default_node():
+    return next(iter(NODES.values()))
+
+def get_node(name):
+    """Get a registered node by name, None if it was removed from the registry"""
+    return NODES.get(name)
+
+###################################################################
+# Placement                                                       #
+###################################################################
+
+def get_placements(app_name):
+    """
+    Get where the replicas of an app are placed
+
+    Args:
+        app_name (str): Name of the app
+
+    Returns:
+        dict: Node names keyed by replica index
+    """
+    return read_table(PLACEMENTS_TABLE, app_name, {})
+
+def replica_node(app_name, index):
+    """Node a replica is placed on, None if it isn't placed yet"""
+    return get_node(get_placements(app_name).get(index))
+
+def app_node(app_name):
+    """Node that builds the app image, the one its first replica runs on"""
+    return replica_node(app_name, 0) or default_node()
+
+def app_nodes(app_name):
+    """All nodes holding containers or the image of an app, build node first"""
+    build_node = app_node(app_name)
+    names = set(get_placements(app_name).values()) - {build_node.name}
+    return [build_node] + [NODES[name] for name in sorted(names) if name in NODES]
+
+def unplace_replica(app_name, index):
+    update_table(PLACEMENTS_TABLE, app_name,
+                    lambda placements: {k: v for k, v in placements.items() if k != index}, default={})
+    update_table(PORTS_TABLE, app_name,
+                    lambda ports: {k: v for k, v in ports.items() if k != index}, default={})
+
+def place_replica(app_name, index, memory, cpu):
+    """
+    Picks a node for a replica and records the placement. Nodes already
+    running a replica of the app are avoided when possible (anti-affinity),
+    then the fullest node that still fits the replica wins (best-fit bin
+    packing), so whole nodes stay free for big apps. Unreachable nodes
+    are skipped.
+
+    Callers must hold the `admission` lock.
+
+    Args:
+        app_name (str): Name of the app
+        index (int): Replica index
+        memory (int): Memory limit of the replica, in bytes
+        cpu (float): Cpu limit of the replica
+
+    Returns:
+        Node: The chosen node
+
+    Raises:
+        InsufficientResources: If no node can fit the replica
+    """
+    placements = get_placements(app_name)
+    siblings = {name for i, name in placements.items() if i != index}
+
+    candidates = []
+    best_available = 0
+    for node in healthy_nodes():
+        try:
+            capacity, usage = node.capacity(), node.usage()
+        except NODE_ERRORS as e:
+            node.mark_unhealthy(e)
+            continue
+
+        free_memory = capacity["memory"] - usage["memory"]
+        best_available = max(best_available, free_memory)
+
+        if free_memory >= memory and capacity["cpu"] - usage["cpu"] >= cpu:
+            candidates.append((node.name in siblings, free_memory - memory, node.name, node))
+
+    if not candidates:
+        raise InsufficientResources(memory, int(best_available))
+
+    node = min(candidates, key=lambda c: c[:3])[3]
+    update_table(PLACEMENTS_TABLE, app_name,
+                    lambda placements: {**placements, index: node.name}, default={})
+    return node
+
+###################################################################
+# Host ports                                                      #
+###################################################################
+
+def get_port(app_name, index):
+    """Host port a replica is published on, None if it has none yet"""
+    return read_table(PORTS_TABLE, app_name, {}).get(index)
+
+def record_port(app_name, index, port):
+    """Records the host port a replica is published on"""
+    update_table(PORTS_TABLE, app_name, lambda ports: {**ports, index: port}, default={})
+
+def allocate_port(app_name, index):
+    """
+    Get the host port of a replica, picking the lowest free one of
+    `Config.HOST_PORT_MIN` to `Config.HOST_PORT_MAX` the first time. A
+    replica keeps its port until it is unplaced, so nginx and restarts
+    find it where it was.
+
+    Callers must hold the `admission` lock.
+
+    Args:
+        app_name (str): Name of the app
+        index (int): Replica index
+
+    Returns:
+        int: The host port
+
+    Raises:
+        PortsExhausted: If every port of the range is taken
+    """
+    if port := get_port(app_name, index):
+        return port
+
+    with open_table(PORTS_TABLE) as db:
+        taken = {port for ports in db.values() for port in ports.values()}
+
+    port = next((p for p in range(Config.HOST_PORT_MIN, Config.HOST_PORT_MAX + 1) if p not in taken), None)
+    if port is None:
+        raise PortsExhausted(Config.HOST_PORT_MIN, Config.HOST_PORT_MAX)
+
+    record_port(app_name, index, port)
+    return port
+
+
+load_nodes()
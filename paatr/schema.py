@@ -0,0 +1,308 @@
+import copy
+import difflib
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+
+import yaml
+
+from . import APP_CONFIG_FILE, DEFAULT_PORT, MEMORY_REGEX, PYTHON_RUNTIMES, DEFAULT_RESOURCES, Config
+from .exceptions import ConfigError
+from .health import HEALTH_CHECK_TYPES
+
+# Version of `paatr.yaml` files without a `version` key, and the latest one
+SCHEMA_VERSION = 1
+
+# Number of parsed config files kept, keyed by their hash
+CONFIG_CACHE_SIZE = 256
+
+ENV_NAME_REGEX = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+TYPE_NAMES = {str: "a string", int: "an integer", float: "a number", bool: "a boolean",
+                list: "a list", dict: "a mapping"}
+
+
+class Field:
+    def __init__(self, types, required=False, default=None, check=None, error=None,
+                    convert=None, items=None, keys=None, fields=None):
+        """
+        A key of the app config.
+
+        Args:
+            types (type|tuple): Accepted types, matched exactly (`True` isn't an int)
+            required (bool): Whether the key must be set
+            default (any): Value when the key isn't set, callables get the config parsed so far
+            check (callable): Validates the value once its type is right
+            error (str): Message when `check` fails, formatted with `key`, `value` and `config`
+            convert (callable): Turns the valid value into the one the config holds
+            items (Field): Field of the items of a list or the values of a mapping
+            keys (re.Pattern): Pattern the keys of a mapping must match
+            fields (dict): Fields of a nested mapping
+        """
+        self.types = types if type(types) == tuple else (types,)
+        self.required = required
+        self.default = default
+        self.check = check
+        self.error = error or "Invalid value for `{key}`"
+        self.convert = convert
+        self.items = items
+        self.keys = keys
+        self.fields = fields
+
+
+def parse_memory(value):
+    """
+    Converts a memory size e.g `512m` to bytes
+
+    Args:
+        value (str|int): Memory size, ints are bytes already
+
+    Returns:
+        int: Number of bytes
+    """
+    if type(value) == int:
+        return value
+
+    number, unit = MEMORY_REGEX.fullmatch(value.strip()).groups()
+    return int(float(number) * 1024 ** " kmg".index(unit.lower() or " "))
+
+def _default_resource(key):
+    return lambda config: DEFAULT_RESOURCES[key]
+
+def _seconds(default):
+    return Field((int, float), default=lambda config: getattr(Config, default),
+                    check=lambda v: 0 < v <= 600, error="`{key}` must be between 0 and 600 seconds")
+
+SCHEMA_FIELDS = {
+    1: {
+        "version": Field(int),
+        "runtime": Field(str, required=True, check=lambda v: v in PYTHON_RUNTIMES,
+                            error="Unknown runtime `{value}`, expected one of " + ", ".join(PYTHON_RUNTIMES)),
+        "web": Field(str, required=True, check=lambda v: bool(v.strip()), error="`{key}` can't be empty"),
+        "run": Field((str, list), default=lambda config: [], items=Field(str),
+                        convert=lambda v: [v] if type(v) == str else v),
+        "port": Field(int, default=DEFAULT_PORT, check=lambda v: 0 < v < 65536,
+                        error="`{key}` must be a port number"),
+        "env": Field(dict, default=lambda config: {}, items=Field((str, int, float, bool)), keys=ENV_NAME_REGEX),
+        "replicas": Field(int, default=1, check=lambda v: 1 <= v <= Config.MAX_REPLICAS,
+                            error="`{key}` must be between 1 and {config.MAX_REPLICAS}"),
+        "cpu": Field((int, float), default=_default_resource("cpu"), check=lambda v: 0 < v <= Config.MAX_CPU,
+                        error="`{key}` must be more than 0 and at most {config.MAX_CPU}"),
+        "memory": Field((int, str), default=_default_resource("memory"), convert=parse_memory,
+                        check=lambda v: (type(v) == int and v > 0) or (type(v) == str and bool(MEMORY_REGEX.fullmatch(v.strip()))),
+                        error="`{key}` must be a size e.g 512m, 1g or a number of bytes"),
+        "pids": Field(int, default=_default_resource("pids"), check=lambda v: v > 0,
+                        error="`{key}` must be more than 0"),
+        "build": Field(dict, fields={
+            "cache": Field(bool, default=True)
+        }),
+        "health": Field(dict, fields={
+            "type": Field(str, default="tcp", check=lambda v: v in HEALTH_CHECK_TYPES,
+                            error="`{key}` must be one of " + ", ".join(HEALTH_CHECK_TYPES)),
+            "path": Field(str, default="/", check=lambda v: v.startswith("/"),
+                            error="`{key}` must start with /"),
+            "timeout": _seconds("HEALTH_TIMEOUT"),
+            "interval": _seconds("HEALTH_INTERVAL"),
+            "start_period": _seconds("HEALTH_START_PERIOD")
+        })
+    }
+}
+
+###################################################################
+# Compilation                                                     #
+###################################################################
+
+def _key_name(path):
+    return ".".join(str(p) for p in path)
+
+def _location(marks, path):
+    """Line and column of a path, or of its closest parent"""
+    while path not in marks and path:
+        path = path[:-1]
+
+    mark = marks.get(path)
+    return (mark.line + 1, mark.column + 1) if mark else (None, None)
+
+def _compile_field(field):
+    items = _compile_field(field.items) if field.items else None
+    fields = _compile_mapping(field.fields) if field.fields is not None else None
+    expected = " or ".join(TYPE_NAMES.get(t, t.__name__) for t in field.types)
+
+    def validate(value, path, marks):
+        key = _key_name(path)
+
+        if type(value) not in field.types:
+            raise ConfigError(f"`{key}` must be {expected}, not {TYPE_NAMES.get(type(value), type(value).__name__)}",
+                                *_location(marks["values"], path))
+
+        if fields:
+            value = fields(value, path, marks)
+        elif type(value) == list and items:
+            value = [items(item, path + (i,), marks) for i, item in enumerate(value)]
+        elif type(value) == dict:
+            for name in value:
+                if field.keys and not (type(name) == str and field.keys.fullmatch(name)):
+                    raise ConfigError(f"Invalid key `{name}` in `{key}`", *_location(marks["keys"], path + (name,)))
+            if items:
+                value = {name: items(item, path + (name,), marks) for name, item in value.items()}
+
+        if field.check and not field.check(value):
+            raise ConfigError(field.error.format(key=key, value=value, config=Config),
+                                *_location(marks["values"], path))
+
+        return field.convert(value) if field.convert else value
+
+    return validate
+
+def _compile_mapping(fields):
+    validators = {name: _compile_field(field) for name, field in fields.items()}
+    required = [name for name, field in fields.items() if field.required]
+
+    def validate(data, path, marks):
+        for name in data:
+            if name not in fields:
+                hint = difflib.get_close_matches(str(name), fields, n=1)
+                hint = f", did you mean `{hint[0]}`?" if hint else ""
+                raise ConfigError(f"Unknown key `{_key_name(path + (name,))}`{hint}",
+                                    *_location(marks["keys"], path + (name,)))
+
+        for name in required:
+            if name not in data:
+                raise ConfigError(f"Missing `{_key_name(path + (name,))}` key", *_location(marks["values"], path))
+
+        config = {}
+        for name, field in fields.items():
+            if name in data:
+                config[name] = validators[name](data[name], path + (name,), marks)
+            elif field.fields is not None:
+                config[name] = validators[name]({}, path + (name,), marks)
+            elif callable(field.default):
+                config[name] = validators[name](field.default(config), path + (name,), marks)
+            elif field.default is not None:
+                config[name] = field.default
+
+        return config
+
+    return validate
+
+# Compiled once, parsing only runs the validators
+SCHEMAS = {version: _compile_mapping(fields) for version, fields in SCHEMA_FIELDS.items()}
+
+###################################################################
+# Parsing                                                         #
+###################################################################
+
+def _collect_marks(node, path, marks):
+    marks["values"][path] = node.start_mark
+
+    if isinstance(node, yaml.MappingNode):
+        for key_node, value_node in node.value:
+            if isinstance(key_node, yaml.ScalarNode):
+                marks["keys"][path + (key_node.value,)] = key_node.start_mark
+                _collect_marks(value_node, path + (key_node.value,), marks)
+    elif isinstance(node, yaml.SequenceNode):
+        for i, item in enumerate(node.value):
+            _collect_marks(item, path + (i,), marks)
+
+def parse_config(text):
+    """
+    Parses and validates the contents of a `paatr.yaml` file
+
+    Args:
+        text (str): Contents of the file
+
+    Returns:
+        dict: The config, with defaults filled in
+
+    Raises:
+        ConfigError: With the line and column of the problem
+    """
+    loader = yaml.SafeLoader(text)
+    try:
+        node = loader.get_single_node()
+        data = loader.construct_document(node) if node else None
+    except yaml.MarkedYAMLError as e:
+        mark = e.problem_mark or e.context_mark
+        raise ConfigError(e.problem or e.context or "Invalid yaml", 
+                            *((mark.line + 1, mark.column + 1) if mark else (None, None)))
+    finally:
+        loader.dispose()
+
+    if type(data) != dict:
+        raise ConfigError(f"Invalid `{APP_CONFIG_FILE}` file, expected a mapping of keys", 1, 1)
+
+    marks = {"values": {}, "keys": {}}
+    _collect_marks(node, (), marks)
+
+    version = data.get("version", SCHEMA_VERSION)
+    if type(version) != int or version not in SCHEMAS:
+        raise ConfigError(f"Unsupported version `{version}`, the latest is {SCHEMA_VERSION}",
+                            *_location(marks["values"], ("version",)))
+
+    return {**SCHEMAS[version](data, (), marks), "version": version}
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def load_config(config_path):
+    """
+    Parses a `paatr.yaml` file, files already parsed (by their hash) are
+    served from a cache. Callers get their own copy of the config.
+
+    Args:
+        config_path (str): Path to the file
+
+    Returns:
+        (dict, str): Tuple of (config, sha256 of the file)
+
+    Raises:
+        ConfigError: If the file is invalid
+    """
+    with open(config_path, "rb") as fp:
+        content = fp.read()
+
+    digest = hashlib.sha256(content).hexdigest()
+
+    with _cache_lock:
+        if (result := _cache.get(digest)) is not None:
+            _cache.move_to_end(digest)
+
+    if result is None:
+        try:
+            result = parse_config(content.decode())
+        except UnicodeDecodeError:
+            result = ConfigError(f"`{APP_CONFIG_FILE}` must be utf-8 text")
+        except ConfigError as e:
+            result = e
+
+        with _cache_lock:
+            _cache[digest] = result
+            while len(_cache) > CONFIG_CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    if isinstance(result, ConfigError):
+        raise ConfigError(result.message, result.line, result.column)
+
+    return copy.deepcopy(result), digest
+
+def build_fingerprint(commit, config=None, dockerfile=None, base_id=None):
+    """
+    Fingerprint of everything an image is built from: the repository
+    commit, the parsed config, the dockerfile and the base image. Builds
+    with the same fingerprint produce the same image.
+
+    Args:
+        commit (str): Commit the repository was cloned at
+        config (dict, optional): Parsed config. Defaults to None.
+        dockerfile (str, optional): Dockerfile the image is built with. Defaults to None.
+        base_id (str, optional): ID of the image the dockerfile starts from, a
+            newly pulled one changes the fingerprint. Defaults to None.
+
+    Returns:
+        str: sha256 hex digest
+    """
+    payload = json.dumps({"commit": commit, "config": config, "dockerfile": dockerfile, "base": base_id},
+                            sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
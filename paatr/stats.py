@@ -0,0 +1,234 @@
+import threading
+import time
+from collections import deque
+
+from . import STATS_TABLE, Config, logger
+from .coordination import app_lock, open_table, read_table
+from .nodes import NODE_ERRORS, healthy_nodes
+
+# Resolutions of the series: seconds per point, points kept
+RESOLUTIONS = {
+    "10s": (10, 6 * 60),
+    "1m": (60, 24 * 60),
+    "1h": (60 * 60, 30 * 24)
+}
+
+# Columns of a point. cpu is in % of one core, memory in bytes, rx/tx in
+# bytes per second, all summed over the app replicas
+FIELDS = ("time", "cpu", "memory", "rx", "tx", "containers")
+
+# Stats of the containers being streamed, keyed by container ID
+_containers = {}
+_containers_lock = threading.Lock()
+
+# Series of the apps, keyed by app name then resolution, and the keys
+# changed since the last `flush`
+_series = {}
+_dirty = set()
+_series_lock = threading.Lock()
+
+
+def parse_stats(stats):
+    """
+    Extracts what we keep from a docker stats sample
+
+    Args:
+        stats (dict): A decoded sample of the docker stats stream
+
+    Returns:
+        (float, int, int, int): Tuple of (cpu %, memory bytes, bytes received, bytes sent)
+    """
+    cpu, precpu = stats["cpu_stats"], stats.get("precpu_stats") or {}
+    cpu_delta = cpu["cpu_usage"]["total_usage"] - precpu.get("cpu_usage", {}).get("total_usage", 0)
+    system_delta = cpu.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+    cpus = cpu.get("online_cpus") or len(cpu["cpu_usage"].get("percpu_usage") or [None])
+
+    cpu_percent = 0
+    if cpu_delta > 0 and system_delta > 0:
+        cpu_percent = cpu_delta / system_delta * cpus * 100
+
+    # Page cache isn't the app's to reclaim, `docker stats` leaves it out too
+    memory = stats.get("memory_stats") or {}
+    cache = (memory.get("stats") or {}).get("inactive_file", (memory.get("stats") or {}).get("cache", 0))
+
+    networks = (stats.get("networks") or {}).values()
+    return (cpu_percent, memory.get("usage", 0) - cache,
+            sum(n["rx_bytes"] for n in networks), sum(n["tx_bytes"] for n in networks))
+
+def _stream(node, container_id, app_name):
+    with _containers_lock:
+        _containers[container_id] = {"app": app_name, "cpu": 0, "memory": 0, "samples": 0,
+                                        "rx": None, "tx": None, "counted_rx": None, "counted_tx": None,
+                                        "counted_at": time.time()}
+
+    try:
+        for stats in node.client.api.stats(container_id, decode=True, stream=True):
+            if not stats.get("read") or stats["read"].startswith("0001-"):
+                continue
+
+            cpu, memory, rx, tx = parse_stats(stats)
+            with _containers_lock:
+                sample = _containers[container_id]
+                sample["cpu"] += cpu
+                sample["memory"] += memory
+                sample["samples"] += 1
+                sample["rx"], sample["tx"] = rx, tx
+    except Exception:
+        logger.debug("Lost the stats stream of container %s", container_id, exc_info=True)
+    finally:
+        with _containers_lock:
+            _containers.pop(container_id, None)
+
+def _watch_containers():
+    """Starts a stats stream for every running paatr container that has none"""
+    for node in healthy_nodes():
+        try:
+            running = node.client.api.containers(filters={"label": "paatr.app", "status": "running"})
+        except NODE_ERRORS as e:
+            node.mark_unhealthy(e)
+            continue
+
+        for cont in running:
+            with _containers_lock:
+                if cont["Id"] in _containers:
+                    continue
+
+            threading.Thread(target=_stream, args=(node, cont["Id"], cont["Labels"]["paatr.app"]),
+                                name=f"stats-{cont['Id'][:12]}", daemon=True).start()
+
+def _collect(now):
+    """Averages what the streams got since the last call, one point per app"""
+    points = {}
+
+    with _containers_lock:
+        for sample in _containers.values():
+            if not sample["samples"]:
+                continue
+
+            point = points.setdefault(sample["app"], [now, 0, 0, 0, 0, 0])
+            point[1] += sample["cpu"] / sample["samples"]
+            point[2] += sample["memory"] / sample["samples"]
+            point[5] += 1
+
+            # Network counters only ever grow, rates come from their deltas
+            elapsed = max(now - sample["counted_at"], 1)
+            if sample["counted_rx"] is not None:
+                point[3] += max(sample["rx"] - sample["counted_rx"], 0) / elapsed
+                point[4] += max(sample["tx"] - sample["counted_tx"], 0) / elapsed
+
+            sample.update(cpu=0, memory=0, samples=0, counted_rx=sample["rx"],
+                            counted_tx=sample["tx"], counted_at=now)
+
+    return {app_name: [point[0], round(point[1], 2), int(point[2]), int(point[3]), int(point[4]), point[5]]
+            for app_name, point in points.items()}
+
+def _get_series(app_name, resolution):
+    if resolution not in _series.setdefault(app_name, {}):
+        # Another worker may have been sampling before us
+        _series[app_name][resolution] = deque(read_table(STATS_TABLE, f"{app_name}/{resolution}", []),
+                                                maxlen=RESOLUTIONS[resolution][1])
+
+    return _series[app_name][resolution]
+
+def _average(points, at):
+    columns = list(zip(*points))[1:]
+    return [at] + [round(sum(column) / len(column), 2) for column in columns]
+
+def add_point(app_name, point, resolution="10s"):
+    """
+    Appends a point to a series of an app, in memory until the next
+    `flush`. Once a point starts a new bucket of the next resolution, the
+    points of the previous bucket are averaged into it.
+
+    Args:
+        app_name (str): Name of the app
+        point (list): Values of `FIELDS`
+        resolution (str, optional): Resolution of the point. Defaults to "10s".
+    """
+    with _series_lock:
+        _add_point(app_name, point, resolution)
+
+def _add_point(app_name, point, resolution):
+    series = _get_series(app_name, resolution)
+    resolutions = list(RESOLUTIONS)
+    index = resolutions.index(resolution)
+
+    if series and index + 1 < len(resolutions):
+        coarser = resolutions[index + 1]
+        size = RESOLUTIONS[coarser][0]
+        bucket = series[-1][0] // size
+
+        if point[0] // size != bucket:
+            _add_point(app_name, _average([p for p in series if p[0] // size == bucket], bucket * size),
+                        coarser)
+
+    series.append(point)
+    _dirty.add((app_name, resolution))
+
+def flush():
+    """
+    Writes the series changed since the last flush, in one transaction.
+    Only the worker holding the `stats` lock writes them.
+    """
+    with _series_lock:
+        changed = {f"{app_name}/{resolution}": list(_series[app_name][resolution])
+                    for app_name, resolution in _dirty}
+        _dirty.clear()
+
+    if not changed:
+        return
+
+    with open_table(STATS_TABLE) as db:
+        db.update(changed)
+        db.commit()
+
+def get_stats(app_name):
+    """
+    Get the resource usage series of an app
+
+    Args:
+        app_name (str): Name of the app
+
+    Returns:
+        dict: `fields` of the points, and the points of each resolution
+    """
+    with open_table(STATS_TABLE) as db:
+        series = {resolution: db.get(f"{app_name}/{resolution}", []) for resolution in RESOLUTIONS}
+
+    # Points this worker sampled but didn't flush yet
+    with _series_lock:
+        series.update({resolution: list(points) for resolution, points in _series.get(app_name, {}).items()})
+
+    return {"fields": FIELDS, "series": series}
+
+def _sample():
+    interval = RESOLUTIONS["10s"][0]
+
+    while True:
+        # One worker samples every node, the others wait to take over
+        with app_lock("stats", blocking=False) as acquired:
+            flushed_at = time.time()
+
+            while acquired:
+                try:
+                    _watch_containers()
+                    now = time.time()
+                    for app_name, point in _collect(int(now // interval * interval)).items():
+                        add_point(app_name, point)
+
+                    if now - flushed_at >= Config.STATS_FLUSH_INTERVAL:
+                        flush()
+                        flushed_at = now
+                except Exception:
+                    logger.exception("Failed to sample container stats")
+
+                time.sleep(interval - time.time() % interval)
+
+        time.sleep(interval)
+
+def start_stats_sampler():
+    """Samples the resource usage of every running app in the background"""
+    if not Config.STATS_ENABLED:
+        return
+
+    threading.Thread(target=_sample, name="stats", daemon=True).start()
@@ -0,0 +1,155 @@
+import threading
+import time
+import uuid
+
+from docker.errors import NotFound
+
+from . import EXPECTED_STOPS_TABLE, SUPERVISOR_TABLE, Config, logger
+from .coordination import app_lock, locked_table, update_table
+from .exceptions import InsufficientResources
+from .helpers import _add_build_log, start_container, touch_app
+from .nodes import NODE_ERRORS, NODES
+
+# How long a stop announced through `expect_stop` is waited for
+EXPECTED_STOP_GRACE = 120
+
+
+def _expected_stop(container_name):
+    """Checks (and forgets) whether a container was stopped on purpose"""
+    with locked_table(EXPECTED_STOPS_TABLE, container_name) as db:
+        stopped_at = db.get(container_name)
+        if stopped_at is None:
+            return False
+
+        del db[container_name]
+
+    return time.time() - stopped_at < EXPECTED_STOP_GRACE
+
+def backoff(restarts):
+    """Seconds to wait before the next restart of a container"""
+    return min(Config.RESTART_BACKOFF * 2 ** restarts, Config.RESTART_BACKOFF_MAX)
+
+def _record_crash(app_name, exit_code):
+    """
+    Records a crash of an app and decides what to do about it
+
+    Returns:
+        (int, bool): Tuple of (restarts in the crash loop window, crash loop detected)
+    """
+    now = time.time()
+
+    record = update_table(SUPERVISOR_TABLE, app_name, lambda record: {
+        **record,
+        "last_exit_code": exit_code,
+        "restarts": [t for t in record.get("restarts", []) if now - t < Config.CRASH_LOOP_WINDOW]
+    }, default={})
+    touch_app(app_name)
+
+    restarts = len(record["restarts"])
+    if restarts < Config.CRASH_LOOP_RESTARTS:
+        return restarts, False
+
+    update_table(SUPERVISOR_TABLE, app_name, lambda record: {**record, "crash_loop": True}, default={})
+    touch_app(app_name)
+    return restarts, True
+
+def _restart(node, container_id, app_name, app_id, reason):
+    run_id = str(uuid.uuid4())
+
+    with app_lock(f"{app_name}.container"):
+        try:
+            container = node.client.containers.get(container_id)
+        except NotFound:
+            return
+
+        # The user (or the idle detector) stopped it while we waited
+        if container.status == "running" or _expected_stop(container.name):
+            return
+
+        try:
+            start_container(container)
+        except InsufficientResources as e:
+            _add_build_log(run_id, app_id, f"Failed to restart crashed container: {e}", "failed", log_type="run")
+            return
+
+        update_table(SUPERVISOR_TABLE, app_name, lambda record: {
+            **record, "restarts": record.get("restarts", []) + [time.time()]
+        }, default={})
+
+    logger.info("Restarted container %s of app %s (%s)", container.name, app_name, reason)
+    _add_build_log(run_id, app_id, f"Restarted container {container.name} after it {reason}",
+                    "success", log_type="run")
+
+def handle_event(node, event, oom_killed):
+    """
+    Reacts to a `die` or `oom` docker event of a paatr container
+
+    Args:
+        node (Node): Node the event comes from
+        event (dict): The decoded docker event
+        oom_killed (set): IDs of containers that were killed for running out of memory
+    """
+    container_id = event["Actor"]["ID"]
+    attributes = event["Actor"]["Attributes"]
+    app_name = attributes["paatr.app"]
+    app_id = attributes.get("paatr.app_id")
+
+    if event["Action"] == "oom":
+        oom_killed.add(container_id)
+        return
+
+    if _expected_stop(attributes["name"]):
+        oom_killed.discard(container_id)
+        return
+
+    exit_code = int(attributes.get("exitCode", -1))
+    if container_id in oom_killed:
+        oom_killed.discard(container_id)
+        reason = "ran out of memory"
+    else:
+        reason = f"crashed with exit code {exit_code}"
+
+    restarts, crash_loop = _record_crash(app_name, exit_code)
+
+    if crash_loop:
+        logger.warning("App %s is crash looping, not restarting it", app_name)
+        _add_build_log(str(uuid.uuid4()), app_id,
+                        f"Container {attributes['name']} {reason}, giving up after {restarts} restarts "
+                        f"in {Config.CRASH_LOOP_WINDOW}s", "crash-loop", log_type="run")
+        return
+
+    delay = backoff(restarts)
+    logger.info("Container %s of app %s %s, restarting in %ss", attributes["name"], app_name, reason, delay)
+
+    timer = threading.Timer(delay, _restart, args=(node, container_id, app_name, app_id, reason))
+    timer.daemon = True
+    timer.start()
+
+def _supervise(node):
+    while True:
+        # One worker supervises each node, the others wait to take over
+        with app_lock(f"supervisor.{node.name}", blocking=False) as acquired:
+            if acquired and node.healthy:
+                oom_killed = set()
+
+                try:
+                    events = node.client.events(decode=True, filters={
+                        "type": "container", "event": ["die", "oom"], "label": "paatr.app"
+                    })
+                    for event in events:
+                        try:
+                            handle_event(node, event, oom_killed)
+                        except Exception:
+                            logger.exception("Failed to handle event %s", event)
+                except NODE_ERRORS as e:
+                    node.mark_unhealthy(e)
+                except Exception:
+                    logger.exception("Lost the event stream of node %s", node.name)
+
+        time.sleep(5)
+
+def start_supervisor():
+    """Starts watching the containers of every node in the background"""
+    for node in NODES.values():
+        threading.Thread(target=_supervise, args=(node,), name=f"supervisor-{node.name}",
+                            daemon=True).start()
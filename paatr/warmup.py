@@ -0,0 +1,204 @@
+import io
+import threading
+import time
+from datetime import datetime
+
+from docker.errors import ImageNotFound
+
+from . import PYTHON_RUNTIMES, WARMUP_TABLE, Config, logger
+from .coordination import app_lock, open_table, update_table
+from .nodes import NODE_ERRORS, NODES
+
+BASE_TEMPLATE = """
+FROM {image}
+RUN apk add --no-cache gcc musl-dev libffi-dev \\
+    && pip install --upgrade pip setuptools wheel
+{pip_cache}
+"""
+
+# Progress is saved at most this often (seconds) while pulling
+PROGRESS_INTERVAL = 1
+
+
+def base_image(image):
+    """
+    Get the image the generated dockerfile of a runtime starts from: the
+    baked base image when baking is enabled, else the runtime image
+
+    Args:
+        image (str): Runtime image e.g `python:3.9-alpine3.15`
+
+    Returns:
+        str: Image name
+    """
+    if not Config.BAKE_BASE_IMAGES:
+        return image
+
+    name, tag = image.split(":")
+    return f"paatr/{name}-build:{tag}"
+
+def _record(node, image, **values):
+    update_table(WARMUP_TABLE, f"{node.name}/{image}", lambda record: {**record, **values}, default={})
+
+def pull_image(node, image):
+    """
+    Pulls an image on a node, recording its progress
+
+    Args:
+        node (Node): Node to pull on
+        image (str): Image name
+
+    Returns:
+        bool: Whether a newer image was downloaded
+    """
+    repository, tag = image.split(":")
+    started = time.monotonic()
+    layers = {}
+    updated = False
+    last_saved = 0
+
+    _record(node, image, status="pulling", progress=0)
+
+    for line in node.client.api.pull(repository, tag, stream=True, decode=True):
+        if "progressDetail" in line and line["progressDetail"].get("total"):
+            layers[line["id"]] = line["progressDetail"]
+
+        updated = updated or "Downloaded newer image" in line.get("status", "")
+
+        if layers and time.monotonic() - last_saved > PROGRESS_INTERVAL:
+            current = sum(l.get("current", 0) for l in layers.values())
+            total = sum(l["total"] for l in layers.values())
+            _record(node, image, progress=round(100 * current / total, 1))
+            last_saved = time.monotonic()
+
+    pulled = node.client.images.get(image)
+    _record(node, image, status="ready", progress=100, image_id=pulled.id,
+            created=pulled.attrs["Created"], pulled_at=datetime.utcnow().isoformat(),
+            updated=updated, duration=round(time.monotonic() - started, 3))
+    return updated
+
+def bake_image(node, image):
+    """
+    Builds the base image of a runtime on a node: the runtime image with
+    the usual build tooling and, optionally, a warm pip cache
+
+    Args:
+        node (Node): Node to build on
+        image (str): Runtime image
+    """
+    started = time.monotonic()
+    baked = base_image(image)
+
+    pip_cache = ""
+    if Config.BAKE_PIP_PACKAGES:
+        # Downloading fills pip's http cache, later installs are served from it
+        packages = " ".join(p.strip() for p in Config.BAKE_PIP_PACKAGES.split(","))
+        pip_cache = f"RUN pip download --dest /tmp/paatr-wheels {packages} && rm -rf /tmp/paatr-wheels"
+
+    dockerfile = BASE_TEMPLATE.format(image=image, pip_cache=pip_cache)
+    node.client.images.build(fileobj=io.BytesIO(dockerfile.encode()), tag=baked, rm=True,
+                                labels={"paatr.base": image})
+
+    _record(node, baked, status="ready", progress=100, baked_at=datetime.utcnow().isoformat(),
+            duration=round(time.monotonic() - started, 3))
+
+def base_image_id(node, image):
+    """
+    Get the ID of a base image on a node
+
+    Args:
+        node (Node): Node the app is built on
+        image (str): Image the generated dockerfile starts from
+
+    Returns:
+        str: The image ID, None if the node doesn't have it yet
+    """
+    try:
+        return node.client.images.get(image).id
+    except ImageNotFound:
+        return None
+
+def ensure_base_image(node, image):
+    """
+    Makes sure the base image of a runtime is on a node, pulling (and
+    baking) it right away if the warmup hasn't done it yet
+
+    Args:
+        node (Node): Node the app is built on
+        image (str): Image the generated dockerfile starts from
+    """
+    try:
+        node.client.images.get(image)
+        return
+    except ImageNotFound:
+        pass
+
+    with app_lock(f"warmup.{node.name}"):
+        # The warmup may have fetched it while we waited
+        try:
+            node.client.images.get(image)
+            return
+        except ImageNotFound:
+            pass
+
+        for runtime in PYTHON_RUNTIMES.values():
+            if image in (runtime, base_image(runtime)):
+                pull_image(node, runtime)
+                if image != runtime:
+                    bake_image(node, runtime)
+
+def warmup_node(node):
+    """Pulls every runtime image on a node and bakes their base images"""
+    try:
+        node.client
+    except NODE_ERRORS as e:
+        node.mark_unhealthy(e)
+        return
+
+    for image in PYTHON_RUNTIMES.values():
+        try:
+            pull_image(node, image)
+            if Config.BAKE_BASE_IMAGES:
+                bake_image(node, image)
+        except Exception:
+            logger.exception("Failed to warm up %s on node %s", image, node.name)
+            _record(node, image, status="failed")
+
+def warmup_report():
+    """
+    Get the state of the runtime images on every node
+
+    Returns:
+        dict: Records keyed by `<node>/<image>`, with their age in seconds
+    """
+    now = datetime.utcnow()
+
+    with open_table(WARMUP_TABLE) as db:
+        report = dict(db.items())
+
+    for record in report.values():
+        if fetched_at := record.get("pulled_at") or record.get("baked_at"):
+            age = (now - datetime.fromisoformat(fetched_at)).total_seconds()
+            record["age"] = round(age)
+            record["stale"] = age > 2 * Config.WARMUP_INTERVAL
+
+    return report
+
+def _warmup(node):
+    while True:
+        # One worker warms each node up
+        with app_lock(f"warmup.{node.name}", blocking=False) as acquired:
+            if acquired and node.healthy:
+                logger.info("Warming up node %s", node.name)
+                warmup_node(node)
+
+        time.sleep(Config.WARMUP_INTERVAL)
+
+def start_warmup():
+    """Warms every node up now, and again every `Config.WARMUP_INTERVAL` seconds"""
+    if Config.WARMUP_INTERVAL <= 0:
+        return
+
+    for node in NODES.values():
+        threading.Thread(target=_warmup, args=(node,), name=f"warmup-{node.name}",
+                            daemon=True).start()
@@ -0,0 +1,159 @@
+import json
+import os
+import queue
+import socket
+import threading
+import time
+
+from docker import utils as docker_utils
+from docker.api.build import process_dockerfile
+
+from . import BUILD_CANCELS_TABLE, Config, logger
+from .coordination import open_table, read_table, update_table
+from .exceptions import BuildCancelled
+
+# How often a running build checks for cancellation (seconds)
+BUILD_POLL_INTERVAL = 1
+
+_END = object()
+
+
+def request_cancel(build_id):
+    """Asks whichever worker runs a build to cancel it"""
+    update_table(BUILD_CANCELS_TABLE, build_id, lambda _: time.time())
+
+def clear_cancel(build_id):
+    with open_table(BUILD_CANCELS_TABLE) as db:
+        if build_id in db:
+            del db[build_id]
+            db.commit()
+
+
+class BuildWatchdog:
+    def __init__(self, build_id):
+        """
+        Tracks a running build against its timeouts and cancel requests.
+
+        Args:
+            build_id (str): ID of the build
+        """
+        self.build_id = build_id
+        self.started = self.last_output = self.last_check = time.monotonic()
+
+    def output(self):
+        """Notes that the build is making progress"""
+        self.last_output = time.monotonic()
+
+    def check(self, force=False):
+        """
+        Raises if the build should stop. Cancel requests are looked up at
+        most every `BUILD_POLL_INTERVAL` seconds unless `force` is set.
+
+        Raises:
+            BuildCancelled: With the reason the build stopped
+        """
+        now = time.monotonic()
+
+        if Config.BUILD_TIMEOUT and now - self.started > Config.BUILD_TIMEOUT:
+            raise BuildCancelled(f"Build timed out after {Config.BUILD_TIMEOUT}s")
+
+        if Config.BUILD_IDLE_TIMEOUT and now - self.last_output > Config.BUILD_IDLE_TIMEOUT:
+            raise BuildCancelled(f"Build cancelled after {Config.BUILD_IDLE_TIMEOUT}s without output")
+
+        if force or now - self.last_check >= BUILD_POLL_INTERVAL:
+            self.last_check = now
+            if read_table(BUILD_CANCELS_TABLE, self.build_id):
+                raise BuildCancelled("Build cancelled")
+
+def follow(stream, watchdog, interrupt):
+    """
+    Yields the items of a blocking stream, read in another thread so the
+    watchdog is checked while the stream is silent
+
+    Args:
+        stream (iterable): e.g the chunks of a process output
+        watchdog (BuildWatchdog): Watchdog of the build
+        interrupt (callable): Stops whatever produces the stream once the build is cancelled
+
+    Raises:
+        BuildCancelled: Once the stream was interrupted
+    """
+    items = queue.Queue()
+
+    def read():
+        try:
+            for item in stream:
+                items.put((item, None))
+        except Exception as e:
+            items.put((_END, e))
+            return
+        items.put((_END, None))
+
+    threading.Thread(target=read, name=f"build-{watchdog.build_id[:8]}", daemon=True).start()
+
+    try:
+        while True:
+            try:
+                item, error = items.get(timeout=BUILD_POLL_INTERVAL)
+            except queue.Empty:
+                watchdog.check()
+                continue
+
+            if error:
+                raise error
+            if item is _END:
+                return
+
+            watchdog.output()
+            watchdog.check()
+            yield item
+    except BuildCancelled:
+        interrupt()
+        raise
+
+def docker_build(api, path, tag, dockerfile=None, labels=None, nocache=False):
+    """
+    Starts a docker build, like `APIClient.build` but handing out the
+    connection too: closing it makes the daemon abort the build and, with
+    `forcerm`, remove its intermediate containers
+
+    Args:
+        api (docker.APIClient): Client of the node daemon
+        path (str): Build context directory
+        tag (str): Tag of the image, None to leave it untagged
+        dockerfile (str, optional): Dockerfile in `path`. Defaults to None.
+        labels (dict, optional): Labels of the image. Defaults to None.
+        nocache (bool, optional): Don't use the build cache. Defaults to False.
+
+    Returns:
+        (generator, callable): Tuple of (decoded build output, function closing the connection)
+    """
+    exclude = None
+    dockerignore = os.path.join(path, ".dockerignore")
+    if os.path.exists(dockerignore):
+        with open(dockerignore) as f:
+            exclude = [line.strip() for line in f.read().splitlines()
+                        if line.strip() and not line.startswith("#")]
+
+    dockerfile = process_dockerfile(dockerfile, path)
+    context = docker_utils.tar(path, exclude=exclude, dockerfile=dockerfile)
+
+    params = {"t": tag, "rm": True, "forcerm": True, "nocache": nocache,
+                "dockerfile": dockerfile[0] if dockerfile else None, "labels": json.dumps(labels or {})}
+    try:
+        response = api._post(api._url("/build"), data=context, params=params, stream=True,
+                                headers={"Content-Type": "application/tar"})
+    finally:
+        context.close()
+
+    # Shutting the socket down wakes up the thread reading it, closing it doesn't
+    sock = api._get_raw_response_socket(response)
+
+    def interrupt():
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            logger.debug("Build connection already closed", exc_info=True)
+        response.close()
+
+    return api._stream_helper(response, decode=True), interrupt
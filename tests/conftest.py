@@ -1,8 +1,257 @@
-import pytests
+import uuid
+
+import pytest
+from docker.errors import APIError, ImageNotFound, InvalidArgument, NotFound
+from paatr import Config, nodes
 from paatr.factory import create_app
 from fastapi.testclient import TestClient
 
+GiB = 2 ** 30
+
+
+class FakeImage:
+    def __init__(self, client, labels=None, created="2022-09-01T00:00:00Z", id=None):
+        self.client = client
+        self.id = id or f"sha256:{uuid.uuid4().hex}"
+        self.short_id = self.id[7:19]
+        self.labels = labels or {}
+        self.attrs = {"Created": created}
+        self._tags = set()
+
+    @property
+    def tags(self):
+        # Docker sorts the tags of an image
+        return sorted(self._tags)
+
+    def tag(self, repository, tag=None):
+        self.client.images.tag(self, f"{repository}:{tag or 'latest'}")
+        return True
+
+    def save(self, named=False):
+        """Exports the image with one tag, like `docker.models.images.Image.save`"""
+        if named is True:
+            name = self.tags[0] if self.tags else self.id
+        elif named:
+            if named not in self.tags:
+                raise InvalidArgument(f"{named} is not a valid tag for this image")
+            name = named
+        else:
+            name = self.id
+
+        yield (self, name)
+
+
+class FakeImages:
+    def __init__(self, client):
+        self.client = client
+        self.all = []
+        self.loaded = []
+
+    def add(self, *tags, labels=None, created="2022-09-01T00:00:00Z", id=None):
+        image = FakeImage(self.client, labels, created, id)
+        self.all.append(image)
+        for tag in tags:
+            self.tag(image, tag)
+        return image
+
+    def tag(self, image, name):
+        for other in self.all:
+            other._tags.discard(name)
+        image._tags.add(name)
+        if image not in self.all:
+            self.all.append(image)
+
+    def get(self, name):
+        if ":" not in name:
+            name += ":latest"
+        for image in self.all:
+            if name in image.tags or image.id == name:
+                return image
+        raise ImageNotFound(name)
+
+    def list(self, filters=None):
+        label = (filters or {}).get("label")
+        return [image for image in self.all if not label or label in image.labels]
+
+    def remove(self, tag):
+        image = self.get(tag)
+        if any(c.image is image for c in self.client.containers.all):
+            raise APIError(f"conflict: image {tag} is used by a container")
+        image._tags.discard(tag)
+
+    def prune(self, filters=None):
+        dangling = [image for image in self.all if not image.tags]
+        self.all = [image for image in self.all if image.tags]
+        return {"ImagesDeleted": [{"Deleted": image.id} for image in dangling]}
+
+    def load(self, data):
+        for source, name in data:
+            image = next((i for i in self.all if i.id == source.id), None)
+            if not image:
+                image = self.add(labels=source.labels, created=source.attrs["Created"], id=source.id)
+            if name != source.id:
+                self.tag(image, name)
+            self.loaded.append(name)
+        return [image]
+
+    def build(self, fileobj, tag, **kwargs):
+        self.client.built.append((tag, fileobj.read().decode()))
+        return self.add(tag), []
+
+
+class FakeContainer:
+    def __init__(self, client, name, labels=None, status="running", image=None,
+                    started_at="2022-09-01T00:00:00.123456789Z", finished_at="0001-01-01T00:00:00Z"):
+        self.client = client
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.labels = labels or {}
+        self.status = status
+        self.image = image
+        self.attrs = {"State": {"StartedAt": started_at, "FinishedAt": finished_at}}
+
+    def reload(self):
+        if self not in self.client.containers.all:
+            raise NotFound(self.name)
+
+    def start(self):
+        self.status = "running"
+
+    def stop(self):
+        self.status = "exited"
+
+    def remove(self, force=False):
+        self.client.containers.all.remove(self)
+
+
+class FakeContainers:
+    def __init__(self, client):
+        self.client = client
+        self.all = []
+
+    def add(self, name, app_name=None, status="running", memory=0, cpu=0, image=None, **labels):
+        app_name = name if app_name is None else app_name
+        labels = {**({"paatr.app": app_name} if app_name else {}), "paatr.node": self.client.name,
+                    "paatr.memory": str(memory), "paatr.cpu": str(cpu), **labels}
+        container = FakeContainer(self.client, name, labels, status, image)
+        self.all.append(container)
+        return container
+
+    def get(self, name):
+        for container in self.all:
+            if name in (container.name, container.id):
+                return container
+        raise NotFound(name)
+
+    def list(self, all=False, filters=None):
+        filters = filters or {}
+        label = filters.get("label")
+        statuses = filters.get("status")
+        statuses = [statuses] if type(statuses) == str else statuses
+
+        found = []
+        for container in self.all:
+            if not all and container.status != "running":
+                continue
+            if statuses and container.status not in statuses:
+                continue
+            if label:
+                key, _, value = label.partition("=")
+                if key not in container.labels or (value and container.labels[key] != value):
+                    continue
+            found.append(container)
+
+        return found
+
+
+class FakeApi:
+    """The low-level api of `FakeDockerClient`, counting the listings"""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = 0
+        self.pulled = []
+        self.pruned_builds = []
+
+    def images(self):
+        self.calls += 1
+        return [{"RepoTags": image.tags or None, "Labels": image.labels} for image in self.client.images.all]
+
+    def containers(self, all=False, filters=None):
+        self.calls += 1
+        return [{"Id": c.id, "Names": [f"/{c.name}"], "State": c.status, "Labels": c.labels}
+                for c in self.client.containers.list(all=all, filters=filters)]
+
+    def pull(self, repository, tag, stream=False, decode=False):
+        self.pulled.append(f"{repository}:{tag}")
+        self.client.images.add(f"{repository}:{tag}")
+        yield {"id": "layer", "status": "Downloading", "progressDetail": {"current": 5, "total": 10}}
+        yield {"status": "Status: Downloaded newer image"}
+
+    def _url(self, path):
+        return path
+
+    def _post(self, url, params=None):
+        self.pruned_builds.append(params)
+        return params
+
+    def _result(self, response, json=False):
+        cache = self.client.build_cache
+        keep, reclaimed = response["keep-storage"], 0
+        while cache and sum(entry["Size"] for entry in cache) > keep:
+            reclaimed += cache.pop(0)["Size"]
+        return {"SpaceReclaimed": reclaimed}
+
+
+class FakeDockerClient:
+    """A docker daemon kept in memory, with `memory` bytes and `cpus` for containers"""
+
+    def __init__(self, name="local", memory=4 * GiB, cpus=2):
+        self.name = name
+        self.memory = memory
+        self.cpus = cpus
+        self.build_cache = []
+        self.built = []
+        self.images = FakeImages(self)
+        self.containers = FakeContainers(self)
+        self.api = FakeApi(self)
+
+    def info(self):
+        return {"MemTotal": self.memory, "NCPU": self.cpus}
+
+    def df(self):
+        return {"LayersSize": 0, "BuildCache": self.build_cache}
+
 
 @pytest.fixture(scope="module")
 def test_client():
     yield TestClient(create_app())
+
+
+@pytest.fixture
+def state_dir(tmp_path, monkeypatch):
+    locks_dir = tmp_path / "locks"
+    locks_dir.mkdir()
+    monkeypatch.setattr(Config, "STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(Config, "APPS_LOGS", str(tmp_path / "paatr-apps.log"))
+    monkeypatch.setattr(Config, "LOCKS_DIR", str(locks_dir))
+    monkeypatch.setattr(Config, "BUILD_ARCHIVE_DIR", str(tmp_path / "archive"))
+    return tmp_path
+
+
+@pytest.fixture
+def docker_node(state_dir):
+    """
+    Registers in-memory docker nodes in place of the configured ones, e.g
+    `docker_node("worker-1", host="10.0.0.2", memory=8 * GiB)`
+    """
+    registered = dict(nodes.NODES)
+    nodes.NODES.clear()
+
+    def register(name="local", host="localhost", **kwargs):
+        return nodes.register_node(name, FakeDockerClient(name, **kwargs), host)
+
+    yield register
+
+    nodes.NODES.clear()
+    nodes.NODES.update(registered)
@@ -0,0 +1,44 @@
+from paatr import BUILD_LOGS_TABLE, Config, archive
+from paatr.coordination import update_table
+from paatr.helpers import _add_build_log, get_build_logs, get_status_version
+
+
+def test_old_build_logs_are_archived(state_dir, monkeypatch):
+    monkeypatch.setattr(Config, "GC_KEEP_BUILD_LOGS", 2)
+    for i in range(4):
+        _add_build_log(f"build-{i}", "app-1", f"Built {i}", "success")
+    _add_build_log("build-4", "app-1", "Cloning", "building")
+    # The oldest build is still running
+    _add_build_log("build-0", "app-1", "Still building", "building")
+    version = get_status_version("myapp", "app-1")
+
+    archived, written = archive.archive_build_logs()
+
+    assert get_status_version("myapp", "app-1") != version
+
+    assert archived == 2
+    assert written > 0
+    assert set(get_build_logs("app-1")) == {"build-0", "build-3", "build-4"}
+
+    builds = archive.list_builds("app-1")
+    assert set(builds) == {f"build-{i}" for i in range(5)}
+    assert builds["build-1"]["archived"] is True
+    assert "logs" not in builds["build-1"]
+
+    record = archive.get_build_record("app-1", "build-1")
+    assert record["logs"] == ["Built 1"]
+    assert archive.get_build_record("app-1", "build-9") is None
+
+
+def test_build_logs_past_their_ttl_are_archived(state_dir, monkeypatch):
+    monkeypatch.setattr(Config, "BUILD_LOGS_TTL_DAYS", 1)
+    _add_build_log("build-0", "app-1", "Built", "success")
+    _add_build_log("build-1", "app-1", "Built", "success")
+
+    # Backdate the first build
+    update_table(BUILD_LOGS_TABLE, "app-1", lambda records: {
+        **records, "build-0": {**records["build-0"], "created_at": "2022-01-01T00:00:00"}
+    })
+
+    assert archive.archive_build_logs()[0] == 1
+    assert set(get_build_logs("app-1")) == {"build-1"}
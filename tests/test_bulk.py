@@ -0,0 +1,70 @@
+import pytest
+from requests.exceptions import ConnectionError
+
+from paatr import HIBERNATION_TABLE, helpers, jobs
+from paatr.coordination import update_table
+from paatr.models import App
+
+
+@pytest.fixture
+def local_node(docker_node):
+    node = docker_node()
+    node.client.images.add("running:latest", "running:build-1", labels={"paatr.replicas": "2"})
+    node.client.images.add("sleepy:latest")
+    node.client.images.add("stopped:latest")
+    node.client.images.add("unbuilt:build-1")
+    node.client.images.add()
+    node.client.containers.add("running")
+    node.client.containers.add("running.1", app_name="running", status="exited")
+    node.client.containers.add("sleepy", status="exited")
+    # From before containers were labelled
+    node.client.containers.add("stopped", app_name="", status="exited")
+    return node
+
+
+def test_bulk_status_lists_each_node_once(local_node):
+    update_table(HIBERNATION_TABLE, "sleepy", lambda _: {"hibernated_at": "2022-09-01T00:00:00"})
+
+    statuses = helpers.get_apps_status(["running", "sleepy", "stopped", "unbuilt"])
+
+    assert local_node.client.api.calls == 2
+    assert statuses["running"]["status"] == "running"
+    assert statuses["running"]["replicas"] == {"desired": 2, "running": 1}
+    assert statuses["sleepy"]["status"] == "hibernated"
+    assert statuses["stopped"]["status"] == "stopped"
+    assert statuses["unbuilt"]["status"] == "not-built"
+
+
+def test_bulk_status_of_an_unreachable_node(local_node, monkeypatch):
+    def images():
+        raise ConnectionError("Connection refused")
+
+    monkeypatch.setattr(local_node.client.api, "images", images)
+
+    statuses = helpers.get_apps_status(["running"])
+
+    assert statuses["running"] == {"message": "Node local is unreachable", "status": "unknown"}
+    assert not local_node.healthy
+
+
+def test_bulk_action_reports_each_app(test_client, state_dir, monkeypatch):
+    apps = [App("user-1", name, "", app_id=f"id-{name}", id=i) for i, name in enumerate(["good", "bad"])]
+    monkeypatch.setattr(App, "get_many", classmethod(lambda cls, app_ids: apps))
+    monkeypatch.setitem(jobs.RUNNERS, "stop", 
+                        lambda app_data, job: "Failed to stop app" if app_data.name == "bad" else None)
+
+    response = test_client.post("/services/bulk/stop", json={"app_ids": ["id-good", "id-bad", "id-gone"]})
+    assert response.status_code == 200
+
+    job = test_client.get(f"/services/bulk/jobs/{response.json()['job_id']}").json()
+    assert job["status"] == "done"
+    assert job["failed"] == 2
+    assert job["results"]["id-good"]["ok"] is True
+    assert job["results"]["id-good"]["name"] == "good"
+    assert job["results"]["id-bad"]["message"] == "Failed to stop app"
+    assert job["results"]["id-gone"]["message"] == "App not found"
+
+
+def test_unknown_bulk_action(test_client, state_dir):
+    response = test_client.post("/services/bulk/delete", json={"app_ids": ["id-good"]})
+    assert response.status_code == 400
@@ -0,0 +1,82 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from paatr import Config, cleanup
+from paatr.helpers import get_build_logs
+
+
+@pytest.fixture
+def node(docker_node, monkeypatch):
+    monkeypatch.setattr(Config, "GC_KEEP_IMAGES", 2)
+    return docker_node()
+
+
+def _build(node, app_name, created, *tags):
+    return node.client.images.add(*tags, labels={"paatr.app": app_name}, created=created)
+
+
+def _tags(node):
+    return {tag for image in node.client.images.all for tag in image.tags}
+
+
+def test_old_builds_are_pruned(node):
+    _build(node, "myapp", "2022-09-04", "myapp:build-4")
+    _build(node, "myapp", "2022-09-03", "myapp:build-3")
+    _build(node, "myapp", "2022-09-02", "myapp:build-2")
+    # Rolled back to an old build, it stays
+    _build(node, "myapp", "2022-09-01", "myapp:build-1", "myapp:latest")
+    _build(node, "other", "2022-09-01", "other:build-1", "other:latest")
+
+    assert cleanup.prune_app_images(node) == 1
+    assert _tags(node) == {"myapp:build-4", "myapp:build-3", "myapp:build-1",
+                            "myapp:latest", "other:build-1", "other:latest"}
+
+
+def test_unused_apps_are_evicted(node, monkeypatch):
+    monkeypatch.setattr(Config, "GC_UNUSED_DAYS", 30)
+    recently = datetime.now(timezone.utc).isoformat()
+
+    old = node.client.images.add("old:latest", labels={"paatr.app": "old", "paatr.app_id": "app-1"},
+                                    created="2022-01-01T00:00:00Z")
+    node.client.containers.add("old", status="exited", image=old)
+    node.client.containers.add("running", image=_build(node, "running", "2022-01-01", "running:latest"))
+    _build(node, "recent", "2022-01-01", "recent:latest")
+    node.client.containers.add("recent", status="exited").attrs["State"]["FinishedAt"] = recently
+    _build(node, "fresh", recently, "fresh:latest")
+
+    assert cleanup.evict_unused_apps() == ["old"]
+    assert _tags(node) == {"running:latest", "recent:latest", "fresh:latest"}
+    assert [c.name for c in node.client.containers.all] == ["running", "recent"]
+    [record] = get_build_logs("app-1").values()
+    assert record["status"] == "evicted"
+
+
+def test_build_cache_is_trimmed_to_its_budget(node, monkeypatch):
+    monkeypatch.setattr(Config, "GC_BUILD_CACHE_BUDGET", 300)
+    node.client.build_cache.extend({"ID": str(i), "Size": 100} for i in range(3))
+
+    assert cleanup.prune_build_cache(node) == 0
+    assert node.client.api.pruned_builds == []
+
+    node.client.build_cache.append({"ID": "3", "Size": 150})
+
+    assert cleanup.prune_build_cache(node) == 200
+    assert [entry["ID"] for entry in node.client.build_cache] == ["2", "3"]
+    assert node.client.api.pruned_builds == [{"keep-storage": 300}]
+
+
+def test_orphan_app_dirs_are_removed(node, state_dir, monkeypatch):
+    apps_dir = state_dir / "apps"
+    monkeypatch.setattr(Config, "APP_FILES_DIR", str(apps_dir))
+    for app_name in ("myapp", "legacy", "gone"):
+        (apps_dir / app_name).mkdir(parents=True)
+        (apps_dir / app_name / "app.py").write_text("print('hello')\n")
+    (apps_dir / "notes.txt").write_text("not an app\n")
+
+    _build(node, "myapp", "2022-09-01", "myapp:latest")
+    # From before containers were labelled
+    node.client.containers.add("legacy", app_name="", status="exited")
+
+    assert cleanup.remove_orphan_app_dirs() == (1, len("print('hello')\n"))
+    assert sorted(path.name for path in apps_dir.iterdir()) == ["legacy", "myapp", "notes.txt"]
@@ -0,0 +1,113 @@
+import multiprocessing
+import threading
+import time
+
+from paatr import BUILD_QUEUE_TABLE, VERSIONS_TABLE, Config
+from paatr import coordination, helpers
+from paatr.helpers import _add_build_log, get_build_logs
+
+WORKERS = 4
+
+
+def _run_workers(target, *args):
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=target, args=(i, *args)) for i in range(WORKERS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+
+def _write_logs(worker, count):
+    for i in range(count):
+        _add_build_log("build-1", "app-1", f"{worker}:{i}")
+
+
+def test_concurrent_build_logs(state_dir):
+    _run_workers(_write_logs, 25)
+
+    logs = get_build_logs("app-1")["build-1"]["logs"]
+    assert len(logs) == WORKERS * 25
+    assert len(set(logs)) == len(logs)
+
+
+def _record_build(marker_dir, build_id, **kwargs):
+    marker = marker_dir / "running"
+    # Fails if another worker is already building this app
+    marker.mkdir()
+    time.sleep(0.05)
+    (marker_dir / build_id).touch()
+    marker.rmdir()
+
+
+def _queue_and_drain(worker, marker_dir):
+    for i in range(3):
+        coordination.enqueue_build(BUILD_QUEUE_TABLE, "app-1", {"build_id": f"{worker}-{i}"})
+        coordination.drain_builds(BUILD_QUEUE_TABLE, "app-1",
+                                    lambda **job: _record_build(marker_dir, **job))
+
+
+def test_shared_build_queue_runs_each_build_once(state_dir):
+    marker_dir = state_dir / "builds"
+    marker_dir.mkdir()
+
+    _run_workers(_queue_and_drain, marker_dir)
+
+    built = {path.name for path in marker_dir.iterdir()}
+    assert built == {f"{w}-{i}" for w in range(WORKERS) for i in range(3)}
+    assert coordination.read_table(BUILD_QUEUE_TABLE, "app-1") == []
+
+
+def test_expire_keys_skips_values_updated_meanwhile(state_dir):
+    for key, value in (("a", 1), ("b", 2), ("c", 3)):
+        coordination.update_table("things", key, lambda _: value)
+
+    assert coordination.expire_keys("things", lambda value: value < 3) == 2
+    assert coordination.read_table("things", "a") is None
+    assert coordination.read_table("things", "c") == 3
+
+    # Rechecked under the key lock
+    calls = []
+
+    def expired(value):
+        calls.append(value)
+        if len(calls) == 1:
+            coordination.update_table("things", "c", lambda _: 10)
+        return value < 5
+
+    assert coordination.expire_keys("things", expired) == 0
+    assert coordination.read_table("things", "c") == 10
+
+
+def test_tables_share_the_connection_of_their_thread(state_dir):
+    with coordination.open_table("things") as db:
+        db["a"] = {"value": 1}
+        db.commit()
+        db["b"] = 2
+
+    # Not committed, dropped on close
+    with coordination.open_table("things") as db:
+        assert db.items() == [("a", {"value": 1})]
+        connection = db.conn
+
+    assert coordination.open_table("things").conn is connection
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(coordination.open_table("things").conn))
+    thread.start()
+    thread.join()
+    assert other[0] is not connection
+
+
+def test_docker_output_is_written_in_batches(docker_node, monkeypatch):
+    node = docker_node()
+    image = node.client.images.add(id="sha256:" + "f" * 64)
+    lines = [{"stream": f"Step {i}/50\n"} for i in range(50)] + [{"aux": {"ID": image.id}}]
+    monkeypatch.setattr(helpers, "docker_build", lambda *args, **kwargs: (iter(lines), lambda: None))
+    monkeypatch.setattr(Config, "BUILD_LOG_FLUSH_INTERVAL", 3600)
+
+    helpers.build_docker_image("build-1", "/tmp", "myapp", "app-1")
+
+    assert get_build_logs("app-1")["build-1"]["logs"] == [f"Step {i}/50" for i in range(50)]
+    assert coordination.read_table(VERSIONS_TABLE, "build:app-1") == 1
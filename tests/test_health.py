@@ -0,0 +1,71 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from paatr import helpers
+from paatr.health import health_check, wait_until_ready
+
+CHECK = {"type": "tcp", "path": "/", "timeout": 1, "interval": 0.1, "start_period": 0.5}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200 if self.path == "/healthz" else 503)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_port():
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_port
+    server.shutdown()
+
+
+def _closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_tcp_probe(http_port):
+    results = wait_until_ready({0: ("127.0.0.1", http_port), 1: ("127.0.0.1", _closed_port())}, CHECK)
+
+    assert results[0] == (True, "Accepting connections")
+    assert results[1][0] is False
+
+
+def test_http_probe(http_port):
+    check = {**CHECK, "type": "http", "path": "/healthz"}
+    assert wait_until_ready({0: ("127.0.0.1", http_port)}, check)[0] == (True, "GET /healthz returned 200")
+
+    check["path"] = "/"
+    assert wait_until_ready({0: ("127.0.0.1", http_port)}, check)[0] == (False, "GET / returned 503")
+
+
+def test_apps_without_a_check_get_a_tcp_one():
+    assert health_check({})["type"] == "tcp"
+    assert health_check({"paatr.health": '{"type": "http", "path": "/up"}'})["path"] == "/up"
+
+
+def test_only_ready_replicas_get_traffic(state_dir, monkeypatch):
+    monkeypatch.setattr(helpers, "get_replicas", lambda app_name: 3)
+
+    helpers.record_health("myapp", {0: "starting", 1: "starting", 2: "starting"})
+    assert helpers.get_health("myapp")["state"] == "starting"
+    assert helpers.ready_replicas("myapp") == []
+
+    helpers.record_health("myapp", {0: "ready", 1: "unhealthy", 2: "ready"}, {1: "Connection refused"})
+    assert helpers.get_health("myapp")["state"] == "unhealthy"
+    assert helpers.ready_replicas("myapp") == [0, 2]
+
+    # Scaled down, the unhealthy replica is gone
+    monkeypatch.setattr(helpers, "get_replicas", lambda app_name: 1)
+    helpers.record_health("myapp", {})
+    assert helpers.get_health("myapp")["state"] == "ready"
+    assert helpers.ready_replicas("myapp") == [0]
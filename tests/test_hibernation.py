@@ -0,0 +1,108 @@
+import os
+import time
+
+import pytest
+
+from paatr import HIBERNATION_TABLE, Config, hibernation
+from paatr.coordination import app_lock, read_table, update_table
+from paatr.helpers import get_build_logs, get_hibernation
+
+GiB = 2 ** 30
+
+
+@pytest.fixture
+def node(docker_node, state_dir, monkeypatch):
+    monkeypatch.setattr(Config, "NGINX_ACCESS_LOGS_DIR", str(state_dir))
+    monkeypatch.setattr(Config, "MEMORY_OVERCOMMIT", 1)
+    monkeypatch.setattr(hibernation, "get_image", lambda app_name: None)
+    return docker_node()
+
+
+def _container(node, name="myapp", status="running", memory=GiB):
+    return node.client.containers.add(name, app_name="myapp", status=status, memory=memory,
+                                        **{"paatr.app_id": "app-1", "paatr.port": "10001"})
+
+
+def _requested(state_dir, seconds_ago):
+    access_log = state_dir / "myapp.access.log"
+    access_log.touch()
+    then = time.time() - seconds_ago
+    os.utime(access_log, (then, then))
+    return then
+
+
+def test_last_activity_is_the_latest_request_or_start(node, state_dir):
+    container = _container(node)
+    started_at = 1661990400  # 2022-09-01T00:00:00Z
+
+    assert hibernation.last_activity(container) == started_at
+
+    requested_at = _requested(state_dir, 60)
+    assert hibernation.last_activity(container) == pytest.approx(requested_at)
+
+
+def test_idle_apps_are_hibernated(node, state_dir, monkeypatch):
+    monkeypatch.setattr(Config, "IDLE_TIMEOUT", 600)
+    container = _container(node)
+
+    _requested(state_dir, 60)
+    assert hibernation.hibernate_idle_apps() == []
+    assert container.status == "running"
+
+    _requested(state_dir, 601)
+    assert hibernation.hibernate_idle_apps() == ["myapp"]
+    assert container.status == "exited"
+    assert get_hibernation("myapp")["hibernated_at"]
+
+
+def test_wake_app_waits_for_the_health_check(node, monkeypatch):
+    checked = []
+    monkeypatch.setattr(hibernation, "wait_until_ready",
+                        lambda targets, check: checked.append(targets) or {0: (True, "Ready")})
+    container = _container(node, status="exited")
+
+    assert hibernation.wake_app("myapp") == (None, "App is not hibernating")
+
+    update_table(HIBERNATION_TABLE, "myapp", lambda _: {"hibernated_at": "2022-09-01T00:00:00"})
+    assert hibernation.wake_app("myapp") == ("localhost:10001", "App is running")
+
+    assert container.status == "running"
+    assert checked == [{0: ("localhost", 10001)}]
+    assert get_hibernation("myapp") is None
+    assert len(read_table(HIBERNATION_TABLE, "myapp")["cold_starts"]) == 1
+
+    # Woken by another call
+    assert hibernation.wake_app("myapp") == (None, "App is already running")
+    with app_lock("myapp.container"):
+        assert hibernation.wake_app("myapp", blocking=False) is None
+
+
+def test_wake_app_fails_when_the_app_never_gets_ready(node, monkeypatch):
+    monkeypatch.setattr(hibernation, "wait_until_ready", lambda targets, check: {0: (False, "Timed out")})
+    update_table(HIBERNATION_TABLE, "myapp", lambda _: {"hibernated_at": "2022-09-01T00:00:00"})
+    _container(node, status="exited")
+
+    assert hibernation.wake_app("myapp") == (None, "App did not wake up in time")
+    assert get_hibernation("myapp")["hibernated_at"]
+    [record] = get_build_logs("app-1").values()
+    assert record["status"] == "failed"
+
+
+def test_wake_app_is_refused_without_memory(node):
+    update_table(HIBERNATION_TABLE, "myapp", lambda _: {"hibernated_at": "2022-09-01T00:00:00"})
+    container = _container(node, status="exited", memory=2 * GiB)
+    node.client.containers.add("other", memory=3 * GiB)
+
+    assert hibernation.wake_app("myapp") == (None, "Not enough resources to wake the app")
+    assert container.status == "exited"
+
+
+def test_held_requests_are_only_replayed_by_the_waker(node, test_client, monkeypatch):
+    monkeypatch.setattr(Config, "WAKE_TIMEOUT", 0)
+    _container(node)
+
+    # Running already, e.g woken by another request
+    assert test_client.post("/wake/myapp").status_code == 502
+
+    with app_lock("myapp.container"):
+        assert test_client.post("/wake/myapp").status_code == 504
@@ -0,0 +1,83 @@
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+from paatr import Config, helpers
+from paatr.models import App
+from paatr.nodes import record_port
+
+
+@pytest.fixture
+def nginx_conf(docker_node, state_dir, monkeypatch):
+    path = state_dir / "paatr-apps.conf"
+    monkeypatch.setattr(Config, "NGINX_ENABLED_PAATR_APPS", str(path))
+    monkeypatch.setattr(Config, "NGINX_ACCESS_LOGS_DIR", str(state_dir / "nginx"))
+    docker_node(host="127.0.0.1")
+    for index in range(3):
+        record_port("myapp", index, 10000 + index)
+    record_port("otherapp", 0, 10010)
+    return path
+
+
+def _ready(monkeypatch, *replicas):
+    monkeypatch.setattr(helpers, "ready_replicas", lambda app_name: list(replicas))
+
+
+def test_failed_config_check_keeps_the_previous_config(nginx_conf, monkeypatch):
+    commands = []
+
+    def run(command, **kwargs):
+        commands.append(command)
+        return SimpleNamespace(returncode=1, stderr="nginx: [emerg] unknown directive")
+
+    monkeypatch.setattr(Config, "MODE", "prod")
+    monkeypatch.setattr(subprocess, "run", run)
+    _ready(monkeypatch, 0)
+    nginx_conf.write_text("server {\n    server_name other.paatrapp.live;\n}\n")
+
+    error = helpers._add_subdomain(App("user-1", "myapp", "", app_id="id-1", id=1))
+
+    assert "unknown directive" in error
+    assert commands == [["sudo", "nginx", "-t"]]
+    assert nginx_conf.read_text() == "server {\n    server_name other.paatrapp.live;\n}\n"
+    assert (nginx_conf.parent / "nginx").is_dir()
+
+
+def test_upstream_lists_the_ready_replicas(nginx_conf, monkeypatch):
+    app = App("user-1", "myapp", "", app_id="id-1", id=1)
+    _ready(monkeypatch, 0, 2)
+
+    assert helpers._add_subdomain(app) is None
+
+    config = nginx_conf.read_text()
+    assert "upstream paatr_myapp {" in config
+    assert "server 127.0.0.1:10000 max_fails=3 fail_timeout=10s;" in config
+    assert "server 127.0.0.1:10002 max_fails=3 fail_timeout=10s;" in config
+    assert "127.0.0.1:10001" not in config
+    assert "proxy_pass http://paatr_myapp;" in config
+
+
+def test_app_blocks_are_replaced(nginx_conf, monkeypatch):
+    other = App("user-1", "otherapp", "", app_id="id-2", id=2)
+    app = App("user-1", "myapp", "", app_id="id-1", id=1)
+    _ready(monkeypatch, 0)
+    helpers._add_subdomain(other)
+    helpers._add_subdomain(app)
+
+    _ready(monkeypatch, 0, 1)
+    helpers._add_subdomain(app)
+
+    config = nginx_conf.read_text()
+    assert config.count("upstream paatr_myapp") == 1
+    assert config.count("server_name myapp.paatrapp.live;") == 1
+    assert "127.0.0.1:10001" in config
+    assert "upstream paatr_otherapp" in config
+
+    # No replica is ready, nginx stops routing to the app
+    _ready(monkeypatch)
+    helpers._add_subdomain(app)
+
+    config = nginx_conf.read_text()
+    assert "paatr_myapp" not in config
+    assert "server_name otherapp.paatrapp.live;" in config
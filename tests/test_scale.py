@@ -0,0 +1,65 @@
+import pytest
+
+from paatr import Config, nodes
+from paatr.coordination import app_lock
+from paatr.endpoints import service
+from paatr.exceptions import PortsExhausted
+from paatr.helpers import replica_port
+from paatr.models import App
+
+
+def _allocate(app_name, index):
+    with app_lock("admission"):
+        return nodes.allocate_port(app_name, index)
+
+
+def test_replicas_keep_their_port(docker_node):
+    ports = [_allocate(app_name, i) for app_name in ("first", "second") for i in range(3)]
+
+    assert ports == list(range(Config.HOST_PORT_MIN, Config.HOST_PORT_MIN + 6))
+    assert _allocate("first", 1) == ports[1]
+    assert replica_port("second", 2) == ports[5]
+
+
+def test_ports_of_unplaced_replicas_are_reused(docker_node):
+    docker_node()
+    first = _allocate("myapp", 1)
+    nodes.unplace_replica("myapp", 1)
+
+    assert replica_port("myapp", 1) is None
+    assert _allocate("other", 0) == first
+
+
+def test_ports_run_out(state_dir, monkeypatch):
+    monkeypatch.setattr(Config, "HOST_PORT_MAX", Config.HOST_PORT_MIN + 1)
+    _allocate("myapp", 0)
+    _allocate("myapp", 1)
+
+    with pytest.raises(PortsExhausted):
+        _allocate("myapp", 2)
+
+
+def test_ports_of_old_containers_are_adopted(docker_node):
+    docker_node().client.containers.add("myapp", **{"paatr.port": "10005"})
+
+    assert replica_port("myapp", 0) == 10005
+    assert _allocate("other", 0) == Config.HOST_PORT_MIN
+    assert nodes.get_port("myapp", 0) == 10005
+
+
+@pytest.mark.parametrize("replicas", [0, Config.MAX_REPLICAS + 1])
+def test_scale_is_validated(test_client, state_dir, monkeypatch, replicas):
+    monkeypatch.setattr(App, "get", classmethod(lambda cls, _: App("user-1", "myapp", "", app_id="id-1", id=1)))
+
+    response = test_client.post("/services/apps/id-1/scale", json={"replicas": replicas})
+
+    assert response.status_code == 400
+
+
+def test_scale_of_unbuilt_app(test_client, state_dir, monkeypatch):
+    monkeypatch.setattr(App, "get", classmethod(lambda cls, _: App("user-1", "myapp", "", app_id="id-1", id=1)))
+    monkeypatch.setattr(service, "get_image", lambda app_name: None)
+
+    response = test_client.post("/services/apps/id-1/scale", json={"replicas": 2})
+
+    assert response.json() == {"message": "App has not been built"}
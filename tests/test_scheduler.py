@@ -0,0 +1,102 @@
+import pytest
+from docker.errors import DockerException
+
+from paatr import Config, nodes
+from paatr.exceptions import InsufficientResources
+from paatr.helpers import _ensure_image, start_container
+
+GB = 1024 ** 3
+
+
+@pytest.fixture
+def cluster(docker_node):
+    docker_node("empty", "10.0.0.1", memory=4 * GB, cpus=4)
+    busy = docker_node("busy", "10.0.0.2", memory=4 * GB, cpus=4)
+    busy.client.containers.add("other", memory=3 * GB, cpu=1)
+    return nodes.NODES
+
+
+def test_best_fit_packs_the_fullest_node(cluster):
+    node = nodes.place_replica("myapp", 0, GB // 2, 0.5)
+
+    assert node.name == "busy"
+    assert nodes.replica_node("myapp", 0) is node
+
+
+def test_replicas_are_spread_across_nodes(cluster):
+    nodes.place_replica("myapp", 0, GB // 2, 0.5)
+    node = nodes.place_replica("myapp", 1, GB // 2, 0.5)
+
+    assert node.name == "empty"
+    assert [n.name for n in nodes.app_nodes("myapp")] == ["busy", "empty"]
+
+
+def test_replica_that_fits_nowhere_is_refused(cluster):
+    with pytest.raises(InsufficientResources):
+        nodes.place_replica("myapp", 0, 8 * GB, 0.5)
+
+    assert nodes.get_placements("myapp") == {}
+
+
+def test_unreachable_nodes_are_skipped(cluster, monkeypatch):
+    calls = []
+
+    def info():
+        calls.append("info")
+        raise DockerException("Error while fetching server API version")
+
+    monkeypatch.setattr(cluster["busy"].client, "info", info)
+
+    assert nodes.place_replica("myapp", 0, GB // 2, 0.5).name == "empty"
+    assert nodes.place_replica("myapp", 1, GB // 2, 0.5).name == "empty"
+    assert calls == ["info"]
+    assert [n.name for n in nodes.healthy_nodes()] == ["empty"]
+
+
+def test_nodes_connect_on_first_use(docker_node, monkeypatch):
+    def connect(base_url):
+        raise DockerException(f"Error while fetching server API version from {base_url}")
+
+    monkeypatch.setattr(nodes.docker, "DockerClient", connect)
+    monkeypatch.setattr(Config, "DOCKER_NODES", "worker-1=tcp://10.0.0.2:2376")
+    nodes.load_nodes()
+
+    assert nodes.get_node("worker-1").host == "10.0.0.2"
+    with pytest.raises(InsufficientResources):
+        nodes.place_replica("myapp", 0, GB // 2, 0.5)
+    assert nodes.healthy_nodes() == []
+
+
+def test_admission_refuses_to_oversubscribe(cluster, monkeypatch):
+    monkeypatch.setattr(Config, "MEMORY_OVERCOMMIT", 1)
+
+    cluster["busy"].check_capacity(GB)
+    with pytest.raises(InsufficientResources):
+        cluster["busy"].check_capacity(GB + 1)
+
+    monkeypatch.setattr(Config, "MEMORY_OVERCOMMIT", 1.5)
+    cluster["busy"].check_capacity(3 * GB)
+
+
+def test_containers_start_only_once_admitted(cluster, monkeypatch):
+    monkeypatch.setattr(Config, "MEMORY_OVERCOMMIT", 1)
+    too_big = cluster["busy"].client.containers.add("myapp", status="exited", memory=2 * GB)
+    fits = cluster["empty"].client.containers.add("myapp", status="exited", memory=2 * GB)
+
+    with pytest.raises(InsufficientResources):
+        start_container(too_big)
+    start_container(fits)
+
+    assert (too_big.status, fits.status) == ("exited", "running")
+
+
+def test_images_are_copied_with_their_latest_tag(cluster):
+    build_node, other = nodes.place_replica("myapp", 0, GB // 2, 0.5), cluster["empty"]
+    image = build_node.client.images.add("myapp:build-2", "myapp:latest")
+    other.client.images.add("myapp:build-1", "myapp:latest")
+
+    _ensure_image(other, "myapp")
+    _ensure_image(other, "myapp")
+
+    assert other.client.images.get("myapp:latest").id == image.id
+    assert other.client.images.loaded == ["myapp:latest"]
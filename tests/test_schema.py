@@ -0,0 +1,75 @@
+from collections import OrderedDict
+
+import pytest
+
+from paatr import schema
+from paatr.exceptions import ConfigError
+
+CONFIG = """\
+runtime: python3.9
+web: gunicorn app:app -b 0.0.0.0:8000
+port: 8000
+env:
+  DEBUG: true
+"""
+
+
+def test_defaults_are_filled_in():
+    config = schema.parse_config(CONFIG)
+
+    assert config["port"] == 8000
+    assert config["env"] == {"DEBUG": True}
+    assert config["run"] == []
+    assert config["replicas"] == 1
+    assert config["memory"] == 256 * 1024 ** 2
+    assert config["build"] == {"cache": True}
+    assert config["health"]["type"] == "tcp"
+    assert config["version"] == schema.SCHEMA_VERSION
+
+
+@pytest.mark.parametrize("text, message, line, column", [
+    (CONFIG + "replica: 2\n", "Unknown key `replica`, did you mean `replicas`?", 6, 1),
+    (CONFIG + "cpu: lots\n", "`cpu` must be an integer or a number, not a string", 6, 6),
+    (CONFIG + "build:\n  cache: 1\n", "`build.cache` must be a boolean, not an integer", 7, 10),
+    (CONFIG + "  2BAD: x\n", "Invalid key `2BAD` in `env`", 6, 3),
+    ("runtime: python2\nweb: python app.py\n", "Unknown runtime `python2`", 1, 10),
+    ("web: python app.py\n", "Missing `runtime` key", 1, 1),
+    ("runtime: [python3.9\n", None, 2, 1),
+    (CONFIG + "version: 7\n", "Unsupported version `7`", 6, 10),
+    (CONFIG + "health:\n  type: udp\n", "`health.type` must be one of tcp, http", 7, 9),
+])
+def test_errors_have_a_location(text, message, line, column):
+    with pytest.raises(ConfigError) as error:
+        schema.parse_config(text)
+
+    if message:
+        assert error.value.message.startswith(message)
+    assert (error.value.line, error.value.column) == (line, column)
+
+
+def test_parsed_configs_are_cached_and_copied(tmp_path, monkeypatch):
+    path = tmp_path / "paatr.yaml"
+    path.write_text(CONFIG)
+
+    monkeypatch.setattr(schema, "_cache", OrderedDict())
+    parsed = []
+    parse_config = schema.parse_config
+    monkeypatch.setattr(schema, "parse_config", lambda text: parsed.append(text) or parse_config(text))
+
+    config, digest = schema.load_config(path)
+    config["env"]["DEBUG"] = False
+    again, same_digest = schema.load_config(path)
+
+    assert len(parsed) == 1
+    assert again["env"] == {"DEBUG": True}
+    assert digest == same_digest
+
+
+def test_fingerprint_follows_sources():
+    config = schema.parse_config(CONFIG)
+
+    assert schema.build_fingerprint("abc", config) == schema.build_fingerprint("abc", dict(config))
+    assert schema.build_fingerprint("abc", config) != schema.build_fingerprint("abd", config)
+    assert schema.build_fingerprint("abc", config) != schema.build_fingerprint("abc", {**config, "port": 80})
+    assert schema.build_fingerprint("abc", config, base_id="sha256:1") != schema.build_fingerprint(
+                                                                            "abc", config, base_id="sha256:2")
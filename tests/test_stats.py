@@ -0,0 +1,62 @@
+import pytest
+
+from paatr import stats
+
+
+@pytest.fixture(autouse=True)
+def series(state_dir, monkeypatch):
+    monkeypatch.setattr(stats, "_series", {})
+    monkeypatch.setattr(stats, "_dirty", set())
+
+
+def test_parse_stats():
+    sample = {
+        "cpu_stats": {"cpu_usage": {"total_usage": 300}, "system_cpu_usage": 2000, "online_cpus": 2},
+        "precpu_stats": {"cpu_usage": {"total_usage": 100}, "system_cpu_usage": 1000},
+        "memory_stats": {"usage": 5000, "stats": {"inactive_file": 1000}},
+        "networks": {"eth0": {"rx_bytes": 10, "tx_bytes": 20}, "eth1": {"rx_bytes": 1, "tx_bytes": 2}}
+    }
+
+    assert stats.parse_stats(sample) == (40, 4000, 11, 22)
+
+
+def test_points_are_downsampled():
+    # Seven minutes of 10s points
+    for t in range(0, 7 * 60, 10):
+        stats.add_point("myapp", [3600 + t, t // 60, 100, 0, 0, 1])
+
+    series = stats.get_stats("myapp")["series"]
+    assert len(series["10s"]) == 42
+    # The seventh minute is still filling up
+    assert [p[:2] for p in series["1m"]] == [[3600 + 60 * m, m] for m in range(6)]
+    assert series["1h"] == []
+
+
+def test_ring_buffers_are_bounded(monkeypatch):
+    monkeypatch.setitem(stats.RESOLUTIONS, "10s", (10, 5))
+
+    for t in range(0, 100, 10):
+        stats.add_point("myapp", [t, 1, 1, 0, 0, 1])
+
+    assert [p[0] for p in stats.get_stats("myapp")["series"]["10s"]] == [50, 60, 70, 80, 90]
+
+
+def test_points_are_written_on_flush(monkeypatch):
+    for t in range(0, 70, 10):
+        stats.add_point("myapp", [t, 1, 1, 0, 0, 1])
+    stats.add_point("other", [0, 1, 1, 0, 0, 1])
+
+    # Another worker only sees flushed points
+    sampled = stats._series
+    monkeypatch.setattr(stats, "_series", {})
+    assert stats.get_stats("myapp")["series"]["10s"] == []
+
+    monkeypatch.setattr(stats, "_series", sampled)
+    stats.flush()
+    assert stats._dirty == set()
+
+    monkeypatch.setattr(stats, "_series", {})
+    series = stats.get_stats("myapp")["series"]
+    assert len(series["10s"]) == 7
+    assert [p[0] for p in series["1m"]] == [0]
+    assert len(stats.get_stats("other")["series"]["10s"]) == 1
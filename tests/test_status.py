@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from paatr import Config
+from paatr.endpoints import service
+from paatr.helpers import _add_build_log
+from paatr.models import App
+
+
+@pytest.fixture
+def myapp(state_dir, monkeypatch):
+    app = App("user-1", "myapp", "", app_id="app-1", id=1)
+    monkeypatch.setattr(App, "get", classmethod(lambda cls, app_id: app))
+    monkeypatch.setattr(service, "get_app_status", lambda app_name: {"status": "running"})
+    monkeypatch.setattr(Config, "STATUS_POLL_INTERVAL", 0.05)
+    return app
+
+
+def test_unchanged_status_is_not_modified(test_client, myapp):
+    response = test_client.get("/services/apps/app-1/status")
+    etag = response.headers["etag"]
+
+    response = test_client.get("/services/apps/app-1/status", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    _add_build_log("build-1", "app-1", "Cloning")
+
+    response = test_client.get("/services/apps/app-1/status", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_long_poll_returns_on_change(test_client, myapp):
+    etag = test_client.get("/services/apps/app-1/status").headers["etag"]
+
+    timer = threading.Timer(0.2, _add_build_log, args=("build-1", "app-1", "Cloning"))
+    timer.start()
+
+    response = test_client.get("/services/apps/app-1/status?wait=10", 
+                                headers={"If-None-Match": etag})
+    timer.join()
+
+    assert response.status_code == 200
+    assert response.elapsed.total_seconds() < 5
+
+
+def test_long_poll_times_out(test_client, myapp):
+    etag = test_client.get("/services/apps/app-1/status").headers["etag"]
+
+    response = test_client.get("/services/apps/app-1/status?wait=0.2", 
+                                headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_unchanged_status_does_not_look_the_app_up(test_client, myapp, monkeypatch):
+    etag = test_client.get("/services/apps/app-1/status").headers["etag"]
+    looked_up = []
+    monkeypatch.setattr(App, "get", classmethod(lambda cls, app_id: looked_up.append(app_id) or myapp))
+
+    response = test_client.get("/services/apps/app-1/status", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert looked_up == []
+
+    _add_build_log("build-1", "app-1", "Cloning")
+
+    response = test_client.get("/services/apps/app-1/status", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert looked_up == ["app-1"]
@@ -0,0 +1,62 @@
+import pytest
+
+from paatr import Config, SUPERVISOR_TABLE
+from paatr import supervisor
+from paatr.coordination import update_table
+from paatr.helpers import expect_stop, get_build_logs, get_crashes
+
+
+class FakeContainer:
+    name = "myapp"
+
+
+@pytest.fixture
+def timers(state_dir, monkeypatch):
+    started = []
+
+    class FakeTimer:
+        def __init__(self, delay, fn, args):
+            started.append(delay)
+        def start(self):
+            pass
+
+    monkeypatch.setattr(supervisor.threading, "Timer", FakeTimer)
+    return started
+
+
+def _die_event(exit_code=1, action="die"):
+    return {"Action": action, "Actor": {"ID": "c1", "Attributes": {
+        "name": "myapp", "exitCode": str(exit_code), "paatr.app": "myapp", "paatr.app_id": "app-1"
+    }}}
+
+
+def test_crash_is_restarted_with_backoff(timers):
+    update_table(SUPERVISOR_TABLE, "myapp", lambda _: {"restarts": [supervisor.time.time()] * 2})
+
+    supervisor.handle_event(None, _die_event(), set())
+
+    assert timers == [supervisor.backoff(2)]
+    assert get_crashes("myapp")["last_exit_code"] == 1
+
+
+def test_expected_stop_is_not_restarted(timers):
+    expect_stop(FakeContainer())
+
+    supervisor.handle_event(None, _die_event(exit_code=143), set())
+
+    assert timers == []
+
+
+def test_crash_loop_is_given_up_on(timers):
+    restarts = [supervisor.time.time()] * Config.CRASH_LOOP_RESTARTS
+    update_table(SUPERVISOR_TABLE, "myapp", lambda _: {"restarts": restarts})
+
+    oom_killed = set()
+    supervisor.handle_event(None, _die_event(action="oom"), oom_killed)
+    supervisor.handle_event(None, _die_event(exit_code=137), oom_killed)
+
+    assert timers == []
+    assert get_crashes("myapp")["crash_loop"]
+    [record] = get_build_logs("app-1").values()
+    assert record["status"] == "crash-loop"
+    assert "ran out of memory" in record["logs"][0]
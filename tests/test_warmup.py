@@ -0,0 +1,34 @@
+import pytest
+
+from paatr import Config, warmup
+
+
+@pytest.fixture
+def node(docker_node, monkeypatch):
+    monkeypatch.setattr(Config, "BAKE_BASE_IMAGES", True)
+    return docker_node()
+
+
+def test_missing_base_image_is_pulled_and_baked(node):
+    image = warmup.base_image("python:3.9-alpine3.15")
+    assert image == "paatr/python-build:3.9-alpine3.15"
+
+    warmup.ensure_base_image(node, image)
+
+    assert node.client.api.pulled == ["python:3.9-alpine3.15"]
+    assert node.client.built[0][0] == image
+    assert "FROM python:3.9-alpine3.15" in node.client.built[0][1]
+
+    # Already there, nothing to do
+    warmup.ensure_base_image(node, image)
+    assert len(node.client.api.pulled) == 1
+
+
+def test_warmup_report(node):
+    warmup.pull_image(node, "python:3.9-alpine3.15")
+
+    record = warmup.warmup_report()["local/python:3.9-alpine3.15"]
+    assert record["status"] == "ready"
+    assert record["updated"] is True
+    assert record["image_id"] == node.client.images.get("python:3.9-alpine3.15").id
+    assert record["stale"] is False
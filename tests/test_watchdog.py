@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+from paatr import BUILD_QUEUE_TABLE, Config, watchdog
+from paatr.coordination import read_table
+from paatr.exceptions import BuildCancelled
+from paatr.helpers import cancel_build, get_build_logs, queue_build
+
+
+@pytest.fixture(autouse=True)
+def fast_polls(monkeypatch):
+    monkeypatch.setattr(watchdog, "BUILD_POLL_INTERVAL", 0.05)
+
+
+def _silent_stream(stopped):
+    yield "Step 1/2"
+    stopped.wait(5)
+    yield "Step 2/2"
+
+
+def test_silent_build_is_cancelled(state_dir, monkeypatch):
+    monkeypatch.setattr(Config, "BUILD_IDLE_TIMEOUT", 0.2)
+    stopped = threading.Event()
+
+    lines = []
+    with pytest.raises(BuildCancelled, match="without output"):
+        for line in watchdog.follow(_silent_stream(stopped), watchdog.BuildWatchdog("b1"), stopped.set):
+            lines.append(line)
+
+    assert lines == ["Step 1/2"]
+    assert stopped.is_set()
+
+
+def test_cancel_request_interrupts_the_build(state_dir):
+    stopped = threading.Event()
+    build = watchdog.BuildWatchdog("b1")
+
+    with pytest.raises(BuildCancelled, match="Build cancelled"):
+        for _ in watchdog.follow(_silent_stream(stopped), build, stopped.set):
+            watchdog.request_cancel("b1")
+
+    assert stopped.is_set()
+    watchdog.clear_cancel("b1")
+    build.check(force=True)
+
+
+def test_queued_build_is_dropped(state_dir):
+    queue_build("b1", "https://example.com/a.git", "myapp", "app-1", "git://example.com/a.git")
+    queue_build("b2", "https://example.com/a.git", "myapp", "app-1", "git://example.com/a.git")
+
+    assert cancel_build("app-1", "b1") == "cancelled"
+    assert [job["build_id"] for job in read_table(BUILD_QUEUE_TABLE, "app-1")] == ["b2"]
+    assert get_build_logs("app-1")["b1"]["status"] == "cancelled"
+
+    assert cancel_build("app-1", "b1") == "cancelled"
+    assert cancel_build("app-1", "missing") is None